@@ -1,11 +1,31 @@
 import os
 import re
+import sys
+import time
+import uuid
+from typing import Optional
+from PIL import Image
 import gradio as gr
 from dotenv import load_dotenv
 import google.genai
-from theme import get_theme
+from theme import get_theme, low_power_variables
 import logic
-import verifier
+import imaging
+import refine
+import pipeline
+import artifacts
+import jobqueue
+import state
+import metrics
+import export
+import lettering
+import concurrency
+import warmup
+import profiling
+import logs
+import terminal
+import webassets
+import history
 
 # Load environment variables
 load_dotenv()
@@ -20,21 +40,29 @@ IMG_BANNER = os.path.join(ASSETS_DIR, "ui_banner_hero.png")
 
 # --- Constants ---
 CHAPTERS = ["init", "ch1", "ch2", "ch3", "ch4", "ch5", "ch6", "epilogue"]
+# UI clicks and API calls share one queue group, so neither can starve the other
+GENERATION_CONCURRENCY = int(os.environ.get("GENERATION_CONCURRENCY", "4"))
+GENERATION_QUEUE = {"concurrency_id": "generation", "concurrency_limit": GENERATION_CONCURRENCY}
+# Gradio's own copies of served files: (check every N seconds, delete files older than M seconds)
+GRADIO_CACHE_CLEANUP = (
+    int(os.environ.get("GRADIO_CACHE_SWEEP_INTERVAL", "1800")),
+    int(os.environ.get("GRADIO_CACHE_TTL", str(artifacts.ARTIFACT_TTL))),
+)
+# Every API call stores its render under its own session ("api-<uuid>"), so callers
+# never evict each other's files; these are never pinned to a save file or exported
+API_SESSION_PREFIX = "api-"
+# Seconds one click (or API call) may spend across generation and verification together
+CLICK_DEADLINE = float(os.environ.get("CLICK_DEADLINE", "180"))
+# Durable mode: UI clicks are journaled and run by jobqueue workers instead of in this process
+USE_JOB_QUEUE = os.environ.get("JOB_QUEUE", "0") == "1"
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "0")) # worker processes to start alongside the UI
+job_queue = jobqueue.JobQueue() if USE_JOB_QUEUE else None
 
 # --- Handlers ---
 
 def format_log(message, type="info"):
-    """Formats a message as HTML with appropriate styling."""
-    colors = {
-        "info": "#0aff0a",     # Matrix Green
-        "success": "#0aff0a",  # Matrix Green
-        "warning": "#ffff00",  # Yellow
-        "error": "#ff2a2a"     # Alert Red
-    }
-    color = colors.get(type, "#0aff0a")
-    # Convert newlines to breaks for HTML
-    html_msg = message.replace("\n", "<br>")
-    return f"<div style='color: {color}; font-family: Share Tech Mono, monospace;'>{html_msg}</div>"
+    """Formats a message as one terminal entry (the terminal appends it; see terminal.py)."""
+    return terminal.format_entry(message, type)
 
 def run_diagnostics():
     api_key = os.environ.get("GOOGLE_API_KEY")
@@ -51,8 +79,12 @@ def run_diagnostics():
     if not re.match(r"^AIza[0-9A-Za-z-_]{35}$", api_key):
          return format_log("SYSTEM_CHECK: FAILED.\n> API Key: Format unrecognized (Must start with 'AIza').\n> Please verify your GOOGLE_API_KEY in .env", "error")
     
-    # 4. Success
-    return format_log("SYSTEM_CHECK: OPTIMAL.\n> Environment Variables: LOADED\n> API Key: DETECTED (Valid Format)", "success")
+    # 4. Success (plus what the boot warmup found, once it has run)
+    report = warmup.summary()
+    message = "SYSTEM_CHECK: OPTIMAL.\n> Environment Variables: LOADED\n> API Key: DETECTED (Valid Format)"
+    if report:
+        message += "\n" + report
+    return format_log(message, "success" if warmup.boot.ready or not report else "warning")
 
 CHAPTER_TITLES = {
     "init": "CHAPTER 0: THE SETUP",
@@ -91,84 +123,460 @@ def unlock_chapter(current_chapter, output_log):
         return gr.update(visible=False), gr.update(visible=True), update_footer(current_chapter)
     return gr.update(visible=True), gr.update(visible=False), gr.update() # No footer update if fail
 
+def unlock_refined(source_chapter, output_log):
+    """Unlocks the chapter after the refined one; every other gate is left untouched."""
+    gated = CHAPTERS[2:]
+    updates = [gr.update()] * (2 * len(gated) + 1)
+    if source_chapter not in CHAPTERS[1:-1]:
+        return updates
+    next_chapter = CHAPTERS[CHAPTERS.index(source_chapter) + 1]
+    lock, content, footer = unlock_chapter(next_chapter, output_log)
+    if not content.get("visible"):
+        return updates # Never re-lock a chapter because a refinement failed
+    i = gated.index(next_chapter)
+    updates[2 * i], updates[2 * i + 1], updates[-1] = lock, content, footer
+    return updates
+
+# --- Progress ---
+# Kept in the shared state tier under a per-browser learner id, so a reload or a
+# different replica restores the unlocked chapters.
+PROGRESS_TTL = int(os.environ.get("PROGRESS_TTL", str(30 * 24 * 3600)))
+GATED_CHAPTERS = CHAPTERS[1:]
+
+def load_progress(learner_id):
+    return (state.get_json(f"progress:{learner_id}") if learner_id else None) or "init"
+
+def record_progress(learner_id, chapter):
+    """Stores the furthest unlocked chapter; never moves a learner backwards."""
+    if not learner_id or chapter not in CHAPTERS:
+        return
+    if CHAPTERS.index(chapter) > CHAPTERS.index(load_progress(learner_id)):
+        state.set_json(f"progress:{learner_id}", chapter, PROGRESS_TTL)
+
+def restore_progress(learner_id):
+    """On page load: assigns a learner id if needed and re-opens every unlocked chapter."""
+    learner_id = learner_id or uuid.uuid4().hex
+    reached = CHAPTERS.index(load_progress(learner_id))
+    updates = [learner_id]
+    for chapter in GATED_CHAPTERS:
+        unlocked = CHAPTERS.index(chapter) <= reached
+        updates += [gr.update(visible=not unlocked), gr.update(visible=unlocked)]
+    updates.append(update_footer(CHAPTERS[reached]) if reached else gr.update())
+    return updates
+
+def save_panels(learner_id, session_id):
+    """Pins the session's latest verified panels to the learner's save file (see export.py)."""
+    if learner_id and session_id:
+        for artifact in artifacts.store.latest_verified(session_id).values():
+            artifacts.store.pin(learner_id, artifact)
+
+def advance(next_chapter, output_log, learner_id=None, request: gr.Request = None):
+    """unlock_chapter, plus recording the unlock and its panels for the learner."""
+    lock, content, footer = unlock_chapter(next_chapter, output_log)
+    if content.get("visible"):
+        record_progress(learner_id, next_chapter)
+        save_panels(learner_id, _session_id(request))
+    return lock, content, footer
+
+def advance_refined(source_chapter, output_log, learner_id=None, request: gr.Request = None):
+    updates = unlock_refined(source_chapter, output_log)
+    if source_chapter in CHAPTERS[1:-1] and updates[-1] != gr.update():
+        record_progress(learner_id, CHAPTERS[CHAPTERS.index(source_chapter) + 1])
+        save_panels(learner_id, _session_id(request))
+    return updates
+
 # Wrapper handlers to catch errors and provide hints
-def safe_handle(func, *args):
+ERROR_HINT = "\n\n> HINT: Check your logic.py implementation. Did you return the image object?"
+
+def safe_handle(func, *args, request=None):
+    # Profiles are named after the calling handler (see profiling.py for how requests are picked)
+    handler = sys._getframe(1).f_code.co_name
+    profile = profiling.begin(handler, request)
+    if profile:
+        profile.attach()
     try:
-        return func(*args)
+        with logs.bind(session_id=_session_id(request), handler=handler):
+            return func(*args)
+    except (concurrency.CircuitOpen, concurrency.DeadlineExceeded) as e:
+        return None, _no_image_log(str(e))
     except Exception as e:
-        msg = f"SYSTEM ERROR: Execution Failed.\n> Traceback: {str(e)}\n\n> HINT: Check your logic.py implementation. Did you return the image object?"
+        msg = f"SYSTEM ERROR: Execution Failed.\n> Traceback: {str(e)}" + ERROR_HINT
         return None, format_log(msg, "error")
+    finally:
+        if profile:
+            profile.detach()
+            profiling.save(profile.finish())
 
-def handle_ch1(prompt):
-    return safe_handle(lambda: _handle_ch1_logic(prompt))
+def safe_stream(func, *args, request=None):
+    """Like safe_handle, for handlers that yield several (image, log) updates."""
+    handler = sys._getframe(1).f_code.co_name
+    profile = profiling.begin(handler, request)
+    try:
+        updates = func(*args)
+        while True:
+            # Each resumption may run on a different worker thread (and context); the
+            # profile and the log fields follow it
+            if profile:
+                profile.attach()
+            try:
+                with logs.bind(session_id=_session_id(request), handler=handler):
+                    update = next(updates)
+            except StopIteration:
+                return
+            finally:
+                if profile:
+                    profile.detach()
+            handed_off = time.perf_counter()
+            yield update
+            if profile:
+                profile.stage("gradio_update", time.perf_counter() - handed_off) # Postprocess and send
+    except (concurrency.CircuitOpen, concurrency.DeadlineExceeded) as e:
+        yield None, _no_image_log(str(e))
+    except Exception as e:
+        msg = f"SYSTEM ERROR: Execution Failed.\n> Traceback: {str(e)}" + ERROR_HINT
+        yield None, format_log(msg, "error")
+    finally:
+        if profile:
+            profiling.save(profile.finish())
 
-def _handle_ch1_logic(prompt):
-    img = logic.generate_hero(prompt)
-    if not img: return None, format_log("ERROR: No image generated. Check code.", "error")
-    success, msg = verifier.verify_hero(img)
-    log_type = "success" if success else "error"
-    log = format_log(f"VERIFICATION: {'SUCCESS' if success else 'FAILURE'}\n> {msg}", log_type)
-    return img, log
+def _session_id(request):
+    return getattr(request, "session_hash", None) if request else None
 
-def handle_ch2(sign_text):
-    return safe_handle(lambda: _handle_ch2_logic(sign_text))
+def _remember_for_refinement(session_id, chapter, brief, artifact, reference=None):
+    """Seeds the session's refinement conversation with its latest render."""
+    if session_id:
+        refine.sessions.start(session_id, chapter, brief, artifact.id, reference)
 
-def _handle_ch2_logic(sign_text):
-    img = logic.generate_sign(sign_text)
-    if not img: return None, format_log("ERROR: No image generated.", "error")
-    success, msg = verifier.verify_sign_text(img, sign_text)
-    log_type = "success" if success else "error"
-    log = format_log(f"VERIFICATION: {'SUCCESS' if success else 'FAILURE'}\n> {msg}", log_type)
-    return img, log
+def _record_attempt(session_id, chapter, prompt, img, artifact, success, message=""):
+    """Adds the render to the session's history strip for the chapter."""
+    if session_id:
+        history.store.record(session_id, chapter, prompt, img, artifact, success, message)
 
-def handle_ch3(prompt):
-    return safe_handle(lambda: _handle_ch3_logic(prompt))
+def _no_image_log(message):
+    """A refused or timed-out model call is not the learner's bug; say so."""
+    if message and message != pipeline.NO_IMAGE:
+        return format_log(f"MODEL UNAVAILABLE: {message}\n> Your code is fine. Try again in a moment.", "warning")
+    return format_log("ERROR: No image generated. Check code.", "error")
 
-def _handle_ch3_logic(prompt):
-    img = logic.generate_wide_shot(prompt)
-    if not img: return None, format_log("ERROR: No image generated.", "error")
-    success, msg = verifier.verify_aspect_ratio(img)
-    log_type = "success" if success else "error"
-    log = format_log(f"VERIFICATION: {'SUCCESS' if success else 'FAILURE'}\n> {msg}", log_type)
-    return img, log
+def _handle_chapter(chapter, prompt, reference=None, session_id=None, local=False):
+    # Local rendering takes milliseconds, so it never goes through the job queue
+    if job_queue is not None and not local:
+        yield from _handle_chapter_queued(chapter, prompt, reference, session_id)
+        return
+    # One budget for the whole click. Each step enters it separately because a
+    # generator may resume on a different thread (and context) after every yield.
+    deadline = concurrency.Deadline(CLICK_DEADLINE)
+    with profiling.stage("generate"), concurrency.within(deadline):
+        result = pipeline.generate_chapter(chapter, prompt, reference, local)
+    if result.image is None:
+        yield None, _no_image_log(result.message)
+        return
+    # Large renders: show a few-KB preview now, the full file once it is verified and written
+    if imaging.needs_preview(result.image):
+        with profiling.stage("preview"):
+            preview = artifacts.store.put_preview(session_id, chapter, imaging.encode_preview(result.image))
+        yield preview, format_log(f"RENDER RECEIVED: {result.image.width}x{result.image.height}\n> Verifying...", "info")
+    with profiling.stage("verify"), concurrency.within(deadline):
+        pipeline.complete_chapter(result)
+    # The visualizer gets a file path; the decoded pixels live only in the bounded store
+    with profiling.stage("store"):
+        artifact = artifacts.store.put(session_id, chapter, result.image, verified=result.success)
+        _remember_for_refinement(session_id, chapter, prompt, artifact, result.reference)
+        _record_attempt(session_id, chapter, prompt, result.image, artifact, result.success, result.message)
+    log_type = "success" if result.success else "error"
+    log = format_log(f"VERIFICATION: {'SUCCESS' if result.success else 'FAILURE'}\n> {result.message}", log_type)
+    yield artifact.path, log
 
-def handle_ch4(prompt):
-     return safe_handle(lambda: _handle_ch4_logic(prompt))
+def _job_status(job):
+    if job.status == jobqueue.QUEUED:
+        retry = f" (retry {job.attempts + 1}/{job.max_attempts})" if job.attempts else ""
+        return format_log(f"JOB QUEUED{retry}: {job.position} ahead of you.", "info")
+    if job.stage == "verifying":
+        return format_log("RENDER RECEIVED\n> Verifying...", "info")
+    return format_log(f"JOB RUNNING: Generating (attempt {job.attempts}/{job.max_attempts})...", "info")
 
-def _handle_ch4_logic(prompt):
-    img = logic.generate_lit_scene(prompt)
-    if not img: return None, format_log("ERROR: No image generated.", "error")
-    success, msg = verifier.verify_lighting(img)
-    log_type = "success" if success else "error"
-    log = format_log(f"VERIFICATION: {'SUCCESS' if success else 'FAILURE'}\n> {msg}", log_type)
-    return img, log
+def _handle_chapter_queued(chapter, prompt, reference=None, session_id=None):
+    prepared = imaging.prepare_reference(reference) if chapter in pipeline.REFERENCE_CHAPTERS else None
+    job_id = job_queue.submit(chapter, prompt, prepared.data if prepared else None, session_id)
+    job = None
+    preview_sent = False # The preview is written and sent once, not on every "verifying" tick
+    # Bounded like a direct click: with no live worker the job would otherwise be watched forever
+    for job in job_queue.watch(job_id, timeout=CLICK_DEADLINE):
+        if job.finished:
+            break
+        preview = gr.update()
+        if job.preview_path and job.stage == "verifying" and not preview_sent:
+            with open(job.preview_path, "rb") as f:
+                preview = artifacts.store.put_preview(session_id, chapter, f.read())
+            preview_sent = True
+        yield preview, _job_status(job)
+    if job is not None and not job.finished:
+        status_text = "STILL QUEUED" if job.status == jobqueue.QUEUED else "STILL RUNNING"
+        yield gr.update(), format_log(f"JOB {status_text}: No result within {CLICK_DEADLINE:.0f}s (job id {job_id}).\n> Is a worker running? Try again in a moment.", "warning")
+        return
+    if job is None or job.status == jobqueue.FAILED:
+        error = job.error if job else "Job disappeared from the journal."
+        yield None, format_log(f"SYSTEM ERROR: Job failed.\n> {error}" + ERROR_HINT, "error")
+        return
+    if not job.image_path:
+        yield None, _no_image_log(job.message)
+        return
+    artifact = artifacts.store.put_file(session_id, chapter, job.image_path, verified=job.success)
+    img = artifacts.store.image(artifact.id)
+    _remember_for_refinement(session_id, chapter, prompt, artifact, prepared.as_part() if prepared else None)
+    _record_attempt(session_id, chapter, prompt, img, artifact, job.success, job.message)
+    log_type = "success" if job.success else "error"
+    yield artifact.path, format_log(f"VERIFICATION: {'SUCCESS' if job.success else 'FAILURE'}\n> {job.message}", log_type)
 
-def handle_ch5(prompt, ref_img):
-     return safe_handle(lambda: _handle_ch5_logic(prompt, ref_img))
+def handle_ch1(prompt, request: gr.Request = None):
+    yield from safe_stream(lambda: _handle_chapter("ch1", prompt, session_id=_session_id(request)), request=request)
 
-def _handle_ch5_logic(prompt, ref_img):
-    img = logic.generate_style_transfer(prompt, ref_img)
-    if not img: return None, format_log("ERROR: No image generated.", "error")
-    success, msg = verifier.verify_style(img)
-    log_type = "success" if success else "error"
-    log = format_log(f"VERIFICATION: {'SUCCESS' if success else 'FAILURE'}\n> {msg}", log_type)
-    return img, log
+def handle_ch2(sign_text, local_lettering=False, request: gr.Request = None):
+    yield from safe_stream(lambda: _handle_chapter("ch2", sign_text, session_id=_session_id(request), local=local_lettering), request=request)
+
+def handle_ch3(prompt, request: gr.Request = None):
+    yield from safe_stream(lambda: _handle_chapter("ch3", prompt, session_id=_session_id(request)), request=request)
+
+def handle_ch4(prompt, request: gr.Request = None):
+    yield from safe_stream(lambda: _handle_chapter("ch4", prompt, session_id=_session_id(request)), request=request)
+
+def prepare_reference(ref_img):
+    """Normalizes the chapter 5 reference once per upload so retries reuse the encoded bytes."""
+    return imaging.prepare_reference(ref_img)
+
+def handle_ch5(prompt, ref_img, ref_prepared=None, request: gr.Request = None):
+    reference = ref_prepared if ref_prepared is not None else ref_img
+    yield from safe_stream(lambda: _handle_chapter("ch5", prompt, reference, _session_id(request)), request=request)
+
+def _handle_draft(chapter, prompt, session_id=None):
+    with profiling.stage("generate"), concurrency.within(concurrency.Deadline(CLICK_DEADLINE)):
+        result = pipeline.draft_chapter(chapter, prompt)
+    if result.image is None:
+        return None, _no_image_log(result.message), None
+    # Drafts are stored unverified, so they never count as the chapter's save-file panel
+    with profiling.stage("store"):
+        artifact = artifacts.store.put(session_id, chapter, result.image, verified=False)
+        _record_attempt(session_id, chapter, f"[DRAFT] {prompt}", result.image, artifact, False, result.message)
+    size = f"{result.image.width}x{result.image.height}"
+    log = format_log(f"DRAFT RENDERED: {size} in {result.timings['generate']}s\n> {result.message}", "info")
+    return artifact.path, log, {"artifact": artifact.id, "prompt": prompt}
+
+def _accepted_draft(draft, prompt):
+    """The draft image to finalize, if it was rendered from this exact prompt and is still stored."""
+    if not draft or draft.get("prompt") != prompt:
+        return None
+    return artifacts.store.image(draft["artifact"])
+
+def handle_ch6_draft(prompt, request: gr.Request = None):
+    """Quick, unverified low-resolution render for iterating on the final prompt."""
+    outcome = safe_handle(lambda: _handle_draft("ch6", prompt, _session_id(request)), request=request)
+    return outcome if len(outcome) == 3 else (*outcome, None)
+
+def handle_ch6(prompt, draft=None, request: gr.Request = None):
+    """Finalizes: re-renders the accepted draft (or the prompt alone) at full resolution and verifies it."""
+    reference = _accepted_draft(draft, prompt)
+    yield from safe_stream(lambda: _handle_chapter("ch6", prompt, reference, _session_id(request)), request=request)
 
-def handle_ch6(prompt):
-    return safe_handle(lambda: _handle_ch6_logic(prompt))
+# --- Refinement ---
+def handle_refine(instruction, request: gr.Request = None):
+    """Edits the latest render through the session's chat instead of regenerating it."""
+    session = refine.sessions.get(_session_id(request))
+    if session is None:
+        return None, format_log("REFINE: No render to refine yet. Generate one first.", "warning"), None
+    if not instruction or not instruction.strip():
+        return gr.update(), format_log("REFINE: Describe the change (e.g. 'same, but add rain').", "warning"), None
+    img, log = safe_handle(lambda: _handle_refine_logic(session, instruction, _session_id(request)), request=request)
+    return img, log, session.chapter
 
-def _handle_ch6_logic(prompt):
-    img = logic.generate_final(prompt)
-    if not img: return None, format_log("ERROR: No image generated.", "error")
-    success, msg = verifier.verify_final(img)
+def _handle_refine_logic(session, instruction, session_id=None):
+    client = logic.get_client()
+    if not client: return None, format_log("ERROR: No client available. Check your API key.", "error")
+    with concurrency.within(concurrency.Deadline(CLICK_DEADLINE)):
+        try:
+            img = session.send(client, instruction.strip())
+        except refine.SeedExpired:
+            refine.sessions.discard(session_id)
+            return None, format_log("REFINE: Your render has expired from storage. Generate a new one.", "warning")
+        if not img: return None, format_log("ERROR: No refined image returned.", "error")
+        # Refined renders are held to the same check as the chapter that produced them
+        success, msg = pipeline.verify_chapter(session.chapter, img, session.brief)
+    artifact = artifacts.store.put(session_id, session.chapter, img, verified=success)
+    _record_attempt(session_id, session.chapter, f"[REFINE] {instruction.strip()}", img, artifact, success, msg)
     log_type = "success" if success else "error"
-    log = format_log(f"VERIFICATION: {'SUCCESS' if success else 'FAILURE'}\n> {msg}", log_type)
-    return img, log
+    log = format_log(f"REFINEMENT VERIFICATION: {'SUCCESS' if success else 'FAILURE'}\n> {msg}", log_type)
+    return artifact.path, log
+
+# --- History ---
+def show_history(chapter, request: gr.Request = None):
+    """The chapter's history strip, newest attempts first."""
+    if chapter not in pipeline.CHAPTER_STEPS:
+        return history.render(None, "")
+    return history.render(_session_id(request), chapter)
+
+def history_page(evt: gr.EventData, request: gr.Request = None):
+    return history.render(_session_id(request), evt.chapter, int(evt.page))
+
+def restore_attempt(evt: gr.EventData, request: gr.Request = None):
+    """Shows a past attempt from storage (no model call) and makes it the render to refine."""
+    session_id = _session_id(request)
+    attempt = history.store.get(session_id, evt.attempt)
+    if attempt is None:
+        return gr.update(), format_log("HISTORY: That attempt is no longer available.", "warning")
+    artifact = artifacts.store.get(attempt.artifact_id)
+    img = artifacts.store.image(attempt.artifact_id) if artifact else None
+    if img is None:
+        return gr.update(), format_log(f"HISTORY: Attempt #{attempt.number} has expired from storage.\n> Only its thumbnail is left.", "warning")
+    _remember_for_refinement(session_id, attempt.chapter, attempt.prompt, artifact)
+    verdict = "SUCCESS" if attempt.success else "FAILURE"
+    return artifact.path, format_log(f"RESTORED: Attempt #{attempt.number} ({verdict})\n> {attempt.prompt}", "info")
+
+def export_links(learner_id=None):
+    """Download links for the learner's save file (streamed by export.routes)."""
+    if not learner_id:
+        return ""
+    return (
+        "<div class='mission-instruction'>> SAVE FILE: "
+        f"<a href='export/{learner_id}.cbz' download>COMIC BOOK [.CBZ]</a> // "
+        f"<a href='export/{learner_id}.pdf' download>PRINT [.PDF]</a></div>"
+    )
+
+def server_options():
+    """launch() arguments shared by every entry point that serves the UI."""
+    routes = export.routes() + warmup.routes() + profiling.routes() + metrics.routes() + stylesheet.routes() + history.routes()
+    return {"allowed_paths": [ASSETS_DIR], "head": stylesheet.head(), "app_kwargs": {"routes": routes}}
+
+def release_session(request: gr.Request = None):
+    """Frees a closed tab's renders, refinement chat and history instead of waiting for the TTL sweep.
+
+    Panels already pinned to the learner's save file are kept.
+    """
+    session_id = _session_id(request)
+    if session_id:
+        artifacts.store.drop_session(session_id)
+        refine.sessions.discard(session_id)
+        history.store.discard(session_id)
+
+# --- API ---
+# One endpoint per chapter, registered with gr.api so calls go through the same
+# queue group as UI clicks. Every endpoint returns (image, result) where `image` is
+# a file served by this app (its URL is in the response) and `result` holds the
+# verdict and per-stage timings. See README "API" for sync and async usage.
+
+def _file_path(file):
+    return file.get("path") if isinstance(file, dict) else getattr(file, "path", None)
+
+def _api_session():
+    return f"{API_SESSION_PREFIX}{uuid.uuid4().hex}"
+
+def _api_run(chapter, prompt, reference=None, local=False):
+    start = time.perf_counter()
+    ref_img = None
+    if reference:
+        try:
+            with Image.open(_file_path(reference)) as src:
+                ref_img = src.copy()
+        except Exception as e: # Not an image, truncated, or no path at all
+            raise gr.Error(f"{chapter} failed: unreadable reference image ({e})")
+    try:
+        with concurrency.within(concurrency.Deadline(CLICK_DEADLINE)):
+            result = pipeline.run_chapter(chapter, prompt, ref_img, local)
+    except Exception as e:
+        raise gr.Error(f"{chapter} failed: {e}")
+
+    image = None
+    if result.image is not None:
+        # Gradio copies the file into its cache when serving it, so the capped store is enough here
+        artifact = artifacts.store.put(_api_session(), chapter, result.image, verified=result.success)
+        image = gr.FileData(path=artifact.path, mime_type="image/png")
+    payload = result.to_dict()
+    payload["timings"]["total"] = round(time.perf_counter() - start, 3)
+    return image, payload
+
+def _api_draft(chapter, prompt):
+    start = time.perf_counter()
+    try:
+        with concurrency.within(concurrency.Deadline(CLICK_DEADLINE)):
+            result = pipeline.draft_chapter(chapter, prompt)
+    except Exception as e:
+        raise gr.Error(f"{chapter} draft failed: {e}")
+    image = None
+    if result.image is not None:
+        artifact = artifacts.store.put(_api_session(), chapter, result.image, verified=False)
+        image = gr.FileData(path=artifact.path, mime_type="image/png")
+    payload = result.to_dict()
+    payload["timings"]["total"] = round(time.perf_counter() - start, 3)
+    return image, payload
+
+def api_ch1(prompt: str) -> tuple[Optional[gr.FileData], dict]:
+    """Chapter 1 (Ink & Fur): generates Unit 9 from the prompt and verifies the character.
+
+    Args:
+        prompt: Description of the protagonist.
+    Returns:
+        The rendered image (or null) and {chapter, prompt, success, message, timings, size}.
+    """
+    return _api_run("ch1", prompt)
+
+def api_ch2(sign_text: str, local_lettering: bool = False) -> tuple[Optional[gr.FileData], dict]:
+    """Chapter 2 (The Letterer): renders the alley sign with the given text and checks it is legible.
+
+    Args:
+        sign_text: Text the neon sign must read.
+        local_lettering: Composite the text onto a cached blank-sign plate instead of asking the model to spell it.
+    Returns:
+        The rendered image (or null) and {chapter, prompt, success, message, timings, size}.
+    """
+    return _api_run("ch2", sign_text, local=local_lettering)
+
+def api_ch3(prompt: str) -> tuple[Optional[gr.FileData], dict]:
+    """Chapter 3 (The Wide Angle): generates a wide shot and checks the 16:9 aspect ratio.
+
+    Args:
+        prompt: Scene description.
+    Returns:
+        The rendered image (or null) and {chapter, prompt, success, message, timings, size}.
+    """
+    return _api_run("ch3", prompt)
+
+def api_ch4(prompt: str) -> tuple[Optional[gr.FileData], dict]:
+    """Chapter 4 (Setting the Mood): generates a scene and checks for dramatic lighting.
+
+    Args:
+        prompt: Scene description including lighting keywords.
+    Returns:
+        The rendered image (or null) and {chapter, prompt, success, message, timings, size}.
+    """
+    return _api_run("ch4", prompt)
+
+def api_ch5(prompt: str, reference: Optional[gr.FileData] = None) -> tuple[Optional[gr.FileData], dict]:
+    """Chapter 5 (The Style Trap): restyles Unit 9 using an optional reference image and checks the style.
+
+    Args:
+        prompt: Target style, e.g. '1980s Anime Style'.
+        reference: Optional reference image; it is downscaled and encoded before upload.
+    Returns:
+        The rendered image (or null) and {chapter, prompt, success, message, timings, size}.
+    """
+    return _api_run("ch5", prompt, reference)
+
+def api_ch6(prompt: str, draft: bool = False, reference: Optional[gr.FileData] = None) -> tuple[Optional[gr.FileData], dict]:
+    """Chapter 6 (The Masterpiece): generates the final high-resolution render and checks its quality.
+
+    Args:
+        prompt: Final panel description.
+        draft: Return a quick low-resolution draft instead; drafts are not verified.
+        reference: An accepted draft to re-render at full resolution.
+    Returns:
+        The rendered image (or null) and {chapter, prompt, success, message, timings, size}.
+    """
+    if draft:
+        return _api_draft("ch6", prompt)
+    return _api_run("ch6", prompt, reference)
+
+API_ENDPOINTS = {"ch1": api_ch1, "ch2": api_ch2, "ch3": api_ch3, "ch4": api_ch4, "ch5": api_ch5, "ch6": api_ch6}
 
 # --- UI Builder ---
 APP_CSS = """
-@import url('https://fonts.googleapis.com/css2?family=Share+Tech+Mono&display=swap');
-
 /* Main Container - Digital Noir Background */
 .gradio-container {
     background-color: #020202 !important;
@@ -270,6 +678,56 @@ APP_CSS = """
     overflow-y: auto;
 }
 
+/* Attempt History Strip - thumbnails under the visualizer */
+.history-strip {
+    display: flex;
+    flex-direction: column;
+    gap: 6px;
+    font-family: 'Share Tech Mono', monospace;
+}
+
+.history-items {
+    display: flex;
+    gap: 8px;
+    overflow-x: auto;
+}
+
+.history-item {
+    flex: 0 0 auto;
+    width: 96px;
+    padding: 0;
+    background: #050505;
+    border: 1px solid #333;
+    cursor: pointer;
+}
+
+.history-item img {
+    display: block;
+    width: 96px;
+    height: 64px;
+    object-fit: cover;
+}
+
+.history-pass { border-color: #0aff0a; }
+.history-fail { border-color: #ff2a2a; }
+
+.history-label, .history-pager, .history-empty {
+    color: #808080;
+    font-size: 12px;
+}
+
+.history-pager button {
+    color: #00f3ff;
+    background: none;
+    border: none;
+    cursor: pointer;
+}
+
+.history-pager button:disabled {
+    color: #333;
+    cursor: default;
+}
+
 /* Footer styling - Fixed Bottom Bar look */
 #footer-status {
     background-color: #0d0d0d !important;
@@ -360,10 +818,56 @@ APP_CSS = """
 }
 """
 
-with gr.Blocks(title="Gemini Comic Creator - Reality Engine", theme=get_theme(), css=APP_CSS) as app:
+# --- Low-power mode ---
+# The same look at rest without the effects that keep the compositor busy on cheap
+# laptops: the full-viewport scanline layer (drawn into the background instead), the
+# backdrop blur (the panels are 95% opaque anyway), the pulsing locks (held at their
+# mid glow), the fixed background and transitions. On automatically for
+# prefers-reduced-motion, or with the LOW POWER toggle, which also opts back out.
+LOW_POWER_CSS = """
+.scanlines { display: none; }
+.gradio-container {
+    background-image:
+        linear-gradient(to bottom, rgba(0,0,0,0) 50%, rgba(0,0,0,0.04) 50%),
+        linear-gradient(rgba(0,0,0,0.85), rgba(0,0,0,0.95)),
+        url('file=assets/ui_background.png');
+    background-size: 100% 4px, cover, cover;
+    background-attachment: scroll;
+}
+.glass-panel { backdrop-filter: none; }
+.access-denied { animation: none; box-shadow: 0 0 10px rgba(255, 42, 42, 0.35); }
+.tab-nav button { transition: none; }
+.locked-d { filter: grayscale(100%) opacity(0.3); }
+"""
+LOW_POWER_STORAGE_KEY = "comic_creator_low_power"
+
+def low_power_css():
+    variables = low_power_variables()
+    forced = f"html.low-power {{ {variables} }}" + webassets.scope_css(LOW_POWER_CSS, "html.low-power")
+    automatic = f"html:not(.full-effects) {{ {variables} }}" + webassets.scope_css(LOW_POWER_CSS, "html:not(.full-effects)")
+    return forced + "@media (prefers-reduced-motion: reduce) {" + automatic + "}"
+
+# Client-side only: the toggle never waits on the server
+LOW_POWER_APPLY_JS = """(on) => {
+    document.documentElement.classList.toggle('low-power', on);
+    document.documentElement.classList.toggle('full-effects', !on);
+}"""
+LOW_POWER_SAVE_JS = f"(on) => {{ localStorage.setItem('{LOW_POWER_STORAGE_KEY}', on ? '1' : '0'); }}"
+LOW_POWER_LOAD_JS = f"""() => {{
+    const saved = localStorage.getItem('{LOW_POWER_STORAGE_KEY}');
+    const on = saved === null ? window.matchMedia('(prefers-reduced-motion: reduce)').matches : saved === '1';
+    ({LOW_POWER_APPLY_JS})(on); // Also when the box is already in that state (no change event)
+    return on;
+}}"""
+
+# Served minified from a hashed URL with the self-hosted font (see webassets.py), not inlined
+stylesheet = webassets.Stylesheet(APP_CSS + low_power_css())
+
+with gr.Blocks(title="Gemini Comic Creator - Reality Engine", theme=get_theme(), delete_cache=GRADIO_CACHE_CLEANUP) as app:
     
     # State mechanism
     current_chapter_state = gr.State("init")
+    learner_id = gr.BrowserState(None, storage_key="comic_creator_learner")
     
     # Scanline Overlay (Div hack)
     gr.HTML("<div class='scanlines'></div>")
@@ -387,6 +891,7 @@ with gr.Blocks(title="Gemini Comic Creator - Reality Engine", theme=get_theme(),
                      gr.Markdown("*Identity verified. Welcome, Artist.*")
                      gr.Markdown("Initializing connection to Neural Link...")
                      check_btn = gr.Button("RUN DIAGNOSTICS [EXECUTE]", variant="primary")
+                     low_power = gr.Checkbox(label="LOW POWER (reduced effects for slower machines)", value=False)
                 
                 # --- CH 1 ---
                 with gr.Tab("CH 1", id="ch1", interactive=True) as tab1:
@@ -408,6 +913,8 @@ with gr.Blocks(title="Gemini Comic Creator - Reality Engine", theme=get_theme(),
                         gr.HTML("<div class='mission-header'><h3>> MISSION: THE SILENT SIGN</h3></div>")
                         gr.HTML("<div class='mission-instruction'>The sign is blank. Use the prompt to LETTER the sign.</div>")
                         p2 = gr.Textbox(label="SIGN TEXT", placeholder="THE TERMINAL", lines=1)
+                        # Letters the text onto a cached blank sign locally; only the first run calls the model
+                        local2 = gr.Checkbox(label="LOCAL LETTERING [INSTANT]", value=lettering.LETTERING_MODE == "local")
                         b2 = gr.Button("GENERATE [EXECUTE]", variant="primary")
 
                 # --- CH 3 ---
@@ -440,6 +947,7 @@ with gr.Blocks(title="Gemini Comic Creator - Reality Engine", theme=get_theme(),
                         p5 = gr.Textbox(label="STYLE PROMPT", placeholder="1980s Anime Style...", lines=2)
                         # We might need a ref image input or assume fixed ref
                         ref5 = gr.Image(label="REFERENCE SOURCE", type="pil", height=150) 
+                        ref5_prepared = gr.State(None)
                         b5 = gr.Button("GENERATE [EXECUTE]", variant="primary")
 
                 # --- CH 6 ---
@@ -448,9 +956,12 @@ with gr.Blocks(title="Gemini Comic Creator - Reality Engine", theme=get_theme(),
                         gr.HTML("<div class='access-denied'><h3>🔒 ACCESS DENIED // COMPLETE CH 5</h3></div>")
                      with gr.Group(visible=False) as content6:
                         gr.HTML("<div class='mission-header'><h3>> MISSION: UPSCALING / FINAL</h3></div>")
-                        gr.HTML("<div class='mission-instruction'>Stabilize the Construct. Generate the final 4K masterpiece.</div>")
+                        gr.HTML("<div class='mission-instruction'>Stabilize the Construct. Draft fast until the composition holds, then finalize the 4K masterpiece.</div>")
                         p6 = gr.Textbox(label="INPUT PROMPT", placeholder="Masterpiece, 8k resolution...", lines=2)
-                        b6 = gr.Button("GENERATE [EXECUTE]", variant="primary")
+                        draft6 = gr.State(None) # {"artifact", "prompt"} of the latest draft
+                        with gr.Row():
+                            d6 = gr.Button("DRAFT [FAST]", variant="secondary")
+                            b6 = gr.Button("FINALIZE [4K]", variant="primary")
 
                 # --- EPILOGUE ---
                 with gr.Tab("END", id="epilogue", interactive=True) as tabEnd:
@@ -459,22 +970,34 @@ with gr.Blocks(title="Gemini Comic Creator - Reality Engine", theme=get_theme(),
                      with gr.Group(visible=False) as contentEnd:
                         gr.HTML("<div class='mission-header'><h1>> MISSION ACCOMPLISHED</h1></div>")
                         gr.Markdown("The comic is complete. The Construct is stable. Well done, Artist.")
+                        save_links = gr.HTML()
             
             # --- TERMINAL LOG (Global for Left Column) ---
             gr.Markdown("### > SYSTEM LOG")
-            # Changed from Textbox to HTML for strict styling support (Red/Green)
-            terminal_log = gr.HTML(label="OUTPUT STREAM", elem_classes=["terminal-log-box"])
+            # Append-only: each update carries just the new entry (see terminal.py)
+            terminal_log = terminal.component(label="OUTPUT STREAM", elem_classes=["terminal-log-box"])
 
         # === RIGHT COLUMN: VISUALIZER ===
         with gr.Column(scale=2, elem_classes=["glass-panel"]):
             gr.Markdown("### > VISUAL FEED")
             # Removed fixed height, added class for CSS control
             visualizer = gr.Image(label="RENDER OUTPUT", interactive=False, elem_id="main-visualizer", elem_classes=["main-visualizer"])
+            # Follow-up edits go through a per-session chat, so only the instruction is sent
+            with gr.Row():
+                refine_box = gr.Textbox(label="REFINE LAST RENDER", placeholder="Same, but add rain...", lines=1, scale=4)
+                refine_btn = gr.Button("REFINE [EXECUTE]", variant="secondary", scale=1)
+            refine_source = gr.State(None)
+            # Past attempts for the current chapter; clicking one restores it (see history.py)
+            history_strip = history.component(label="ATTEMPT HISTORY", elem_classes=["history-box"])
 
 
     # --- Footer ---
     footer = gr.Markdown("SYSTEM STATUS: 0% [....................] // CURRENT PHASE: CHAPTER 0: THE SETUP", elem_id="footer-status")
 
+    # --- API ---
+    for api_name, endpoint in API_ENDPOINTS.items():
+        gr.api(endpoint, api_name=api_name, **GENERATION_QUEUE)
+
     # --- WIRING ---
     
     # Helper to update footer on unlock
@@ -483,44 +1006,82 @@ with gr.Blocks(title="Gemini Comic Creator - Reality Engine", theme=get_theme(),
 
     # Init -> Check -> Unlock Ch1
     check_btn.click(run_diagnostics, outputs=terminal_log).then(
-        unlock_chapter, 
-        inputs=[gr.State("ch1"), terminal_log], 
+        advance, 
+        inputs=[gr.State("ch1"), terminal_log, learner_id], 
         outputs=[lock1, content1, footer]
     )
     
     # Ch1 -> Generate -> Verify -> Unlock Ch2
-    b1.click(handle_ch1, inputs=p1, outputs=[visualizer, terminal_log]).then(
-        unlock_chapter, inputs=[gr.State("ch2"), terminal_log], outputs=[lock2, content2, footer]
-    )
+    b1.click(handle_ch1, inputs=p1, outputs=[visualizer, terminal_log], **GENERATION_QUEUE).then(
+        advance, inputs=[gr.State("ch2"), terminal_log, learner_id], outputs=[lock2, content2, footer]
+    ).then(show_history, inputs=gr.State("ch1"), outputs=history_strip)
 
     # Ch2 -> Generate -> Verify -> Unlock Ch3
-    b2.click(handle_ch2, inputs=p2, outputs=[visualizer, terminal_log]).then(
-        unlock_chapter, inputs=[gr.State("ch3"), terminal_log], outputs=[lock3, content3, footer]
-    )
+    b2.click(handle_ch2, inputs=[p2, local2], outputs=[visualizer, terminal_log], **GENERATION_QUEUE).then(
+        advance, inputs=[gr.State("ch3"), terminal_log, learner_id], outputs=[lock3, content3, footer]
+    ).then(show_history, inputs=gr.State("ch2"), outputs=history_strip)
 
     # Ch3 -> Generate -> Verify -> Unlock Ch4
-    b3.click(handle_ch3, inputs=p3, outputs=[visualizer, terminal_log]).then(
-        unlock_chapter, inputs=[gr.State("ch4"), terminal_log], outputs=[lock4, content4, footer]
-    )
+    b3.click(handle_ch3, inputs=p3, outputs=[visualizer, terminal_log], **GENERATION_QUEUE).then(
+        advance, inputs=[gr.State("ch4"), terminal_log, learner_id], outputs=[lock4, content4, footer]
+    ).then(show_history, inputs=gr.State("ch3"), outputs=history_strip)
 
     # Ch4 -> Generate -> Verify -> Unlock Ch5
-    b4.click(handle_ch4, inputs=p4, outputs=[visualizer, terminal_log]).then(
-        unlock_chapter, inputs=[gr.State("ch5"), terminal_log], outputs=[lock5, content5, footer]
-    )
+    b4.click(handle_ch4, inputs=p4, outputs=[visualizer, terminal_log], **GENERATION_QUEUE).then(
+        advance, inputs=[gr.State("ch5"), terminal_log, learner_id], outputs=[lock5, content5, footer]
+    ).then(show_history, inputs=gr.State("ch4"), outputs=history_strip)
 
     # Ch5 -> Generate -> Verify -> Unlock Ch6
-    b5.click(handle_ch5, inputs=[p5, ref5], outputs=[visualizer, terminal_log]).then(
-        unlock_chapter, inputs=[gr.State("ch6"), terminal_log], outputs=[lock6, content6, footer]
-    )
+    # The reference is downscaled/encoded once per upload, not on every attempt
+    ref5.upload(prepare_reference, inputs=ref5, outputs=ref5_prepared)
+    ref5.clear(lambda: None, outputs=ref5_prepared)
+    b5.click(handle_ch5, inputs=[p5, ref5, ref5_prepared], outputs=[visualizer, terminal_log], **GENERATION_QUEUE).then(
+        advance, inputs=[gr.State("ch6"), terminal_log, learner_id], outputs=[lock6, content6, footer]
+    ).then(show_history, inputs=gr.State("ch5"), outputs=history_strip)
 
-    # Ch6 -> Generate -> Verify -> Unlock Epilogue
-    b6.click(handle_ch6, inputs=p6, outputs=[visualizer, terminal_log]).then(
-        unlock_chapter, inputs=[gr.State("epilogue"), terminal_log], outputs=[lockEnd, contentEnd, footer]
+    # Ch6 -> Draft (unverified) ... -> Finalize -> Verify -> Unlock Epilogue
+    d6.click(handle_ch6_draft, inputs=p6, outputs=[visualizer, terminal_log, draft6], **GENERATION_QUEUE).then(
+        show_history, inputs=gr.State("ch6"), outputs=history_strip
     )
+    b6.click(handle_ch6, inputs=[p6, draft6], outputs=[visualizer, terminal_log], **GENERATION_QUEUE).then(
+        advance, inputs=[gr.State("epilogue"), terminal_log, learner_id], outputs=[lockEnd, contentEnd, footer]
+    ).then(show_history, inputs=gr.State("ch6"), outputs=history_strip)
+
+    # Refine -> Edit in chat -> Verify -> Unlock the chapter after the refined one
+    refine_btn.click(handle_refine, inputs=refine_box, outputs=[visualizer, terminal_log, refine_source], **GENERATION_QUEUE).then(
+        advance_refined,
+        inputs=[refine_source, terminal_log, learner_id],
+        outputs=[lock2, content2, lock3, content3, lock4, content4, lock5, content5, lock6, content6, lockEnd, contentEnd, footer]
+    ).then(show_history, inputs=refine_source, outputs=history_strip)
+
+    # History strip: follows the open tab; restoring reads the stored artifact, paging sends one page of thumbnails
+    for tab, chapter in [(tab0, "init"), (tab1, "ch1"), (tab2, "ch2"), (tab3, "ch3"), (tab4, "ch4"), (tab5, "ch5"), (tab6, "ch6"), (tabEnd, "epilogue")]:
+        tab.select(show_history, inputs=gr.State(chapter), outputs=history_strip)
+    history_strip.restore(restore_attempt, outputs=[visualizer, terminal_log])
+    history_strip.turn_page(history_page, outputs=history_strip)
+
+    # Reloading (or landing on another replica) restores the learner's unlocked chapters
+    app.load(
+        restore_progress,
+        inputs=learner_id,
+        outputs=[learner_id, lock1, content1, lock2, content2, lock3, content3, lock4, content4, lock5, content5, lock6, content6, lockEnd, contentEnd, footer]
+    ).then(export_links, inputs=learner_id, outputs=save_links) # The save file follows the learner id
+
+    # Low-power mode: the saved choice, else the OS reduced-motion setting; only a click saves it
+    app.load(None, outputs=low_power, js=LOW_POWER_LOAD_JS)
+    low_power.change(None, inputs=low_power, js=LOW_POWER_APPLY_JS)
+    low_power.input(None, inputs=low_power, js=LOW_POWER_SAVE_JS)
+
+    # Closing the tab releases its renders
+    app.unload(release_session)
 
 if __name__ == "__main__":
+    logs.setup()
+    warmup.start()
+    if USE_JOB_QUEUE and JOB_WORKERS > 0:
+        jobqueue.start_workers(JOB_WORKERS)
     app.launch(
         server_name="0.0.0.0", 
         server_port=8000, 
-        allowed_paths=[ASSETS_DIR]
+        **server_options()
     )
@@ -0,0 +1,428 @@
+import io
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+from PIL import Image
+import metrics
+
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+ARTIFACT_DIR = os.environ.get("ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "comic_creator_artifacts"))
+# Decoded pixel buffers kept in memory across all sessions; older ones are dropped
+# and re-decoded from disk on demand.
+IMAGE_MEMORY_BUDGET = int(float(os.environ.get("IMAGE_MEMORY_BUDGET_MB", "512")) * 1024 * 1024)
+# Artifacts retained per session. The latest verified render of each chapter is
+# kept regardless, so the session can still be exported.
+SESSION_ARTIFACT_CAP = int(os.environ.get("SESSION_ARTIFACT_CAP", "12"))
+ARTIFACT_TTL = int(os.environ.get("ARTIFACT_TTL", str(6 * 3600))) # seconds
+SWEEP_INTERVAL = int(os.environ.get("ARTIFACT_SWEEP_INTERVAL", "600")) # seconds, 0 = never
+# A render whose encoded file is byte-identical to one the session already stored
+# shares that file on disk (a hard link). It is still a separate artifact.
+ARTIFACT_DEDUPE = os.environ.get("ARTIFACT_DEDUPE", "1") == "1"
+# Save files: each learner's latest verified panel per chapter, pinned under their
+# learner id (not the tab's session), so they survive reloads and closed tabs.
+SAVE_TTL = int(os.environ.get("SAVE_TTL", str(30 * 24 * 3600))) # seconds since the last pin
+SAVES_DIR = "saves"
+
+
+def pixel_bytes(image: Image.Image) -> int:
+    """Approximate memory held by a decoded image."""
+    return image.width * image.height * len(image.getbands())
+
+
+class Artifact:
+    """An image written to disk once, owned by a session."""
+
+    def __init__(self, artifact_id, session_id, chapter, path, size, file_bytes, digest, verified=False):
+        self.id = artifact_id
+        self.session_id = session_id
+        self.chapter = chapter
+        self.path = path
+        self.size = size
+        self.file_bytes = file_bytes
+        self.digest = digest
+        self.verified = verified
+        self.created = time.time()
+
+
+class ImageCache:
+    """LRU of decoded images bounded by total pixel bytes."""
+
+    def __init__(self, budget: int = IMAGE_MEMORY_BUDGET):
+        self.budget = budget
+        self._items: "OrderedDict[str, Image.Image]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def bytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, key: str, image: Image.Image):
+        cost = pixel_bytes(image)
+        with self._lock:
+            self._remove(key)
+            if cost > self.budget:
+                return # Never let one huge frame flush everything else
+            self._items[key] = image
+            self._bytes += cost
+            while self._bytes > self.budget:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= pixel_bytes(evicted)
+                metrics.inc("image_cache_evictions_total")
+        metrics.set_gauge("image_memory_bytes", self._bytes)
+
+    def get(self, key: str) -> Optional[Image.Image]:
+        with self._lock:
+            image = self._items.get(key)
+            if image is not None:
+                self._items.move_to_end(key)
+            return image
+
+    def discard(self, key: str):
+        with self._lock:
+            self._remove(key)
+        metrics.set_gauge("image_memory_bytes", self._bytes)
+
+    def _remove(self, key):
+        image = self._items.pop(key, None)
+        if image is not None:
+            self._bytes -= pixel_bytes(image)
+
+
+class ArtifactStore:
+    """Session-scoped image artifacts: encoded once to disk, decoded copies cached under a budget."""
+
+    def __init__(self, root: str = ARTIFACT_DIR, budget: int = IMAGE_MEMORY_BUDGET,
+                 session_cap: int = SESSION_ARTIFACT_CAP, ttl: int = ARTIFACT_TTL, sweep_interval: int = SWEEP_INTERVAL,
+                 dedupe: bool = ARTIFACT_DEDUPE, save_ttl: int = SAVE_TTL):
+        self.root = root
+        self.save_ttl = save_ttl
+        self.dedupe = dedupe
+        self.session_cap = session_cap
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.cache = ImageCache(budget)
+        self._artifacts: dict[str, Artifact] = {}
+        self._sessions: dict[str, list[str]] = {}
+        self._previews: dict[str, str] = {} # session -> path of its latest preview
+        self._thumbnails: set[str] = set() # paths written by put_thumbnail, removed by their owner
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+    # --- Writing ---
+
+    def put(self, session_id: str, chapter: str, image: Image.Image, verified: bool = False) -> Artifact:
+        """Writes the image to disk and registers it with the session, enforcing the session cap.
+
+        If the session already stored the same bytes, the new artifact shares that file instead of writing a copy.
+        """
+        # Fast PNG: lossless, and encoding a 4K frame at level 1 is several times quicker than the default
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", compress_level=1)
+        data = buffer.getvalue()
+        digest = hashlib.sha256(data).hexdigest()
+        artifact_id = uuid.uuid4().hex
+        path = self._path(session_id, chapter, artifact_id)
+        same = self._same_bytes(session_id or "anonymous", digest) if self.dedupe else None
+        if same is not None and _link(same.path, path):
+            metrics.inc("artifact_dedupe_total")
+        else:
+            with open(path, "wb") as f:
+                f.write(data)
+        artifact = self._register(artifact_id, session_id, chapter, path, image.size, verified, digest)
+        self.cache.put(artifact_id, image)
+        return artifact
+
+    def _same_bytes(self, session_id, digest):
+        with self._lock:
+            for artifact_id in reversed(self._sessions.get(session_id, [])):
+                if self._artifacts[artifact_id].digest == digest:
+                    return self._artifacts[artifact_id]
+        return None
+
+    def put_file(self, session_id: str, chapter: str, source: str, verified: bool = False) -> Artifact:
+        """Adopts an already-encoded image file (e.g. written by a worker) without decoding it."""
+        artifact_id = uuid.uuid4().hex
+        path = self._path(session_id, chapter, artifact_id, os.path.splitext(source)[1] or ".png")
+        shutil.move(source, path)
+        with Image.open(path) as f:
+            size = f.size # Header only
+        return self._register(artifact_id, session_id, chapter, path, size, verified)
+
+    def _directory(self, session_id):
+        directory = os.path.join(self.root, _safe(session_id or "anonymous"))
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def _path(self, session_id, chapter, artifact_id, ext=".png"):
+        return os.path.join(self._directory(session_id), f"{chapter}-{artifact_id}{ext}")
+
+    def _register(self, artifact_id, session_id, chapter, path, size, verified, digest=None):
+        session_id = session_id or "anonymous"
+        if digest is None:
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        artifact = Artifact(artifact_id, session_id, chapter, path, size, os.path.getsize(path), digest, verified)
+
+        with self._lock:
+            self._artifacts[artifact_id] = artifact
+            self._sessions.setdefault(session_id, []).append(artifact_id)
+            evicted = self._enforce_cap(session_id)
+        for old in evicted:
+            self._delete(old)
+        self._update_gauges()
+        self._ensure_sweeper()
+        return artifact
+
+    def put_preview(self, session_id: str, chapter: str, data: bytes) -> str:
+        """Writes an encoded preview; each session keeps only its latest one."""
+        session_id = session_id or "anonymous"
+        path = self._path(session_id, chapter, f"preview-{uuid.uuid4().hex}", ".jpg")
+        with open(path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            previous = self._previews.get(session_id)
+            self._previews[session_id] = path
+        if previous:
+            _remove_file(previous)
+        return path
+
+    def put_thumbnail(self, session_id: str, name: str, data: bytes) -> str:
+        """Writes a small encoded image that may outlive the session's artifacts (e.g. a history thumbnail).
+
+        The sweep leaves it alone; its owner deletes it with remove_thumbnail.
+        """
+        path = os.path.join(self._directory(session_id), name)
+        with open(path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            self._thumbnails.add(path)
+        return path
+
+    def remove_thumbnail(self, path: str):
+        with self._lock:
+            self._thumbnails.discard(path)
+        _remove_file(path)
+
+    def mark_verified(self, artifact_id: str, verified: bool = True):
+        with self._lock:
+            artifact = self._artifacts.get(artifact_id)
+            if artifact is not None:
+                artifact.verified = verified
+
+    # --- Reading ---
+
+    def get(self, artifact_id: str) -> Optional[Artifact]:
+        with self._lock:
+            return self._artifacts.get(artifact_id)
+
+    def image(self, artifact_id: str) -> Optional[Image.Image]:
+        """Returns the decoded image, re-reading it from disk if it was evicted from memory."""
+        image = self.cache.get(artifact_id)
+        if image is not None:
+            metrics.inc("image_cache_hits_total")
+            return image
+        artifact = self.get(artifact_id)
+        if artifact is None or not os.path.exists(artifact.path):
+            return None
+        metrics.inc("image_cache_misses_total")
+        with Image.open(artifact.path) as f:
+            image = f.copy()
+        self.cache.put(artifact_id, image)
+        return image
+
+    def session_artifacts(self, session_id: str) -> list[Artifact]:
+        with self._lock:
+            return [self._artifacts[a] for a in self._sessions.get(session_id, []) if a in self._artifacts]
+
+    def session_ids(self) -> list[str]:
+        with self._lock:
+            return list(self._sessions)
+
+    def latest_verified(self, session_id: str) -> dict[str, Artifact]:
+        """The most recent verified artifact per chapter for a session."""
+        latest = {}
+        for artifact in self.session_artifacts(session_id):
+            if artifact.verified:
+                latest[artifact.chapter] = artifact
+        return latest
+
+    # --- Save files ---
+
+    def _save_directory(self, owner_id):
+        return os.path.join(self.root, SAVES_DIR, _safe(owner_id))
+
+    def pin(self, owner_id: str, artifact: Artifact) -> str:
+        """Makes the artifact the owner's saved panel for its chapter (a hard link, else a copy)."""
+        directory = self._save_directory(owner_id)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, artifact.chapter + os.path.splitext(artifact.path)[1])
+        staging = os.path.join(directory, f".{uuid.uuid4().hex}.tmp")
+        if not _link(artifact.path, staging):
+            shutil.copyfile(artifact.path, staging)
+        os.replace(staging, path)
+        os.utime(path) # SAVE_TTL counts from the last pin
+        for name in os.listdir(directory):
+            if os.path.splitext(name)[0] == artifact.chapter and os.path.join(directory, name) != path:
+                _remove_file(os.path.join(directory, name))
+        return path
+
+    def pinned(self, owner_id: str) -> dict[str, str]:
+        """{chapter: path} of the owner's saved panels."""
+        directory = self._save_directory(owner_id)
+        if not os.path.isdir(directory):
+            return {}
+        return {os.path.splitext(name)[0]: os.path.join(directory, name)
+                for name in sorted(os.listdir(directory)) if not name.startswith(".")}
+
+    def save_owners(self) -> list[str]:
+        directory = os.path.join(self.root, SAVES_DIR)
+        return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+    # --- Eviction ---
+
+    def _pinned(self, session_id):
+        pinned = {}
+        for artifact_id in self._sessions.get(session_id, []):
+            artifact = self._artifacts[artifact_id]
+            if artifact.verified:
+                pinned[artifact.chapter] = artifact_id
+        return set(pinned.values())
+
+    def _enforce_cap(self, session_id):
+        ids = self._sessions.get(session_id, [])
+        evicted = []
+        if len(ids) <= self.session_cap:
+            return evicted
+        pinned = self._pinned(session_id)
+        for artifact_id in list(ids):
+            if len(ids) <= self.session_cap:
+                break
+            if artifact_id in pinned:
+                continue
+            ids.remove(artifact_id)
+            evicted.append(self._artifacts.pop(artifact_id))
+        return evicted
+
+    def _delete(self, artifact: Artifact):
+        self.cache.discard(artifact.id)
+        _remove_file(artifact.path)
+
+    def drop_session(self, session_id: str):
+        """Forgets every artifact of a session and deletes its files."""
+        with self._lock:
+            ids = self._sessions.pop(session_id, [])
+            evicted = [self._artifacts.pop(a) for a in ids if a in self._artifacts]
+            preview = self._previews.pop(session_id, None)
+        for artifact in evicted:
+            self._delete(artifact)
+        if preview:
+            _remove_file(preview)
+        self._update_gauges()
+
+    def sweep(self, max_age: int = None) -> int:
+        """Deletes artifacts older than max_age (default: the store TTL). Returns how many."""
+        cutoff = time.time() - (self.ttl if max_age is None else max_age)
+        with self._lock:
+            expired = [a for a in self._artifacts.values() if a.created < cutoff]
+            for artifact in expired:
+                del self._artifacts[artifact.id]
+                ids = self._sessions.get(artifact.session_id, [])
+                if artifact.id in ids:
+                    ids.remove(artifact.id)
+                if not ids:
+                    self._sessions.pop(artifact.session_id, None)
+        for artifact in expired:
+            self._delete(artifact)
+        # Files left behind by a previous process. Known files go by their artifact's age
+        # (a shared file keeps its first writer's mtime) or their owner, never by mtime.
+        # Save files go SAVE_TTL after their last pin.
+        with self._lock:
+            known = {a.path for a in self._artifacts.values()} | set(self._previews.values()) | self._thumbnails
+        saves = os.path.join(self.root, SAVES_DIR) + os.sep
+        save_cutoff = time.time() - self.save_ttl
+        if os.path.isdir(self.root):
+            for dirpath, _, filenames in os.walk(self.root):
+                limit = save_cutoff if (dirpath + os.sep).startswith(saves) else cutoff
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    if path in known:
+                        continue
+                    try:
+                        if os.path.getmtime(path) < limit:
+                            os.remove(path)
+                    except OSError:
+                        pass
+        self._update_gauges()
+        return len(expired)
+
+    def _ensure_sweeper(self):
+        if self._sweeper is not None or self.sweep_interval <= 0:
+            return
+        def loop():
+            while True:
+                time.sleep(self.sweep_interval)
+                try:
+                    self.sweep()
+                except Exception:
+                    log.exception("Artifact sweep failed")
+        self._sweeper = threading.Thread(target=loop, name="artifact-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def _update_gauges(self):
+        with self._lock:
+            count = len(self._artifacts)
+            # Shared files count once
+            disk = sum({(a.session_id, a.digest): a.file_bytes for a in self._artifacts.values()}.values())
+            sessions = len(self._sessions)
+        metrics.set_gauge("artifact_count", count)
+        metrics.set_gauge("artifact_disk_bytes", disk)
+        metrics.set_gauge("artifact_sessions", sessions)
+        metrics.set_gauge("image_memory_bytes", self.cache.bytes)
+
+    def usage(self) -> dict:
+        """Current memory/disk usage, for the status gauge."""
+        self._update_gauges()
+        return {
+            "image_memory_bytes": self.cache.bytes,
+            "image_memory_budget": self.cache.budget,
+            "decoded_images": len(self.cache),
+            "artifacts": metrics.registry.gauge("artifact_count"),
+            "artifact_disk_bytes": metrics.registry.gauge("artifact_disk_bytes"),
+            "sessions": metrics.registry.gauge("artifact_sessions"),
+        }
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _link(source, path) -> bool:
+    """Hard-links path to source; False where the filesystem cannot (the caller writes a copy)."""
+    try:
+        os.link(source, path)
+        return True
+    except OSError:
+        return False
+
+
+def _safe(session_id: str) -> str:
+    return "".join(c for c in session_id if c.isalnum() or c in "-_")[:64] or "session"
+
+
+store = ArtifactStore()
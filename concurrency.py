@@ -0,0 +1,407 @@
+import os
+import math
+import time
+import logging
+import threading
+import contextlib
+import contextvars
+from collections import deque
+from typing import Optional
+import httpx # google-genai's HTTP client
+from google import genai
+from google.genai import types
+import metrics
+import logs
+
+# Adaptive per-model concurrency for model calls (AIMD, as in TCP congestion control).
+# Each model gets a limit on in-flight calls. Every call that succeeds within the
+# model's latency target grows the limit by 1/limit, so about one extra slot per
+# round of calls. A throttling error (429/503) or a latency spike halves the limit,
+# at most once per round: calls already in flight when it was cut do not cut it again.
+#
+# The limit is process-local: each replica finds its own share of the quota.
+#
+# The same layer enforces deadlines and circuit breakers. A caller opens a Deadline
+# with `within(...)`; every model call inside it waits for a slot no longer than the
+# remaining budget and passes that budget on as the request timeout. A per-model
+# breaker opens after BREAKER_FAILURES errors within BREAKER_WINDOW seconds and
+# refuses calls immediately, until one probe call succeeds after BREAKER_COOLDOWN.
+
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+ADAPTIVE_CONCURRENCY = os.environ.get("ADAPTIVE_CONCURRENCY", "1") == "1"
+CONCURRENCY_INITIAL = float(os.environ.get("CONCURRENCY_INITIAL", "4"))
+CONCURRENCY_MIN = float(os.environ.get("CONCURRENCY_MIN", "1"))
+CONCURRENCY_MAX = float(os.environ.get("CONCURRENCY_MAX", "32"))
+CONCURRENCY_DECREASE = float(os.environ.get("CONCURRENCY_DECREASE", "0.5"))
+# Calls slower than this count as congestion. Image renders are far slower than verdicts.
+LATENCY_TARGET_IMAGE = float(os.environ.get("LATENCY_TARGET_IMAGE", "90"))
+LATENCY_TARGET_TEXT = float(os.environ.get("LATENCY_TARGET_TEXT", "15"))
+THROTTLE_CODES = (429, 503)
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "5"))
+BREAKER_WINDOW = float(os.environ.get("BREAKER_WINDOW", "60"))
+BREAKER_COOLDOWN = float(os.environ.get("BREAKER_COOLDOWN", "30"))
+
+
+class DeadlineExceeded(TimeoutError):
+    """The caller's budget ran out before or during a model call."""
+
+
+class CircuitOpen(RuntimeError):
+    """The model has been failing; calls are refused until it recovers."""
+
+
+def _code(error):
+    return getattr(error, "code", None) or getattr(error, "status_code", None)
+
+
+def is_throttle(error: Exception) -> bool:
+    """True for quota and overload errors (google.genai APIError, or anything with a matching `code`)."""
+    return _code(error) in THROTTLE_CODES or "RESOURCE_EXHAUSTED" in str(error)
+
+
+def is_outage(error: Exception) -> bool:
+    """True for errors that say the endpoint is unhealthy, rather than that the request was bad."""
+    if isinstance(error, (DeadlineExceeded, CircuitOpen)):
+        return False
+    code = _code(error)
+    if isinstance(code, int):
+        return code in THROTTLE_CODES or code >= 500
+    # No status: only timeouts and dropped connections count, not bugs in the request or our code
+    return isinstance(error, (TimeoutError, ConnectionError, httpx.TransportError)) or is_throttle(error)
+
+
+class AIMDLimiter:
+    """Concurrency limit that grows additively on fast successes and shrinks multiplicatively on congestion."""
+
+    def __init__(self, name: str, initial: float = None, minimum: float = None, maximum: float = None,
+                 latency_target: float = LATENCY_TARGET_TEXT, decrease: float = None, clock=time.monotonic):
+        self.name = name
+        self.minimum = minimum if minimum is not None else CONCURRENCY_MIN
+        self.maximum = maximum if maximum is not None else CONCURRENCY_MAX
+        self.limit = min(self.maximum, max(self.minimum, initial if initial is not None else CONCURRENCY_INITIAL))
+        self.latency_target = latency_target
+        self.decrease = decrease if decrease is not None else CONCURRENCY_DECREASE
+        self.in_flight = 0
+        self._clock = clock
+        self._epoch = 0 # Bumped on every decrease
+        self._cond = threading.Condition()
+        self._publish()
+
+    def acquire(self, timeout: float = None):
+        """Waits for a free slot. Returns a ticket for release(), or None if `timeout` expires first."""
+        deadline = None if timeout is None else self._clock() + timeout
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = None if deadline is None else deadline - self._clock()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            self._publish()
+            return (self._epoch, self._clock())
+
+    def release(self, ticket, throttled: bool = False, failed: bool = False):
+        """Frees the slot and adjusts the limit from how the call went."""
+        epoch, started = ticket
+        latency = self._clock() - started
+        with self._cond:
+            self.in_flight -= 1
+            if throttled or (not failed and latency > self.latency_target):
+                if epoch == self._epoch: # One cut per round of in-flight calls
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._epoch += 1
+                    metrics.inc("model_concurrency_decreases_total", model=self.name, reason="throttle" if throttled else "latency")
+            elif not failed:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._publish()
+            self._cond.notify_all()
+
+    def _publish(self):
+        metrics.set_gauge("model_concurrency_limit", round(self.limit, 2), model=self.name)
+        metrics.set_gauge("model_in_flight", self.in_flight, model=self.name)
+
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """Opens after `threshold` outages within `window` seconds; lets one probe through after `cooldown`."""
+
+    def __init__(self, name: str, threshold: int = None, window: float = None, cooldown: float = None, clock=time.monotonic):
+        self.name = name
+        self.threshold = threshold if threshold is not None else BREAKER_FAILURES
+        self.window = window if window is not None else BREAKER_WINDOW
+        self.cooldown = cooldown if cooldown is not None else BREAKER_COOLDOWN
+        self.state = CLOSED
+        self._clock = clock
+        self._failures = deque()
+        self._opened = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self._publish()
+
+    def allow(self):
+        """Raises CircuitOpen unless a call may go ahead now."""
+        with self._lock:
+            now = self._clock()
+            if self.state == OPEN and now - self._opened >= self.cooldown:
+                self._set(HALF_OPEN)
+                self._probing = False
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True # This call is the probe
+                return
+            retry_in = max(1, math.ceil(self._opened + self.cooldown - now))
+            metrics.inc("circuit_rejected_total", model=self.name)
+            raise CircuitOpen(f"{self.name} is failing ({self.threshold} errors within {self.window:.0f}s). Retry in {retry_in}s.")
+
+    def record(self, ok: bool):
+        with self._lock:
+            now = self._clock()
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if ok:
+                    self._failures.clear()
+                    self._set(CLOSED)
+                else:
+                    self._open(now)
+                return
+            if ok:
+                return
+            self._failures.append(now)
+            while self._failures and now - self._failures[0] > self.window:
+                self._failures.popleft()
+            if self.state == CLOSED and len(self._failures) >= self.threshold:
+                self._open(now)
+
+    def cancel(self):
+        """Gives back a call that allow() admitted but that never reached the model."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+
+    def _open(self, now):
+        self._opened = now
+        self._set(OPEN)
+        metrics.inc("circuit_opened_total", model=self.name)
+
+    def _set(self, state):
+        self.state = state
+        self._publish()
+
+    def _publish(self):
+        metrics.set_gauge("circuit_state", _STATE_GAUGE[self.state], model=self.name)
+
+
+# --- Deadlines ---
+
+class Deadline:
+    """A time budget shared by every model call made inside `within(deadline)`."""
+
+    def __init__(self, seconds: float, clock=time.monotonic):
+        self.seconds = seconds
+        self._clock = clock
+        self.expires = clock() + seconds
+
+    def remaining(self) -> float:
+        return self.expires - self._clock()
+
+
+_deadline = contextvars.ContextVar("model_call_deadline", default=None)
+_refusal = contextvars.ContextVar("model_call_refusal", default=None)
+
+
+@contextlib.contextmanager
+def within(deadline: Optional[Deadline]):
+    """Runs the block's model calls under `deadline` (None = no budget)."""
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def current() -> Optional[Deadline]:
+    """The budget the calling code runs under, if any."""
+    return _deadline.get()
+
+
+def take_refusal() -> Optional[str]:
+    """Why the last model call in this context was refused or cut short, if it was. Clears it."""
+    reason = _refusal.get()
+    _refusal.set(None)
+    return reason
+
+
+# --- Per-model registry ---
+
+_limiters = {}
+_breakers = {}
+_registry_lock = threading.Lock()
+
+
+def limiter_for(model: str) -> AIMDLimiter:
+    with _registry_lock:
+        limiter = _limiters.get(model)
+        if limiter is None:
+            target = LATENCY_TARGET_IMAGE if "image" in model else LATENCY_TARGET_TEXT
+            limiter = _limiters[model] = AIMDLimiter(model, latency_target=target)
+        return limiter
+
+
+def breaker_for(model: str) -> CircuitBreaker:
+    with _registry_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            breaker = _breakers[model] = CircuitBreaker(model)
+        return breaker
+
+
+def limits() -> dict:
+    """Current {model: limit}, e.g. for a status page."""
+    with _registry_lock:
+        return {model: round(limiter.limit, 2) for model, limiter in _limiters.items()}
+
+
+def reset():
+    with _registry_lock:
+        _limiters.clear()
+        _breakers.clear()
+
+
+def _with_timeout(config, seconds):
+    """`config` with the remaining budget as its HTTP timeout."""
+    http_options = types.HttpOptions(timeout=max(1, int(seconds * 1000)))
+    if config is None:
+        return types.GenerateContentConfig(http_options=http_options)
+    if isinstance(config, dict):
+        return {**config, "http_options": http_options}
+    return config.model_copy(update={"http_options": http_options})
+
+
+def guarded_call(model: str, call, config=None):
+    """Runs `call(config)` for `model` through its breaker, deadline and concurrency limit."""
+    deadline = _deadline.get()
+    timeout = None if deadline is None else deadline.remaining()
+    breaker = breaker_for(model)
+    try:
+        if timeout is not None and timeout <= 0:
+            raise DeadlineExceeded(f"The {deadline.seconds:.0f}s budget ran out before {model} was called.")
+        breaker.allow()
+    except (CircuitOpen, DeadlineExceeded) as e:
+        _refusal.set(str(e))
+        logs.event(log, "model_call", logging.WARNING, model=model, latency=0, outcome="refused", error=str(e))
+        raise
+
+    start = time.perf_counter()
+    limiter = limiter_for(model) if ADAPTIVE_CONCURRENCY else None
+    ticket = limiter.acquire(timeout) if limiter else None
+    if limiter and ticket is None:
+        breaker.cancel() # Not the model's fault
+        message = f"The {deadline.seconds:.0f}s budget ran out waiting for a {model} slot."
+        _refusal.set(message)
+        logs.event(log, "model_call", logging.WARNING, model=model, latency=round(time.perf_counter() - start, 3),
+                   outcome="no_slot", error=message)
+        raise DeadlineExceeded(message)
+    if deadline is not None:
+        config = _with_timeout(config, deadline.remaining())
+    try:
+        result = call(config)
+    except Exception as e:
+        throttled = is_throttle(e)
+        if throttled:
+            metrics.inc("model_throttled_total", model=model)
+        if limiter:
+            limiter.release(ticket, throttled=throttled, failed=True)
+        breaker.record(not is_outage(e))
+        timed_out = deadline is not None and deadline.remaining() <= 0
+        logs.event(log, "model_call", logging.WARNING, model=model, latency=round(time.perf_counter() - start, 3),
+                   outcome="timeout" if timed_out else "throttled" if throttled else "error", error=str(e))
+        if timed_out:
+            message = f"{model} did not answer within the {deadline.seconds:.0f}s budget."
+            _refusal.set(message)
+            raise DeadlineExceeded(message) from e
+        raise
+    if limiter:
+        limiter.release(ticket)
+    breaker.record(True)
+    logs.event(log, "model_call", model=model, latency=round(time.perf_counter() - start, 3), outcome="ok")
+    return result
+
+
+# --- Managed client ---
+
+class _ManagedModels:
+    def __init__(self, models):
+        self._models = models
+
+    def generate_content(self, *, model, contents, config=None, **kwargs):
+        return guarded_call(
+            model, lambda config: self._models.generate_content(model=model, contents=contents, config=config, **kwargs), config
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class _ManagedChat:
+    def __init__(self, chat, model):
+        self._chat = chat
+        self._model = model
+
+    def send_message(self, message, config=None):
+        return guarded_call(self._model, lambda config: self._chat.send_message(message, config=config), config)
+
+    def __getattr__(self, name):
+        return getattr(self._chat, name)
+
+
+class _ManagedChats:
+    def __init__(self, chats):
+        self._chats = chats
+
+    def create(self, *, model, **kwargs):
+        return _ManagedChat(self._chats.create(model=model, **kwargs), model)
+
+    def __getattr__(self, name):
+        return getattr(self._chats, name)
+
+
+class ManagedClient:
+    """Wraps a genai.Client so every model call runs under the caller's deadline and the model's breaker and limit."""
+
+    def __init__(self, client):
+        self._client = client
+        self.models = _ManagedModels(client.models)
+        self.chats = _ManagedChats(client.chats)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name) # files, aio, ... pass through
+
+
+_clients = {}
+
+
+def client(api_key: str):
+    """The process's shared, guarded genai.Client for `api_key`.
+
+    Reusing one client keeps its connection pool (and TLS sessions) warm across calls,
+    instead of paying client construction and a handshake on every generation.
+    """
+    key = (genai.Client, api_key) # A swapped-in Client class (fakes.install) gets its own
+    with _registry_lock:
+        shared = _clients.get(key)
+        if shared is None:
+            shared = _clients[key] = ManagedClient(genai.Client(api_key=api_key))
+        return shared
+
+
+def managed(client):
+    """What get_client() returns: the client with guarded model calls."""
+    if client is None or isinstance(client, ManagedClient):
+        return client
+    return ManagedClient(client)
@@ -0,0 +1,345 @@
+import io
+import os
+import time
+import zlib
+import struct
+import zipfile
+from typing import Iterable, Iterator, Optional
+import numpy as np
+from PIL import Image, ImageDraw, ImageOps
+import artifacts
+
+# "The Save File": lays a learner's verified panels onto comic pages and streams
+# them out as CBZ (a zip of PNG pages) or PDF. The panels are the ones pinned under
+# the learner id (ArtifactStore.pin), so the download matches the progress a reload
+# restores, whichever tab produced them.
+#
+# Pages are composed in horizontal strips of EXPORT_TILE_HEIGHT rows, and each strip
+# is compressed and sent before the next one is drawn. Only one strip plus the
+# panels that overlap it are ever decoded, whatever the page resolution or the
+# number of sessions in the export.
+
+# --- Configuration ---
+EXPORT_DPI = int(os.environ.get("EXPORT_DPI", "300"))
+PAGE_SIZE_INCHES = (6.625, 10.25) # US comic trim size
+EXPORT_TILE_HEIGHT = int(os.environ.get("EXPORT_TILE_HEIGHT", "256"))
+EXPORT_COMPRESSION = int(os.environ.get("EXPORT_COMPRESSION", "6"))
+EXPORT_ADMIN_TOKEN = os.environ.get("EXPORT_ADMIN_TOKEN") # Required for multi-session exports
+
+PAPER = (245, 242, 232)
+INK = (10, 10, 10)
+EMPTY_PANEL = (40, 40, 40)
+MARGIN_INCHES = 0.375
+GUTTER_INCHES = 0.125
+BORDER_INCHES = 0.02
+
+# Slots are (chapter, (x, y, w, h)) in fractions of the live area inside the margins.
+TEMPLATES = {
+    "cover": [("ch6", (0.0, 0.0, 1.0, 1.0))],
+    "story": [
+        ("ch1", (0.0, 0.0, 1.0, 0.34)),
+        ("ch2", (0.0, 0.34, 0.5, 0.33)),
+        ("ch3", (0.5, 0.34, 0.5, 0.33)),
+        ("ch4", (0.0, 0.67, 0.5, 0.33)),
+        ("ch5", (0.5, 0.67, 0.5, 0.33)),
+    ],
+}
+PAGE_ORDER = ["cover", "story"]
+
+
+def page_size(dpi: int = EXPORT_DPI) -> tuple[int, int]:
+    return round(PAGE_SIZE_INCHES[0] * dpi), round(PAGE_SIZE_INCHES[1] * dpi)
+
+
+class Page:
+    """One comic page: its pixel size and the panel files placed on it."""
+
+    def __init__(self, name: str, size: tuple[int, int], placements: list, dpi: int = EXPORT_DPI):
+        self.name = name
+        self.size = size
+        self.placements = placements # [(path or None, (x0, y0, x1, y1))]
+        self.dpi = dpi
+
+
+def layout(template: str, panels: dict, dpi: int = EXPORT_DPI) -> Page:
+    """Maps a template's slots to pixel boxes, keeping a gutter between panels."""
+    width, height = page_size(dpi)
+    margin, gutter = round(MARGIN_INCHES * dpi), round(GUTTER_INCHES * dpi)
+    live_w, live_h = width - 2 * margin, height - 2 * margin
+    placements = []
+    for chapter, (x, y, w, h) in TEMPLATES[template]:
+        x0 = margin + round(x * live_w) + (gutter // 2 if x > 0 else 0)
+        y0 = margin + round(y * live_h) + (gutter // 2 if y > 0 else 0)
+        x1 = margin + round((x + w) * live_w) - (gutter // 2 if x + w < 1 else 0)
+        y1 = margin + round((y + h) * live_h) - (gutter // 2 if y + h < 1 else 0)
+        placements.append((panels.get(chapter), (x0, y0, x1, y1)))
+    return Page(template, (width, height), placements, dpi)
+
+
+def session_pages(session_id: str, store: artifacts.ArtifactStore = None, dpi: int = EXPORT_DPI) -> list[Page]:
+    """Pages for a session's latest verified panels; templates with no panel at all are skipped."""
+    store = store or artifacts.store
+    return panel_pages({chapter: a.path for chapter, a in store.latest_verified(session_id).items()}, dpi)
+
+
+def learner_pages(learner_id: str, store: artifacts.ArtifactStore = None, dpi: int = EXPORT_DPI) -> list[Page]:
+    """Pages for the panels saved under a learner id."""
+    return panel_pages((store or artifacts.store).pinned(learner_id), dpi)
+
+
+def panel_pages(panels: dict, dpi: int = EXPORT_DPI) -> list[Page]:
+    pages = []
+    for template in PAGE_ORDER:
+        if any(chapter in panels for chapter, _ in TEMPLATES[template]):
+            pages.append(layout(template, panels, dpi))
+    return pages
+
+
+# --- Tiled composition ---
+
+def _fit(path, box):
+    size = (box[2] - box[0], box[3] - box[1])
+    if path is None or not os.path.exists(path):
+        return Image.new("RGB", size, EMPTY_PANEL)
+    with Image.open(path) as src:
+        src.draft("RGB", size) # JPEG: decode at reduced scale
+        return ImageOps.fit(src.convert("RGB"), size, Image.Resampling.LANCZOS)
+
+
+def render_strips(page: Page, tile_height: int = EXPORT_TILE_HEIGHT) -> Iterator[Image.Image]:
+    """Yields the page top to bottom as RGB strips, decoding each panel only while it is on screen."""
+    width, height = page.size
+    border = max(1, round(BORDER_INCHES * page.dpi))
+    active = {}
+    for top in range(0, height, tile_height):
+        bottom = min(height, top + tile_height)
+        strip = Image.new("RGB", (width, bottom - top), PAPER)
+        draw = ImageDraw.Draw(strip)
+        for i, (path, box) in enumerate(page.placements):
+            x0, y0, x1, y1 = box
+            if y1 <= top or y0 >= bottom:
+                continue
+            if i not in active:
+                active[i] = _fit(path, box)
+            panel = active[i]
+            crop_top, crop_bottom = max(top, y0) - y0, min(bottom, y1) - y0
+            strip.paste(panel.crop((0, crop_top, x1 - x0, crop_bottom)), (x0, max(top, y0) - top))
+            draw.rectangle([x0, y0 - top, x1 - 1, y1 - 1 - top], outline=INK, width=border)
+        for i in [i for i in active if page.placements[i][1][3] <= bottom]:
+            del active[i] # Panel fully drawn
+        yield strip
+
+
+def _up_filtered(strips: Iterable[Image.Image]) -> Iterator[bytes]:
+    """PNG 'Up'-filtered scanlines (filter byte 2), shared by the PNG and PDF encoders."""
+    previous = None
+    for strip in strips:
+        rows = np.asarray(strip, dtype=np.uint8).reshape(strip.height, -1)
+        above = np.vstack([previous if previous is not None else np.zeros_like(rows[:1]), rows[:-1]])
+        filtered = rows - above # uint8 arithmetic wraps, as the filter requires
+        previous = rows[-1:]
+        yield np.hstack([np.full((rows.shape[0], 1), 2, dtype=np.uint8), filtered]).tobytes()
+
+
+def _compressed(page: Page, tile_height: int) -> Iterator[bytes]:
+    compressor = zlib.compressobj(EXPORT_COMPRESSION)
+    for rows in _up_filtered(render_strips(page, tile_height)):
+        data = compressor.compress(rows)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# --- PNG ---
+
+def _chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+
+def png_stream(page: Page, tile_height: int = EXPORT_TILE_HEIGHT) -> Iterator[bytes]:
+    """Encodes a page as PNG strip by strip (one IDAT chunk per compressed block)."""
+    width, height = page.size
+    ppm = round(page.dpi / 0.0254)
+    yield (
+        b"\x89PNG\r\n\x1a\n"
+        + _chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + _chunk(b"pHYs", struct.pack(">IIB", ppm, ppm, 1))
+    )
+    for data in _compressed(page, tile_height):
+        if data:
+            yield _chunk(b"IDAT", data)
+    yield _chunk(b"IEND", b"")
+
+
+# --- CBZ ---
+
+class _Sink(io.RawIOBase):
+    """Unseekable write target; zipfile then streams entries with data descriptors."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def _comic_info(title: str, pages: int) -> bytes:
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        "<ComicInfo>\n"
+        f"  <Title>{title}</Title>\n"
+        "  <Series>Gemini Comic Creator: Digital Noir</Series>\n"
+        f"  <PageCount>{pages}</PageCount>\n"
+        "  <Manga>No</Manga>\n"
+        "</ComicInfo>\n"
+    ).encode()
+
+
+def cbz_stream(books: dict, tile_height: int = EXPORT_TILE_HEIGHT) -> Iterator[bytes]:
+    """Streams a CBZ. `books` maps a folder name ('' for the root) to its pages."""
+    sink = _Sink()
+    date_time = time.localtime()[:6]
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+        total = 0
+        for folder, pages in books.items():
+            prefix = f"{folder}/" if folder else ""
+            for number, page in enumerate(pages, 1):
+                info = zipfile.ZipInfo(f"{prefix}page-{number:02d}-{page.name}.png", date_time)
+                with archive.open(info, "w", force_zip64=True) as entry:
+                    for data in png_stream(page, tile_height):
+                        entry.write(data)
+                        yield sink.drain()
+                total += 1
+        archive.writestr(zipfile.ZipInfo("ComicInfo.xml", date_time), _comic_info("Unit 9", total))
+    yield sink.drain()
+
+
+# --- PDF ---
+
+def pdf_stream(pages: list[Page], tile_height: int = EXPORT_TILE_HEIGHT) -> Iterator[bytes]:
+    """Streams a PDF with one full-page Flate image per page.
+
+    Image stream lengths are written as indirect objects after each stream, so
+    nothing has to be buffered to learn them.
+    """
+    offsets = {}
+    position = 0
+
+    def emit(data: bytes):
+        nonlocal position
+        position += len(data)
+        return data
+
+    def obj(number, body: bytes):
+        offsets[number] = position
+        return emit(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    yield emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    page_refs = []
+    for i, page in enumerate(pages):
+        page_no, content_no, image_no, length_no = 3 + 4 * i, 4 + 4 * i, 5 + 4 * i, 6 + 4 * i
+        page_refs.append(f"{page_no} 0 R")
+        width, height = page.size
+        w_pt, h_pt = width * 72 / page.dpi, height * 72 / page.dpi
+        yield obj(page_no, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {w_pt:.2f} {h_pt:.2f}] "
+            f"/Resources << /XObject << /Im0 {image_no} 0 R >> >> /Contents {content_no} 0 R >>"
+        ).encode())
+        content = f"q {w_pt:.2f} 0 0 {h_pt:.2f} 0 0 cm /Im0 Do Q".encode()
+        yield obj(content_no, f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+
+        offsets[image_no] = position
+        yield emit((
+            f"{image_no} 0 obj\n<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode "
+            f"/DecodeParms << /Predictor 12 /Colors 3 /Columns {width} >> /Length {length_no} 0 R >>\nstream\n"
+        ).encode())
+        length = 0
+        for data in _compressed(page, tile_height):
+            length += len(data)
+            yield emit(data)
+        yield emit(b"\nendstream\nendobj\n")
+        yield obj(length_no, str(length).encode())
+
+    yield obj(2, f"<< /Type /Pages /Kids [{' '.join(page_refs)}] /Count {len(pages)} >>".encode())
+    yield obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+    xref_at = position
+    count = 3 + 4 * len(pages)
+    lines = [f"xref\n0 {count}\n", "0000000000 65535 f \n"]
+    lines += [f"{offsets[n]:010d} 00000 n \n" for n in range(1, count)]
+    lines.append(f"trailer\n<< /Size {count} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n")
+    yield emit("".join(lines).encode())
+
+
+# --- Entry points ---
+
+FORMATS = {"cbz": "application/vnd.comicbook+zip", "pdf": "application/pdf"}
+
+
+def export_sessions(session_ids: list[str], fmt: str, store: artifacts.ArtifactStore = None) -> Optional[Iterator[bytes]]:
+    """Byte stream for one or many sessions, or None if none of them has a verified panel."""
+    store = store or artifacts.store
+    return export_books({sid: session_pages(sid, store) for sid in session_ids}, fmt)
+
+
+def export_learners(learner_ids: list[str], fmt: str, store: artifacts.ArtifactStore = None) -> Optional[Iterator[bytes]]:
+    """Byte stream for one or many learners' save files, or None if none of them has a saved panel."""
+    store = store or artifacts.store
+    return export_books({lid: learner_pages(lid, store) for lid in learner_ids}, fmt)
+
+
+def export_books(books: dict, fmt: str) -> Optional[Iterator[bytes]]:
+    """{name: pages} as one download; names become CBZ folders when there are several."""
+    books = {name: pages for name, pages in books.items() if pages}
+    if not books:
+        return None
+    if fmt == "pdf":
+        return pdf_stream([page for pages in books.values() for page in pages])
+    if len(books) == 1:
+        return cbz_stream({"": next(iter(books.values()))})
+    return cbz_stream(books)
+
+
+def routes():
+    """HTTP routes serving the exports as streamed downloads (added to the app at launch)."""
+    from starlette.routing import Route
+    from starlette.responses import PlainTextResponse, StreamingResponse
+
+    def respond(learner_ids, fmt, filename):
+        stream = export_learners(learner_ids, fmt)
+        if stream is None:
+            return PlainTextResponse("No verified panels to export yet.", status_code=404)
+        return StreamingResponse(
+            stream, media_type=FORMATS[fmt],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+        )
+
+    async def learner_export(request):
+        fmt = request.path_params["fmt"]
+        if fmt not in FORMATS:
+            return PlainTextResponse("Unknown format.", status_code=404)
+        return respond([request.path_params["learner"]], fmt, f"unit9-save-file.{fmt}")
+
+    async def batch_export(request):
+        fmt = request.path_params["fmt"]
+        token = request.headers.get("x-export-token") or request.query_params.get("token")
+        if not EXPORT_ADMIN_TOKEN or token != EXPORT_ADMIN_TOKEN:
+            return PlainTextResponse("Forbidden.", status_code=403)
+        if fmt not in FORMATS:
+            return PlainTextResponse("Unknown format.", status_code=404)
+        learners = request.query_params.get("learners")
+        learner_ids = learners.split(",") if learners else artifacts.store.save_owners()
+        return respond(learner_ids, fmt, f"class-save-files.{fmt}")
+
+    return [
+        Route("/export/batch.{fmt}", batch_export),
+        Route("/export/{learner}.{fmt}", learner_export),
+    ]
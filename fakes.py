@@ -0,0 +1,199 @@
+import io
+import os
+import json
+import re
+import time
+import random
+import hashlib
+import threading
+from PIL import Image, ImageDraw, PngImagePlugin
+from google import genai
+from google.genai import types
+
+# Offline stand-in for google.genai.Client, used by the load-test harness and tests.
+# Image models return synthetic frames (16:9 when asked for it), verifier models
+# return a JSON verdict, or a transcription of the sign named in the image's prompt
+# when asked to read text (garbled when the verdict roll fails). Latency and outcomes come from the environment:
+#
+#   FAKE_IMAGE_LATENCY   seconds per image generation (default 1.5)
+#   FAKE_TEXT_LATENCY    seconds per verifier call (default 0.3)
+#   FAKE_JITTER          +/- fraction applied to both latencies (default 0.3)
+#   FAKE_ERROR_RATE      probability a call raises (default 0.0)
+#   FAKE_PASS_RATE       probability a verifier answers YES / reads the sign right (default 0.85)
+
+FAKE_API_KEY = "AIza" + "F" * 35 # Passes the diagnostics format check
+
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+class FakeModelError(Exception):
+    """Raised for injected failures; carries a 429-style code like the SDK's APIError."""
+
+    def __init__(self, message="RESOURCE_EXHAUSTED (fake)", code=429):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeBackend:
+    def __init__(self, image_latency=None, text_latency=None, jitter=None, error_rate=None, pass_rate=None, seed=None):
+        self.image_latency = image_latency if image_latency is not None else _env_float("FAKE_IMAGE_LATENCY", 1.5)
+        self.text_latency = text_latency if text_latency is not None else _env_float("FAKE_TEXT_LATENCY", 0.3)
+        self.jitter = jitter if jitter is not None else _env_float("FAKE_JITTER", 0.3)
+        self.error_rate = error_rate if error_rate is not None else _env_float("FAKE_ERROR_RATE", 0.0)
+        self.pass_rate = pass_rate if pass_rate is not None else _env_float("FAKE_PASS_RATE", 0.85)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _roll(self):
+        with self._lock:
+            self.calls += 1
+            return self._random.random(), self._random.random(), self._random.uniform(-1, 1)
+
+    def _wait(self, base, jitter_roll):
+        delay = max(0.0, base * (1 + self.jitter * jitter_roll))
+        if delay:
+            time.sleep(delay)
+
+    def respond(self, model, contents, config=None):
+        error_roll, verdict_roll, jitter_roll = self._roll()
+        is_image = "image" in model
+        self._wait(self.image_latency if is_image else self.text_latency, jitter_roll)
+        if error_roll < self.error_rate:
+            raise FakeModelError()
+        if is_image:
+            return _image_response(_prompt_text(contents), config)
+        if _wants_transcription(config):
+            return _text_response(json.dumps({"texts": _transcribe(contents, garble=verdict_roll >= self.pass_rate)}))
+        verdict = "YES" if verdict_roll < self.pass_rate else "NO"
+        return _text_response(json.dumps({"verdict": verdict, "confidence": 0.9}))
+
+
+def _prompt_text(contents):
+    if isinstance(contents, (str, types.Part, types.Content)):
+        contents = [contents]
+    texts = []
+    for item in contents or []:
+        if isinstance(item, str):
+            texts.append(item)
+        elif isinstance(item, types.Part) and item.text:
+            texts.append(item.text)
+        elif isinstance(item, types.Content):
+            texts.extend(p.text for p in item.parts or [] if p.text)
+    return " ".join(texts)
+
+
+def _image_response(prompt, config=None):
+    aspect = getattr(getattr(config, "image_config", None), "aspect_ratio", None)
+    wide = aspect == "16:9" or "16:9" in prompt
+    size = (1024, 576) if wide else (768, 768)
+    # Deterministic, non-flat frame so local verifier heuristics see real content
+    shade = int(hashlib.md5(prompt.encode()).hexdigest()[:2], 16)
+    img = Image.new("RGB", size, (shade // 4, 0, shade // 2))
+    draw = ImageDraw.Draw(img)
+    for x in range(0, size[0], 64):
+        draw.rectangle([x, 0, x + 20, size[1]], fill=(0, 255 - shade // 2, 255))
+    info = PngImagePlugin.PngInfo()
+    info.add_text("prompt", prompt) # Lets the fake "read" the sign back (see _transcribe)
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG", pnginfo=info)
+    part = types.Part.from_bytes(data=buffer.getvalue(), mime_type="image/png")
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[part]))]
+    )
+
+
+def _wants_transcription(config):
+    schema = getattr(config, "response_json_schema", None) or {}
+    return "texts" in schema.get("properties", {})
+
+
+_LOOKALIKES = str.maketrans("IOESAB", "L0F5R8")
+
+
+def _transcribe(contents, garble=False):
+    """The quoted sign text from the prompt of each image in `contents`."""
+    texts = []
+    for item in contents if isinstance(contents, list) else [contents]:
+        prompt = item.info.get("prompt", "") if isinstance(item, Image.Image) else ""
+        texts.extend(re.findall(r"reads:? '([^']+)'", prompt))
+    if garble and texts:
+        text = texts[0]
+        swappable = [i for i, ch in enumerate(text) if ch.translate(_LOOKALIKES) != ch]
+        i = swappable[len(swappable) // 2] if swappable else len(text) - 1
+        texts[0] = text[:i] + text[i].translate(_LOOKALIKES) + text[i + 1:] if swappable else text[:i]
+    return texts
+
+
+def _text_response(text):
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part.from_text(text=text)]))]
+    )
+
+
+class _FakeModels:
+    def __init__(self, client):
+        self._client = client
+
+    def generate_content(self, *, model, contents, config=None):
+        return self._client.backend_now().respond(model, contents, config)
+
+    def get(self, *, model, config=None):
+        return types.Model(name=f"models/{model}")
+
+
+class _FakeFiles:
+    def upload(self, *, file, config=None):
+        return types.File(name="files/fake", uri=f"https://fake.local/files/{random.getrandbits(48):012x}")
+
+
+class _FakeChat:
+    def __init__(self, client, model, history):
+        self._client = client
+        self._model = model
+        self._history = list(history or [])
+
+    def send_message(self, message, config=None):
+        return self._client.backend_now().respond(self._model, message, config)
+
+
+class _FakeChats:
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, *, model, config=None, history=None):
+        return _FakeChat(self._client, model, history)
+
+
+class FakeClient:
+    """Implements the subset of genai.Client this app uses."""
+
+    backend = None # Shared by every instance, set by install()
+
+    def __init__(self, *args, **kwargs):
+        self._default = None if FakeClient.backend else FakeBackend()
+        self.models = _FakeModels(self)
+        self.files = _FakeFiles()
+        self.chats = _FakeChats(self)
+
+    def backend_now(self):
+        """The installed backend at call time, so long-lived (shared) clients follow install()."""
+        return FakeClient.backend or self._default or FakeBackend()
+
+
+_original_client = genai.Client
+
+
+def install(backend: FakeBackend = None):
+    """Routes every `genai.Client(...)` in this process to the fake backend."""
+    FakeClient.backend = backend or FakeBackend()
+    genai.Client = FakeClient
+    os.environ.setdefault("GOOGLE_API_KEY", FAKE_API_KEY)
+    return FakeClient.backend
+
+
+def uninstall():
+    genai.Client = _original_client
+    FakeClient.backend = None
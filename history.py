@@ -0,0 +1,186 @@
+import os
+import time
+import uuid
+import threading
+from html import escape
+from collections import OrderedDict
+from typing import Optional
+from PIL import Image
+import imaging
+import artifacts
+
+# Per-session generation history: every attempt at a chapter, with its prompt and
+# verdict, shown as a strip of thumbnails under the visualizer.
+#
+# The strip only ever carries one page of small JPEG thumbnails, referenced by URL
+# (loading='lazy') rather than inlined, so a long history never re-sends images.
+# Restoring an attempt puts its stored artifact back into the visualizer; no model
+# call. Artifacts are capped per session (SESSION_ARTIFACT_CAP), so the oldest
+# attempts may outlive their full-size render and can then no longer be restored.
+# Thumbnails are kept by the ArtifactStore (put_thumbnail), which never sweeps them;
+# they go when their attempt is dropped.
+
+# --- Configuration ---
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", "8"))
+HISTORY_LIMIT = int(os.environ.get("HISTORY_LIMIT", "50")) # attempts kept per chapter
+HISTORY_MAX_SESSIONS = int(os.environ.get("HISTORY_MAX_SESSIONS", "256"))
+HISTORY_THUMB_SIDE = int(os.environ.get("HISTORY_THUMB_SIDE", "160"))
+HISTORY_THUMB_QUALITY = int(os.environ.get("HISTORY_THUMB_QUALITY", "70"))
+ROUTE_PREFIX = "/history"
+
+
+class Attempt:
+    """One generation shown in the strip: a thumbnail on disk and the artifact it came from."""
+
+    def __init__(self, attempt_id, number, chapter, prompt, success, message, artifact_id, thumbnail):
+        self.id = attempt_id
+        self.number = number # 1-based, per chapter
+        self.chapter = chapter
+        self.prompt = prompt
+        self.success = success
+        self.message = message
+        self.artifact_id = artifact_id
+        self.thumbnail = thumbnail
+        self.created = time.time()
+
+
+class HistoryStore:
+    """Attempts per session and chapter, newest last, with LRU eviction of whole sessions."""
+
+    def __init__(self, artifact_store: artifacts.ArtifactStore = None, limit: int = HISTORY_LIMIT, max_sessions: int = HISTORY_MAX_SESSIONS,
+                 thumb_side: int = HISTORY_THUMB_SIDE, thumb_quality: int = HISTORY_THUMB_QUALITY):
+        self.artifact_store = artifact_store # None = artifacts.store, looked up at call time
+        self.limit = limit
+        self.max_sessions = max_sessions
+        self.thumb_side = thumb_side
+        self.thumb_quality = thumb_quality
+        self._sessions: "OrderedDict[str, dict[str, list[Attempt]]]" = OrderedDict()
+        self._counts: dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, session_id: str, chapter: str, prompt: str, image: Image.Image,
+               artifact: artifacts.Artifact, success: bool, message: str = "") -> Attempt:
+        with self._lock:
+            # An artifact recorded again shares the earlier attempt's thumbnail
+            known = next((a for a in self._sessions.get(session_id, {}).get(chapter, []) if a.artifact_id == artifact.id), None)
+        attempt_id = uuid.uuid4().hex
+        thumbnail = known.thumbnail if known else self._write_thumbnail(session_id, attempt_id, image)
+
+        dropped, evicted = [], []
+        with self._lock:
+            chapters = self._sessions.setdefault(session_id, {})
+            self._sessions.move_to_end(session_id)
+            number = self._counts[(session_id, chapter)] = self._counts.get((session_id, chapter), 0) + 1
+            attempt = Attempt(attempt_id, number, chapter, prompt, success, message, artifact.id, thumbnail)
+            attempts = chapters.setdefault(chapter, [])
+            attempts.append(attempt)
+            while len(attempts) > self.limit:
+                dropped.append(attempts.pop(0))
+            while len(self._sessions) > self.max_sessions:
+                old_id, old = self._sessions.popitem(last=False)
+                evicted.extend(a for chapter_attempts in old.values() for a in chapter_attempts)
+                self._counts = {k: v for k, v in self._counts.items() if k[0] != old_id}
+            in_use = {a.thumbnail for a in attempts}
+        for old in evicted + [a for a in dropped if a.thumbnail not in in_use]:
+            self._artifacts().remove_thumbnail(old.thumbnail)
+        return attempt
+
+    def _artifacts(self) -> artifacts.ArtifactStore:
+        return self.artifact_store or artifacts.store
+
+    def _write_thumbnail(self, session_id, attempt_id, image):
+        data = imaging.encode_preview(image, self.thumb_side, self.thumb_quality)
+        return self._artifacts().put_thumbnail(session_id, f"history-{attempt_id}.jpg", data)
+
+    def attempts(self, session_id: str, chapter: str) -> list[Attempt]:
+        """Newest first."""
+        with self._lock:
+            return list(reversed(self._sessions.get(session_id, {}).get(chapter, [])))
+
+    def page(self, session_id: str, chapter: str, page: int = 0, size: int = HISTORY_PAGE_SIZE) -> tuple[list[Attempt], int, int]:
+        """(attempts on the page, page, page count); out-of-range pages are clamped."""
+        attempts = self.attempts(session_id, chapter)
+        pages = max(1, -(-len(attempts) // size))
+        page = min(max(0, page), pages - 1)
+        return attempts[page * size:(page + 1) * size], page, pages
+
+    def get(self, session_id: str, attempt_id: str) -> Optional[Attempt]:
+        with self._lock:
+            for attempts in self._sessions.get(session_id, {}).values():
+                for attempt in attempts:
+                    if attempt.id == attempt_id:
+                        return attempt
+        return None
+
+    def discard(self, session_id: str):
+        with self._lock:
+            chapters = self._sessions.pop(session_id, {})
+            self._counts = {k: v for k, v in self._counts.items() if k[0] != session_id}
+        for path in {a.thumbnail for attempts in chapters.values() for a in attempts}:
+            self._artifacts().remove_thumbnail(path)
+
+
+store = HistoryStore()
+
+
+# --- Strip ---
+
+def thumbnail_url(session_id: str, attempt: Attempt) -> str:
+    # Relative, like the export links, so it works under a path prefix
+    return f"{ROUTE_PREFIX.lstrip('/')}/{session_id}/{attempt.id}.jpg"
+
+
+def render(session_id: Optional[str], chapter: str, page: int = 0, history: HistoryStore = None) -> str:
+    """One page of the chapter's attempts as HTML; thumbnails load lazily from their own URLs."""
+    history = history or store
+    attempts, page, pages = history.page(session_id, chapter, page) if session_id else ([], 0, 1)
+    if not attempts:
+        return "<div class='history-strip history-empty'>> NO ATTEMPTS YET</div>"
+    items = []
+    for attempt in attempts:
+        verdict = "pass" if attempt.success else "fail"
+        title = escape(f"#{attempt.number} {attempt.prompt}\n{attempt.message}")
+        items.append(
+            f"<button class='history-item history-{verdict}' data-attempt='{attempt.id}' title='{title}'>"
+            f"<img src='{thumbnail_url(session_id, attempt)}' loading='lazy' decoding='async' alt='Attempt {attempt.number}'>"
+            f"<span class='history-label'>#{attempt.number} {'✓' if attempt.success else '✗'}</span></button>"
+        )
+    pager = (
+        f"<div class='history-pager'>"
+        f"<button data-chapter='{chapter}' data-page='{page - 1}'{' disabled' if page == 0 else ''}>←</button>"
+        f"<span>PAGE {page + 1}/{pages}</span>"
+        f"<button data-chapter='{chapter}' data-page='{page + 1}'{' disabled' if page + 1 >= pages else ''}>→</button></div>"
+    )
+    return f"<div class='history-strip'><div class='history-items'>{''.join(items)}</div>{pager}</div>"
+
+
+# Clicks are delegated from the component root, so they survive every re-render
+EVENTS_JS = """
+element.addEventListener('click', (event) => {
+    const item = event.target.closest('[data-attempt]');
+    if (item) return trigger('restore', {attempt: item.dataset.attempt});
+    const pager = event.target.closest('[data-page]');
+    if (pager && !pager.disabled) trigger('turn_page', {chapter: pager.dataset.chapter, page: Number(pager.dataset.page)});
+});
+"""
+
+
+def component(**kwargs):
+    """The strip as a Gradio HTML component with `restore` and `turn_page` events (import deferred, as in terminal.py)."""
+    import gradio as gr
+    return gr.HTML(value=render(None, ""), js_on_load=EVENTS_JS, **kwargs)
+
+
+def routes(history: HistoryStore = None):
+    """Serves thumbnails (added to the app at launch). Attempt ids are random, so responses never change."""
+    from starlette.routing import Route
+    from starlette.responses import FileResponse, PlainTextResponse
+
+    async def thumbnail(request):
+        attempt = (history or store).get(request.path_params["session"], request.path_params["attempt"])
+        if attempt is None or not os.path.exists(attempt.thumbnail):
+            return PlainTextResponse("Not found.", status_code=404)
+        return FileResponse(attempt.thumbnail, media_type="image/jpeg",
+                            headers={"Cache-Control": f"private, max-age={artifacts.ARTIFACT_TTL}, immutable"})
+
+    return [Route(ROUTE_PREFIX + "/{session}/{attempt}.jpg", thumbnail)]
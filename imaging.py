@@ -0,0 +1,121 @@
+import io
+import os
+import hashlib
+import logging
+import threading
+from typing import Optional
+from PIL import Image, ImageOps
+from google.genai import types
+
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+# The image model does not benefit from references larger than this; anything bigger
+# is just bytes on the wire.
+REFERENCE_MAX_SIDE = int(os.environ.get("REFERENCE_MAX_SIDE", "1024"))
+REFERENCE_QUALITY = int(os.environ.get("REFERENCE_QUALITY", "88"))
+# Encoded references above this size are sent once through the Files API and then
+# referenced by URI on every retry instead of being inlined again.
+REFERENCE_UPLOAD_BYTES = int(os.environ.get("REFERENCE_UPLOAD_BYTES", str(512 * 1024)))
+REFERENCE_MIME_TYPE = "image/jpeg"
+# Progressive display: renders whose longest side exceeds PREVIEW_THRESHOLD are first
+# shown as a small, low-quality JPEG while the full file is verified and written.
+PREVIEW_MAX_SIDE = int(os.environ.get("PREVIEW_MAX_SIDE", "384"))
+PREVIEW_QUALITY = int(os.environ.get("PREVIEW_QUALITY", "60"))
+PREVIEW_THRESHOLD = int(os.environ.get("PREVIEW_THRESHOLD", "1536"))
+
+
+class PreparedReference:
+    """A reference image normalized once per upload: downscaled, JPEG-encoded and hashed."""
+
+    def __init__(self, data: bytes, size: tuple[int, int], source_size: tuple[int, int]):
+        self.data = data
+        self.size = size
+        self.source_size = source_size
+        self.mime_type = REFERENCE_MIME_TYPE
+        self.digest = hashlib.sha256(data).hexdigest()
+        self._part = None
+        self._uploaded = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f"PreparedReference({self.digest[:12]}, {self.size[0]}x{self.size[1]}, {len(self.data)} bytes)"
+
+    def __deepcopy__(self, memo):
+        # Gradio deep-copies State values; the encoded payload is immutable so share it.
+        return self
+
+    def as_part(self) -> types.Part:
+        """Returns the encoded bytes as an inline Part (built once)."""
+        if self._part is None:
+            self._part = types.Part.from_bytes(data=self.data, mime_type=self.mime_type)
+        return self._part
+
+    def upload(self, client) -> types.Part:
+        """Uploads the encoded bytes once and returns a URI Part for the stored file."""
+        with self._lock:
+            if self._uploaded is None:
+                uploaded = client.files.upload(
+                    file=io.BytesIO(self.data),
+                    config=types.UploadFileConfig(mime_type=self.mime_type, display_name=f"ref-{self.digest[:16]}"),
+                )
+                self._uploaded = types.Part.from_uri(file_uri=uploaded.uri, mime_type=self.mime_type)
+            return self._uploaded
+
+    def to_content(self, client=None) -> types.Part:
+        """Chooses the cheapest way to send this reference for the current request."""
+        if client is not None and len(self.data) > REFERENCE_UPLOAD_BYTES:
+            try:
+                return self.upload(client)
+            except Exception as e:
+                log.warning("Reference upload failed, sending inline: %s", e)
+        return self.as_part()
+
+
+def prepare_reference(image: Optional[Image.Image]) -> Optional[PreparedReference]:
+    """Normalizes an uploaded reference image for the image model.
+
+    Applies EXIF orientation, flattens transparency, downscales the longest side to
+    REFERENCE_MAX_SIDE and encodes the result as JPEG. Already-prepared references
+    are returned unchanged.
+    """
+    if image is None or isinstance(image, PreparedReference):
+        return image
+
+    source_size = image.size
+    img = ImageOps.exif_transpose(image)
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        img = Image.new("RGB", rgba.size, (0, 0, 0))
+        img.paste(rgba, mask=rgba.getchannel("A"))
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+
+    if max(img.size) > REFERENCE_MAX_SIDE:
+        img.thumbnail((REFERENCE_MAX_SIDE, REFERENCE_MAX_SIDE), Image.Resampling.LANCZOS)
+
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=REFERENCE_QUALITY, optimize=True)
+    return PreparedReference(buffer.getvalue(), img.size, source_size)
+
+
+def needs_preview(image: Optional[Image.Image]) -> bool:
+    return image is not None and max(image.size) > PREVIEW_THRESHOLD
+
+
+def encode_preview(image: Image.Image, max_side: int = PREVIEW_MAX_SIDE, quality: int = PREVIEW_QUALITY) -> bytes:
+    """Encodes a small JPEG stand-in for a large render (typically a few KB).
+
+    Uses integer box reduction before the final resample, so a 4K frame costs
+    milliseconds rather than a full-resolution filter pass.
+    """
+    img = image if image.mode == "RGB" else image.convert("RGB")
+    factor = max(img.size) // (2 * max_side)
+    preview = img.reduce(factor) if factor > 1 else img.copy()
+    preview.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+    buffer = io.BytesIO()
+    preview.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
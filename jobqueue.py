@@ -0,0 +1,416 @@
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import sqlite3
+import logging
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from typing import Optional
+from PIL import Image
+import metrics
+import logs
+
+# Durable generation queue. The web process journals jobs in SQLite; worker
+# processes (started separately, on this or any host sharing the file) claim them
+# under a lease, run generate + verify and write the result back.
+#
+#   JOB_QUEUE=1 uv run python app.py            # UI submits jobs instead of generating
+#   uv run python jobqueue.py worker -p 4       # four worker processes
+#   uv run python jobqueue.py stats             # depth, running, oldest queued age
+#
+# A worker that dies mid-job stops renewing its lease; once the lease expires the
+# job is claimed again, up to JOB_MAX_ATTEMPTS times. Queued jobs survive restarts
+# of both the web process and the workers.
+
+# --- Configuration ---
+JOB_DB = os.environ.get("JOB_DB", os.path.join(tempfile.gettempdir(), "comic_creator_jobs.sqlite3"))
+JOB_RESULT_DIR = os.environ.get("JOB_RESULT_DIR", os.path.join(tempfile.gettempdir(), "comic_creator_jobs"))
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", str(24 * 3600)))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "0.5"))
+JOB_DEADLINE = float(os.environ.get("JOB_DEADLINE", "300")) # Seconds per attempt, generation plus verification
+# Submitting and watching refresh the queue gauges at most this often (seconds)
+JOB_STATS_INTERVAL = float(os.environ.get("JOB_STATS_INTERVAL", "5"))
+
+log = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+TERMINAL = (DONE, FAILED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    chapter TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    reference BLOB,
+    session_id TEXT,
+    status TEXT NOT NULL,
+    stage TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    success INTEGER,
+    message TEXT,
+    timings TEXT,
+    image_path TEXT,
+    preview_path TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created);
+"""
+
+
+class Job:
+    """A snapshot of one journal row."""
+
+    def __init__(self, row: sqlite3.Row, position: Optional[int] = None):
+        self.id = row["id"]
+        self.chapter = row["chapter"]
+        self.prompt = row["prompt"]
+        self.reference = row["reference"]
+        self.session_id = row["session_id"]
+        self.status = row["status"]
+        self.stage = row["stage"]
+        self.attempts = row["attempts"]
+        self.max_attempts = row["max_attempts"]
+        self.created = row["created"]
+        self.success = bool(row["success"])
+        self.message = row["message"]
+        self.timings = json.loads(row["timings"]) if row["timings"] else {}
+        self.image_path = row["image_path"]
+        self.preview_path = row["preview_path"]
+        self.error = row["error"]
+        self.position = position
+
+    @property
+    def finished(self):
+        return self.status in TERMINAL
+
+    def to_dict(self):
+        return {
+            "id": self.id, "chapter": self.chapter, "status": self.status, "stage": self.stage,
+            "attempts": self.attempts, "position": self.position, "success": self.success,
+            "message": self.message, "timings": self.timings, "error": self.error,
+        }
+
+
+class JobQueue:
+    def __init__(self, path: str = JOB_DB, lease_seconds: float = JOB_LEASE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._stats_refreshed = None
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # One short-lived connection per call: safe across threads and processes
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return _Closing(conn)
+
+    # --- Producer ---
+
+    def submit(self, chapter: str, prompt: str, reference: Optional[bytes] = None, session_id: Optional[str] = None) -> str:
+        """Journals a job and returns its id. `reference` is the encoded image, if any."""
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, chapter, prompt, reference, session_id, status, max_attempts, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, chapter, prompt, reference, session_id, QUEUED, self.max_attempts, time.time()),
+            )
+        metrics.inc("jobs_submitted_total", chapter=chapter)
+        self.refresh_gauges()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            position = None
+            if row["status"] == QUEUED:
+                position = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND created < ?", (QUEUED, row["created"])
+                ).fetchone()[0]
+            return Job(row, position)
+
+    def watch(self, job_id: str, interval: float = JOB_POLL_INTERVAL, timeout: Optional[float] = None):
+        """Yields the job whenever its status, stage, position or preview changes, ending when it finishes."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        last = None
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                return
+            state = (job.status, job.stage, job.position, job.attempts, job.preview_path)
+            if state != last:
+                last = state
+                yield job
+            if job.finished:
+                return
+            if deadline is not None and time.monotonic() > deadline:
+                return
+            self.refresh_gauges()
+            time.sleep(interval)
+
+    # --- Consumer ---
+
+    def claim(self, worker_id: str) -> Optional[Job]:
+        """Leases the oldest runnable job (queued, or running with an expired lease)."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs whose worker vanished on their last allowed attempt
+                conn.execute(
+                    "UPDATE jobs SET status = ?, finished = ?, error = 'Worker lease expired on final attempt.' "
+                    "WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+                    (FAILED, now, RUNNING, now),
+                )
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? OR (status = ? AND lease_expires < ?) ORDER BY created LIMIT 1",
+                    (QUEUED, RUNNING, now),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, stage = 'generating', lease_owner = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, started = ? WHERE id = ?",
+                    (RUNNING, worker_id, now + self.lease_seconds, now, row["id"]),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get(row["id"])
+
+    def _update_owned(self, job_id, worker_id, assignments: str, values: tuple) -> bool:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ? AND lease_owner = ? AND status = ?",
+                values + (job_id, worker_id, RUNNING),
+            )
+            return cursor.rowcount == 1
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Extends the lease. False means the job was reclaimed by another worker."""
+        return self._update_owned(job_id, worker_id, "lease_expires = ?", (time.time() + self.lease_seconds,))
+
+    def progress(self, job_id: str, worker_id: str, stage: str, preview_path: Optional[str] = None) -> bool:
+        return self._update_owned(job_id, worker_id, "stage = ?, preview_path = COALESCE(?, preview_path)", (stage, preview_path))
+
+    def complete(self, job_id: str, worker_id: str, success: bool, message: str, timings: dict, image_path: Optional[str]) -> bool:
+        return self._update_owned(
+            job_id, worker_id,
+            "status = ?, stage = NULL, finished = ?, success = ?, message = ?, timings = ?, image_path = ?, lease_owner = NULL",
+            (DONE, time.time(), int(success), message, json.dumps(timings), image_path),
+        )
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        """Records an error; the job is queued again until it runs out of attempts."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN ? ELSE ? END, "
+                "finished = CASE WHEN attempts < max_attempts THEN NULL ELSE ? END, "
+                "stage = NULL, error = ?, lease_owner = NULL, lease_expires = NULL "
+                "WHERE id = ? AND lease_owner = ? AND status = ?",
+                (QUEUED, FAILED, time.time(), error, job_id, worker_id, RUNNING),
+            )
+            return cursor.rowcount == 1
+
+    # --- Housekeeping ---
+
+    def stats(self) -> dict:
+        """Queue depth and age, also published as gauges."""
+        now = time.time()
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = conn.execute("SELECT MIN(created) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+        result = {
+            "depth": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "done": counts.get(DONE, 0),
+            "failed": counts.get(FAILED, 0),
+            "oldest_queued_age": round(now - oldest, 3) if oldest else 0.0,
+        }
+        metrics.set_gauge("job_queue_depth", result["depth"])
+        metrics.set_gauge("job_queue_running", result["running"])
+        metrics.set_gauge("job_queue_oldest_age_seconds", result["oldest_queued_age"])
+        return result
+
+    def refresh_gauges(self):
+        """Runs stats() at most every JOB_STATS_INTERVAL, so the web process keeps the gauges current."""
+        now = time.monotonic()
+        if self._stats_refreshed is None or now - self._stats_refreshed >= JOB_STATS_INTERVAL:
+            self._stats_refreshed = now
+            self.stats()
+
+    def prune(self, max_age: int = JOB_RETENTION_SECONDS) -> int:
+        """Deletes finished jobs (and result files nobody collected) older than max_age."""
+        cutoff = time.time() - max_age
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, image_path, preview_path FROM jobs WHERE status IN (?, ?) AND finished < ?", (DONE, FAILED, cutoff)
+            ).fetchall()
+            for row in rows:
+                for path in (row["image_path"], row["preview_path"]):
+                    if path and os.path.exists(path):
+                        os.remove(path)
+            conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?", (DONE, FAILED, cutoff))
+        return len(rows)
+
+
+class _Closing:
+    """Context manager that closes (not just commits) a sqlite3 connection."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, *exc):
+        self.conn.close()
+
+
+# --- Worker ---
+
+def _reference(blob):
+    if not blob:
+        return None
+    import imaging
+    with Image.open(io.BytesIO(blob)) as img:
+        size = img.size
+    return imaging.PreparedReference(blob, size, size)
+
+
+def process_one(queue: JobQueue, worker_id: str, result_dir: str = JOB_RESULT_DIR) -> Optional[Job]:
+    """Claims and runs a single job. Returns the job that was run, or None if the queue was empty."""
+    import imaging
+    import pipeline
+    import concurrency
+
+    job = queue.claim(worker_id)
+    if job is None:
+        return None
+
+    stop = threading.Event()
+    def keep_leased():
+        while not stop.wait(queue.lease_seconds / 3):
+            if not queue.heartbeat(job.id, worker_id):
+                return
+    heartbeat = threading.Thread(target=keep_leased, daemon=True)
+    heartbeat.start()
+    try:
+        os.makedirs(result_dir, exist_ok=True)
+        deadline = concurrency.Deadline(JOB_DEADLINE)
+        with concurrency.within(deadline), logs.bind(session_id=job.session_id, job_id=job.id, worker=worker_id):
+            result = pipeline.generate_chapter(job.chapter, job.prompt, _reference(job.reference))
+        if result.image is None:
+            queue.complete(job.id, worker_id, False, result.message, result.timings, None)
+            return job
+        if imaging.needs_preview(result.image):
+            preview_path = os.path.join(result_dir, f"{job.id}-preview.jpg")
+            with open(preview_path, "wb") as f:
+                f.write(imaging.encode_preview(result.image))
+            queue.progress(job.id, worker_id, "verifying", preview_path)
+        else:
+            queue.progress(job.id, worker_id, "verifying")
+        with concurrency.within(deadline), logs.bind(session_id=job.session_id, job_id=job.id, worker=worker_id):
+            pipeline.complete_chapter(result)
+        image_path = os.path.join(result_dir, f"{job.id}.png")
+        result.image.save(image_path, format="PNG", compress_level=1)
+        queue.complete(job.id, worker_id, result.success, result.message, result.timings, image_path)
+        metrics.inc("jobs_completed_total", chapter=job.chapter)
+    except Exception as e:
+        log.exception("Job failed", extra={"event": "job_failed", "job_id": job.id, "chapter": job.chapter, "worker": worker_id})
+        queue.fail(job.id, worker_id, str(e)[:500])
+        metrics.inc("jobs_failed_total", chapter=job.chapter)
+    finally:
+        stop.set()
+    return job
+
+
+def worker_main(db_path: str = JOB_DB, worker_id: Optional[str] = None, poll_interval: float = JOB_POLL_INTERVAL):
+    """Worker process loop: claim, run, repeat until SIGTERM/SIGINT."""
+    from dotenv import load_dotenv
+    load_dotenv()
+    logs.setup()
+    worker_id = worker_id or f"{os.uname().nodename}-{os.getpid()}"
+    queue = JobQueue(db_path)
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    last_prune = 0.0
+    log.info("Worker %s polling %s", worker_id, db_path)
+    while not stopping.is_set():
+        try:
+            job = process_one(queue, worker_id)
+        except KeyboardInterrupt:
+            break
+        except sqlite3.OperationalError as e:
+            log.warning("Worker %s: journal busy (%s), retrying", worker_id, e)
+            job = None
+        if job is None:
+            if time.time() - last_prune > 600:
+                queue.prune()
+                last_prune = time.time()
+            stopping.wait(poll_interval)
+
+
+def start_workers(count: int, db_path: str = JOB_DB) -> list:
+    """Starts `count` worker processes (spawned, so they share nothing with the caller)."""
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for i in range(count):
+        process = context.Process(target=worker_main, args=(db_path,), name=f"job-worker-{i}", daemon=True)
+        process.start()
+        processes.append(process)
+    return processes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Durable generation job queue.")
+    parser.add_argument("--db", default=JOB_DB, help="SQLite journal path")
+    sub = parser.add_subparsers(dest="command", required=True)
+    worker_parser = sub.add_parser("worker", help="Run worker processes")
+    worker_parser.add_argument("-p", "--processes", type=int, default=1)
+    sub.add_parser("stats", help="Print queue depth and age as JSON")
+    sub.add_parser("prune", help="Delete finished jobs past the retention window")
+    args = parser.parse_args(argv)
+
+    if args.command == "stats":
+        print(json.dumps(JobQueue(args.db).stats()))
+    elif args.command == "prune":
+        print(f"Pruned {JobQueue(args.db).prune()} jobs.")
+    elif args.processes <= 1:
+        worker_main(args.db)
+    else:
+        processes = start_workers(args.processes, args.db)
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+import io
+import os
+import json
+import logging
+import threading
+from typing import Optional
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont, ImageColor
+from google.genai import types
+import logic
+import state
+
+# Local lettering for chapter 2. The alley and its blank sign (the "plate") are
+# generated once with the learner's own generate_sign; the sign board is located
+# once; after that any sign text is composited locally in a few milliseconds:
+#
+#   text mask -> neon glow (box-blur pyramid) -> perspective warp onto the board
+#   -> screen blend onto the plate -> bloom on the brightest pixels
+#
+# Every step after the text mask works on NumPy arrays, and only on the board's
+# bounding box, not the whole frame.
+
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+LETTERING_MODE = os.environ.get("LETTERING_MODE", "model") # "local" to default the UI toggle on
+LETTERING_FONT = os.environ.get("LETTERING_FONT") # Path to a .ttf/.otf; Pillow's default face otherwise
+LETTERING_COLOR = os.environ.get("LETTERING_COLOR", "#ff2bd6")
+LETTERING_PLATE_TTL = int(os.environ.get("LETTERING_PLATE_TTL", str(24 * 3600)))
+LOCATOR_MODEL = os.environ.get("LETTERING_LOCATOR_MODEL", "gemini-3-flash-preview")
+BLANK_SIGN_TEXT = "" # What generate_sign is asked to write on the plate
+
+# Where the board is assumed to be if it cannot be located: upper centre, slight yaw.
+DEFAULT_QUAD = ((0.28, 0.12), (0.72, 0.14), (0.72, 0.27), (0.28, 0.27))
+CORNERS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "corners": {
+            "type": "array", "minItems": 4, "maxItems": 4,
+            "items": {"type": "array", "items": {"type": "number"}, "minItems": 2, "maxItems": 2},
+        }
+    },
+    "required": ["corners"],
+}
+LOCATOR_PROMPT = (
+    "Find the blank sign board in this image (the flat face where lettering would go). "
+    "Return its four corners as [x, y] pairs normalized to 0-1000, in the order "
+    "top-left, top-right, bottom-right, bottom-left."
+)
+
+
+class Plate:
+    """A rendered alley with a blank sign, plus the board's corners in pixels."""
+
+    def __init__(self, image: Image.Image, quad):
+        self.image = image.convert("RGB")
+        self.quad = np.asarray(quad, dtype=np.float64)
+        self.pixels = np.asarray(self.image, dtype=np.float32) / 255.0 # Decoded once, reused per text
+
+
+# --- NumPy image operations ---
+
+def box_blur(a: np.ndarray, radius: int) -> np.ndarray:
+    """Mean filter of width 2r+1 along both axes, via cumulative sums (any channel count)."""
+    if radius < 1:
+        return a
+    out = a
+    for axis in (0, 1):
+        pad = [(0, 0)] * out.ndim
+        pad[axis] = (radius + 1, radius)
+        c = np.cumsum(np.pad(out, pad, mode="edge"), axis=axis, dtype=np.float32)
+        hi = np.take(c, np.arange(2 * radius + 1, c.shape[axis]), axis=axis)
+        lo = np.take(c, np.arange(0, c.shape[axis] - 2 * radius - 1), axis=axis)
+        out = (hi - lo) / (2 * radius + 1)
+    return out
+
+
+def gaussian_blur(a: np.ndarray, radius: int) -> np.ndarray:
+    """Three box passes approximate a Gaussian with sigma ~ radius."""
+    r = max(1, int(round(radius * 0.58)))
+    return box_blur(box_blur(box_blur(a, r), r), r)
+
+
+def homography(src, dst) -> np.ndarray:
+    """3x3 matrix mapping four src points onto four dst points."""
+    rows, rhs = [], []
+    for (x, y), (u, v) in zip(src, dst):
+        rows.append([x, y, 1, 0, 0, 0, -u * x, -u * y])
+        rows.append([0, 0, 0, x, y, 1, -v * x, -v * y])
+        rhs += [u, v]
+    h = np.linalg.solve(np.asarray(rows, dtype=np.float64), np.asarray(rhs, dtype=np.float64))
+    return np.append(h, 1.0).reshape(3, 3)
+
+
+def warp(layer: np.ndarray, matrix: np.ndarray, box) -> np.ndarray:
+    """Samples `layer` (h, w, c) into the destination box (x0, y0, x1, y1) through `matrix` (layer -> dest)."""
+    x0, y0, x1, y1 = box
+    inverse = np.linalg.inv(matrix)
+    ys, xs = np.mgrid[y0:y1, x0:x1].astype(np.float64)
+    pts = np.stack([xs + 0.5, ys + 0.5, np.ones_like(xs)], axis=-1) @ inverse.T
+    sx = pts[..., 0] / pts[..., 2] - 0.5
+    sy = pts[..., 1] / pts[..., 2] - 0.5
+    h, w = layer.shape[:2]
+    fx, fy = np.floor(sx), np.floor(sy)
+    ax, ay = (sx - fx)[..., None], (sy - fy)[..., None]
+    fx, fy = fx.astype(np.int64), fy.astype(np.int64)
+    padded = np.pad(layer, ((1, 1), (1, 1), (0, 0))) # Zero outside the layer
+    ix = np.clip(fx + 1, 0, w)
+    iy = np.clip(fy + 1, 0, h)
+    top = padded[iy, ix] * (1 - ax) + padded[iy, ix + 1] * ax
+    bottom = padded[iy + 1, ix] * (1 - ax) + padded[iy + 1, ix + 1] * ax
+    out = top * (1 - ay) + bottom * ay
+    outside = (sx < -1) | (sy < -1) | (sx > w) | (sy > h)
+    out[outside] = 0
+    return out.astype(np.float32)
+
+
+# --- Lettering ---
+
+def _font(size: int):
+    if LETTERING_FONT:
+        return ImageFont.truetype(LETTERING_FONT, size)
+    return ImageFont.load_default(size)
+
+
+def text_mask(text: str, size: tuple[int, int]) -> np.ndarray:
+    """White-on-black text fitted to `size`, as floats in 0..1."""
+    width, height = size
+    mask = Image.new("L", size, 0)
+    draw = ImageDraw.Draw(mask)
+    font_size = max(8, int(height * 0.7))
+    while font_size > 8:
+        font = _font(font_size)
+        left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+        if right - left <= width * 0.9 and bottom - top <= height * 0.75:
+            break
+        font_size = int(font_size * 0.9)
+    font = _font(font_size)
+    draw.text((width / 2, height / 2), text, font=font, fill=255, anchor="mm")
+    return np.asarray(mask, dtype=np.float32) / 255.0
+
+
+def neon_layer(mask: np.ndarray, color, glow_radius: float) -> np.ndarray:
+    """Emission layer: a hot near-white core plus a coloured glow falling off around it."""
+    tint = np.asarray(color, dtype=np.float32)
+    core = tint * 0.35 + 0.65 # Tubes burn close to white
+    glow = gaussian_blur(mask, int(glow_radius)) * 1.8 + gaussian_blur(mask, int(glow_radius * 3)) * 0.9
+    return np.clip(mask[..., None] * core + glow[..., None] * tint, 0.0, None)
+
+
+def bloom(region: np.ndarray, threshold: float = 0.75, radius: int = 12, strength: float = 0.6) -> np.ndarray:
+    bright = np.clip(region - threshold, 0.0, None)
+    return region + gaussian_blur(bright, radius) * strength
+
+
+def letter(plate: Plate, text: str, color: str = None) -> Image.Image:
+    """Composites neon `text` onto the plate's sign board."""
+    tint = np.asarray(ImageColor.getrgb(color or LETTERING_COLOR), dtype=np.float32) / 255.0
+    quad = plate.quad
+    board_w = int(max(np.linalg.norm(quad[1] - quad[0]), np.linalg.norm(quad[2] - quad[3])))
+    board_h = int(max(np.linalg.norm(quad[3] - quad[0]), np.linalg.norm(quad[2] - quad[1])))
+    board_w, board_h = max(board_w, 16), max(board_h, 8)
+    pad = max(4, board_h // 2) # Room for the glow to spill past the board
+
+    mask = np.pad(text_mask(text, (board_w, board_h)), pad)
+    layer = neon_layer(mask, tint, glow_radius=max(2, board_h / 24))
+    inner = [(pad, pad), (pad + board_w, pad), (pad + board_w, pad + board_h), (pad, pad + board_h)]
+    matrix = homography(inner, quad)
+
+    # Destination box: the padded layer's corners mapped onto the plate
+    lh, lw = layer.shape[:2]
+    corners = np.array([[0, 0, 1], [lw, 0, 1], [lw, lh, 1], [0, lh, 1]], dtype=np.float64) @ matrix.T
+    corners = corners[:, :2] / corners[:, 2:]
+    height, width = plate.pixels.shape[:2]
+    x0, y0 = np.clip(np.floor(corners.min(axis=0)).astype(int), 0, [width, height])
+    x1, y1 = np.clip(np.ceil(corners.max(axis=0)).astype(int), 0, [width, height])
+
+    out = plate.pixels.copy()
+    if x1 > x0 and y1 > y0:
+        emission = warp(layer, matrix, (x0, y0, x1, y1))
+        base = out[y0:y1, x0:x1]
+        lit = 1.0 - (1.0 - base) * (1.0 - np.clip(emission, 0.0, 1.0)) # Screen blend
+        out[y0:y1, x0:x1] = np.clip(bloom(lit, radius=max(4, board_h // 6)), 0.0, 1.0)
+    image = Image.fromarray((out * 255 + 0.5).astype(np.uint8), "RGB")
+    image.info["lettering"] = text # Lets the verifier skip reading text it did not have to guess
+    return image
+
+
+# --- Plate ---
+
+_plate: Optional[Plate] = None
+_plate_lock = threading.Lock()
+
+
+def locate_board(image: Image.Image, client=None):
+    """Asks a vision model for the blank board's corners; falls back to DEFAULT_QUAD."""
+    width, height = image.size
+    fallback = [(x * width, y * height) for x, y in DEFAULT_QUAD]
+    client = client or logic.get_client()
+    if client is None:
+        return fallback
+    try:
+        response = client.models.generate_content(
+            model=LOCATOR_MODEL,
+            contents=[LOCATOR_PROMPT, image],
+            config=types.GenerateContentConfig(response_mime_type="application/json", response_json_schema=CORNERS_SCHEMA),
+        )
+        corners = json.loads(response.text)["corners"]
+        quad = [(x / 1000 * width, y / 1000 * height) for x, y in corners]
+        homography([(0, 0), (1, 0), (1, 1), (0, 1)], quad) # Rejects degenerate quads
+        return quad
+    except Exception as e:
+        log.warning("Sign board not located, using default placement: %s", e)
+        return fallback
+
+
+def _store_plate(plate: Plate):
+    buffer = io.BytesIO()
+    plate.image.save(buffer, format="PNG")
+    state.set_bytes("lettering:plate", buffer.getvalue(), LETTERING_PLATE_TTL)
+    state.set_json("lettering:quad", plate.quad.tolist(), LETTERING_PLATE_TTL)
+
+
+def _load_plate() -> Optional[Plate]:
+    data, quad = state.get_bytes("lettering:plate"), state.get_json("lettering:quad")
+    if data is None or quad is None:
+        return None
+    with Image.open(io.BytesIO(data)) as img:
+        return Plate(img.copy(), quad)
+
+
+def has_plate() -> bool:
+    return _plate is not None or state.get_bytes("lettering:plate") is not None
+
+
+def get_plate() -> Optional[Plate]:
+    """The cached plate, generating (once per TTL, shared across replicas) if needed."""
+    global _plate
+    with _plate_lock:
+        if _plate is None:
+            _plate = _load_plate()
+        if _plate is None:
+            image = logic.generate_sign(BLANK_SIGN_TEXT)
+            if not image:
+                return None
+            _plate = Plate(image, locate_board(image))
+            _store_plate(_plate)
+        return _plate
+
+
+def reset_plate():
+    """Forgets the plate so the next lettering generates a fresh alley."""
+    global _plate
+    with _plate_lock:
+        _plate = None
+        state.backend.delete(state.KEY_PREFIX + "lettering:plate")
+        state.backend.delete(state.KEY_PREFIX + "lettering:quad")
+
+
+def letter_sign(sign_text: str) -> Optional[Image.Image]:
+    """Chapter 2 in local mode: the cached plate with `sign_text` lettered on its board."""
+    plate = get_plate()
+    if plate is None:
+        return None
+    return letter(plate, sign_text)
@@ -0,0 +1,286 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from metrics import percentile
+
+# Classroom load test: N simulated learners walk INIT -> CH1 ... CH6 -> END against
+# a running app, with think time between clicks and retries when a chapter fails.
+#
+#   # Offline: spawn the app on the fake model backend and ramp 1 -> 16 learners
+#   uv run python loadtest.py run --spawn --levels 1,2,4,8,16 --slo-p95 8
+#
+#   # Against an already running instance
+#   uv run python loadtest.py run --url http://localhost:8000 --levels 4,8
+#
+# `serve` starts the app with every genai.Client replaced by fakes.FakeClient and
+# the reference solution wired in as logic, so nothing leaves the machine.
+
+JOURNEY = ["ch1", "ch2", "ch3", "ch4", "ch5", "ch6"]
+PROMPTS = {
+    "ch1": ["Cyberpunk cat detective, neon rain, trenchcoat", "Unit 9, gritty noir feline, rain-soaked alley"],
+    "ch2": ["THE TERMINAL"],
+    "ch3": ["High speed chase on cyber-bike", "Rooftop standoff over the megacity"],
+    "ch4": ["Hiding in shadows, volumetric lighting, chiaroscuro"],
+    "ch5": ["1980s Anime Style", "Cel Shaded manga panel"],
+    "ch6": ["Masterpiece, 8k resolution, highly detailed"],
+}
+
+
+# --- Server (fake backend) ---
+
+def serve(port: int):
+    import fakes
+    fakes.install()
+    os.environ["GRADIO_ANALYTICS_ENABLED"] = "False"
+    from solutions.final import logic as reference_logic
+    import pipeline
+    import app
+    # The load test sizes the deployment, not the learner's logic.py
+    pipeline.logic = reference_logic
+    app.logic = reference_logic
+    import warmup
+    warmup.start()
+    app.app.launch(server_name="127.0.0.1", server_port=port, quiet=True, **app.server_options())
+
+
+def spawn_server(port: int, fake_env: dict, timeout: float = 90.0):
+    env = {**os.environ, **{k: str(v) for k, v in fake_env.items()}}
+    proc = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "serve", "--port", str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}/readyz" # Only measure a warm instance
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Load-test server exited with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=2):
+                return proc, url
+        except OSError:
+            time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError(f"Load-test server did not become ready within {timeout:.0f}s")
+
+
+# --- Learners ---
+
+class Sample:
+    """One request made by a simulated learner."""
+
+    def __init__(self, level, learner, chapter, attempt, latency, queue_wait=None, ok=False, passed=False, error=None):
+        self.level = level
+        self.learner = learner
+        self.chapter = chapter
+        self.attempt = attempt
+        self.latency = latency
+        self.queue_wait = queue_wait
+        self.ok = ok
+        self.passed = passed
+        self.error = error
+
+
+class Learner:
+    def __init__(self, url, level, index, think_median, max_attempts, reference_path, seed=None):
+        self.url = url
+        self.level = level
+        self.index = index
+        self.think_median = think_median
+        self.max_attempts = max_attempts
+        self.reference_path = reference_path
+        self.rng = random.Random(seed)
+        self.samples = []
+
+    def think(self):
+        if self.think_median <= 0:
+            return
+        # Reading, typing and squinting at the render: right-skewed, capped
+        delay = self.rng.lognormvariate(0, 0.6) * self.think_median
+        time.sleep(min(delay, 5 * self.think_median))
+
+    def _call(self, client, chapter, attempt, api_name, *args):
+        start = time.perf_counter()
+        try:
+            result = client.predict(*args, api_name=api_name)
+        except Exception as e:
+            sample = Sample(self.level, self.index, chapter, attempt, time.perf_counter() - start, error=str(e)[:200])
+            self.samples.append(sample)
+            return sample
+        latency = time.perf_counter() - start
+        if chapter == "init":
+            passed = "OPTIMAL" in str(result)
+            sample = Sample(self.level, self.index, chapter, attempt, latency, ok=True, passed=passed)
+        else:
+            _, payload = result
+            server_time = payload.get("timings", {}).get("total", 0.0)
+            sample = Sample(
+                self.level, self.index, chapter, attempt, latency,
+                queue_wait=max(0.0, latency - server_time), ok=True, passed=bool(payload.get("success")),
+            )
+        self.samples.append(sample)
+        return sample
+
+    def run(self):
+        from gradio_client import Client, handle_file
+        client = Client(self.url, verbose=False, analytics_enabled=False, download_files=False)
+
+        if not self._call(client, "init", 1, "/run_diagnostics").passed:
+            return self.samples
+
+        for chapter in JOURNEY:
+            for attempt in range(1, self.max_attempts + 1):
+                self.think()
+                prompt = self.rng.choice(PROMPTS[chapter])
+                args = (prompt, handle_file(self.reference_path)) if chapter == "ch5" else (prompt,)
+                sample = self._call(client, chapter, attempt, f"/{chapter}", *args)
+                if sample.passed:
+                    break
+            else:
+                return self.samples # Gave up; the rest of the class moves on without them
+        return self.samples
+
+
+# --- Ramp & Report ---
+
+def run_level(url, level, think_median, max_attempts, reference_path, seed=0):
+    learners = [
+        Learner(url, level, i, think_median, max_attempts, reference_path, seed=seed * 1000 + i)
+        for i in range(level)
+    ]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=level) as pool:
+        list(pool.map(lambda learner: learner.run(), learners))
+    elapsed = time.perf_counter() - start
+    samples = [s for learner in learners for s in learner.samples]
+    finished = sum(1 for learner in learners if learner.samples and learner.samples[-1].chapter == "ch6" and learner.samples[-1].passed)
+    return samples, elapsed, finished
+
+
+def summarize(samples):
+    """Per-chapter latency percentiles, queue wait and error/pass rates."""
+    chapters = {}
+    for chapter in ["init"] + JOURNEY:
+        subset = [s for s in samples if s.chapter == chapter]
+        if not subset:
+            continue
+        latencies = [s.latency for s in subset if s.ok]
+        waits = [s.queue_wait for s in subset if s.queue_wait is not None]
+        chapters[chapter] = {
+            "requests": len(subset),
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "queue_wait_p50": percentile(waits, 50),
+            "queue_wait_p95": percentile(waits, 95),
+            "error_rate": sum(1 for s in subset if not s.ok) / len(subset),
+            "pass_rate": sum(1 for s in subset if s.passed) / len(subset),
+        }
+    return chapters
+
+
+def find_breakpoint(levels_report, slo_p95):
+    """First concurrency level whose worst chapter p95 exceeds the SLO (None if it always held)."""
+    for entry in levels_report:
+        worst = max((c["p95"] or 0.0 for name, c in entry["chapters"].items() if name != "init"), default=0.0)
+        if worst > slo_p95:
+            return entry["level"]
+    return None
+
+
+def _fmt(value):
+    return f"{'-':>6}" if value is None else f"{value:6.2f}"
+
+
+def print_report(report):
+    for entry in report["levels"]:
+        print(f"\n=== {entry['level']} concurrent learners — {entry['elapsed']:.1f}s, "
+              f"{entry['finished']}/{entry['level']} finished the journey ===")
+        print(f"{'chapter':8} {'reqs':>5} {'p50':>7} {'p95':>7} {'p99':>7} {'wait50':>7} {'wait95':>7} {'err%':>6} {'pass%':>6}")
+        for name, c in entry["chapters"].items():
+            print(f"{name:8} {c['requests']:5d} {_fmt(c['p50'])} {_fmt(c['p95'])} {_fmt(c['p99'])} "
+                  f"{_fmt(c['queue_wait_p50'])} {_fmt(c['queue_wait_p95'])} {c['error_rate'] * 100:6.1f} {c['pass_rate'] * 100:6.1f}")
+    slo = report["slo_p95"]
+    if report["breakpoint"] is None:
+        print(f"\np95 SLO of {slo:.1f}s held at every tested level (up to {report['levels'][-1]['level']} learners).")
+    else:
+        print(f"\np95 SLO of {slo:.1f}s first broken at {report['breakpoint']} concurrent learners.")
+
+
+def run(args):
+    levels = [int(x) for x in args.levels.split(",") if x.strip()]
+    proc = None
+    url = args.url
+    if args.spawn:
+        proc, url = spawn_server(args.port, {
+            "FAKE_IMAGE_LATENCY": args.fake_image_latency,
+            "FAKE_TEXT_LATENCY": args.fake_text_latency,
+            "FAKE_ERROR_RATE": args.fake_error_rate,
+            "FAKE_PASS_RATE": args.fake_pass_rate,
+        })
+    if not url:
+        raise SystemExit("Pass --url of a running app or --spawn to start one on the fake backend.")
+
+    reference = os.path.join(tempfile.mkdtemp(), "reference.png")
+    Image.new("RGB", (512, 512), (20, 0, 40)).save(reference)
+
+    report = {"url": url, "slo_p95": args.slo_p95, "levels": []}
+    try:
+        for i, level in enumerate(levels):
+            samples, elapsed, finished = run_level(url, level, args.think, args.max_attempts, reference, seed=i)
+            report["levels"].append({
+                "level": level, "elapsed": elapsed, "finished": finished, "chapters": summarize(samples),
+            })
+            if args.stop_on_breach and find_breakpoint(report["levels"][-1:], args.slo_p95) is not None:
+                break
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    report["breakpoint"] = find_breakpoint(report["levels"], args.slo_p95)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay classroom learner journeys against the app.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = sub.add_parser("serve", help="Run the app on the offline fake model backend")
+    serve_parser.add_argument("--port", type=int, default=8765)
+
+    run_parser = sub.add_parser("run", help="Ramp simulated learners and report latency")
+    run_parser.add_argument("--url", help="Base URL of a running app")
+    run_parser.add_argument("--spawn", action="store_true", help="Start a fake-backend server for the run")
+    run_parser.add_argument("--port", type=int, default=8765, help="Port for --spawn")
+    run_parser.add_argument("--levels", default="1,2,4,8", help="Comma-separated concurrent learner counts")
+    run_parser.add_argument("--think", type=float, default=3.0, help="Median think time between clicks (s)")
+    run_parser.add_argument("--max-attempts", type=int, default=3, help="Attempts per chapter before giving up")
+    run_parser.add_argument("--slo-p95", type=float, default=10.0, help="Per-chapter p95 latency SLO (s)")
+    run_parser.add_argument("--stop-on-breach", action="store_true", help="Stop ramping once the SLO breaks")
+    run_parser.add_argument("--json", help="Write the full report to this file")
+    run_parser.add_argument("--fake-image-latency", type=float, default=1.5)
+    run_parser.add_argument("--fake-text-latency", type=float, default=0.3)
+    run_parser.add_argument("--fake-error-rate", type=float, default=0.02)
+    run_parser.add_argument("--fake-pass-rate", type=float, default=0.85)
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        serve(args.port)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
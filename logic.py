@@ -1,8 +1,12 @@
 import os
+import logging
 from google import genai
 from google.genai import types
 from PIL import Image
-from typing import Optional
+import concurrency
+from typing import Optional, Union
+
+log = logging.getLogger(__name__)
 
 # Initialize Client (User will likely do this, but we provide a shared instance or they create their own)
 # We'll rely on strict strict naming
@@ -10,9 +14,9 @@ from typing import Optional
 def get_client():
     api_key = os.environ.get("GOOGLE_API_KEY")
     if not api_key:
-        print("⚠️ GOOGLE_API_KEY not found in environment.")
+        log.warning("GOOGLE_API_KEY not found in environment.")
         return None
-    return genai.Client(api_key=api_key)
+    return concurrency.client(api_key) # One pooled, guarded client per process (see concurrency.py)
 
 # --- Chapter 1: Ink & Fur ---
 def generate_hero(prompt: str) -> Optional[Image.Image]:
@@ -23,7 +27,7 @@ def generate_hero(prompt: str) -> Optional[Image.Image]:
     client = get_client()
     if not client: return None
     
-    print(f"Generating Hero with prompt: {prompt}")
+    log.info("Generating Hero with prompt: %s", prompt)
     
     # TODO: Implement generation logic
     # response = ...
@@ -49,7 +53,8 @@ def generate_wide_shot(prompt: str) -> Optional[Image.Image]:
     """
     Chapter 3: Generate a 16:9 wide shot.
     """
-    # TODO: Append "Aspect Ratio 16:9" or use config
+    # TODO: Ask for 16:9 in the config: types.GenerateContentConfig(image_config=types.ImageConfig(aspect_ratio="16:9"))
+    # (or, for models without ImageConfig, append "Aspect Ratio 16:9" to the prompt)
     return None
 
 # --- Chapter 4: Setting the Mood ---
@@ -60,15 +65,19 @@ def generate_lit_scene(prompt: str) -> Optional[Image.Image]:
     return None
 
 # --- Chapter 5: The Style Trap ---
-def generate_style_transfer(prompt: str, reference_image: Image.Image) -> Optional[Image.Image]:
+def generate_style_transfer(prompt: str, reference_image: Union[Image.Image, types.Part]) -> Optional[Image.Image]:
     """
     Chapter 5: Generate Unit 9 in a specific style using a reference image.
+    The app passes the reference pre-encoded as a Part; it goes into `contents` as-is.
     """
     return None
 
 # --- Chapter 6: The Masterpiece ---
-def generate_final(prompt: str) -> Optional[Image.Image]:
+def generate_final(prompt: str, reference_image: Union[Image.Image, types.Part] = None, draft: bool = False) -> Optional[Image.Image]:
     """
     Chapter 6: Generate a high-resolution masterpiece.
+    draft=True renders a quick 1K preview to iterate on; the accepted draft comes back
+    as `reference_image` and is re-rendered at full resolution.
     """
+    # TODO: Request the resolution natively: types.ImageConfig(image_size="4K") ("1K" for drafts)
     return None
@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+import contextlib
+import contextvars
+import logging.handlers
+import metrics
+
+# Structured, non-blocking logging.
+#
+# Request threads only put records on a bounded in-memory queue (QueueHandler); a
+# single listener thread formats them as one JSON object per line and writes them to
+# stderr. When the queue is full the record is dropped and counted
+# (log_dropped_total) rather than making the request wait on the terminal or the log
+# shipper. Records below WARNING can be sampled per level (LOG_SAMPLE_RATES).
+#
+# Fields bound with `bind(session_id=..., chapter=...)` are added to every record
+# logged inside the block, so model calls deep in logic.py carry the click they
+# belong to:
+#
+#   {"ts": "...", "level": "INFO", "logger": "concurrency", "event": "model_call",
+#    "session_id": "x1", "chapter": "ch3", "model": "...", "latency": 12.4, "outcome": "ok"}
+
+# --- Configuration ---
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json") # "json", or "text" for reading locally
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+# Fraction of records kept per level, e.g. "DEBUG=0.01,INFO=0.2". Unlisted levels keep everything.
+LOG_SAMPLE_RATES = os.environ.get("LOG_SAMPLE_RATES", "")
+
+_context = contextvars.ContextVar("log_context", default={})
+# Attributes every LogRecord has; anything else on a record came from `extra`
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def parse_rates(spec: str) -> dict:
+    """'DEBUG=0.01,INFO=0.5' -> {10: 0.01, 20: 0.5}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        level, _, rate = item.partition("=")
+        rates[logging.getLevelName(level.strip().upper())] = float(rate)
+    return rates
+
+
+@contextlib.contextmanager
+def bind(**fields):
+    """Adds `fields` to every record logged in this block (and in calls it makes)."""
+    token = _context.set({**_context.get(), **{k: v for k, v in fields.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def event(logger: logging.Logger, name: str, level: int = logging.INFO, **fields):
+    """Logs a named event with structured fields: event(log, "model_call", model=m, latency=1.2)."""
+    if logger.isEnabledFor(level):
+        logger.log(level, name, extra={"event": name, **fields}, stacklevel=2)
+
+
+# --- Handlers ---
+
+class SamplingFilter(logging.Filter):
+    """Keeps each record with its level's rate; runs before the record is queued."""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1.0)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        metrics.inc("log_sampled_out_total", level=record.levelname)
+        return False
+
+
+class ContextFilter(logging.Filter):
+    """Copies the bound fields onto the record on the calling thread."""
+
+    def filter(self, record):
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never waits: a full queue drops the record instead of blocking the request."""
+
+    def prepare(self, record):
+        # Resolve the message and traceback here, on the thread that has them, but
+        # leave the formatting (JSON encoding) to the listener thread
+        record = logging.makeLogRecord(vars(record))
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc("log_dropped_total")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, func, msg, bound context and extra fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "func": record.funcName,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = {k: v for k, v in vars(record).items() if k not in _RESERVED and not k.startswith("_")}
+        return line + (" " + " ".join(f"{k}={v}" for k, v in fields.items()) if fields else "")
+
+
+# --- Setup ---
+
+_listener = None
+_lock = threading.Lock()
+
+
+def setup(stream=None, level: str = None, fmt: str = None, rates: str = None, queue_size: int = None):
+    """Routes the root logger through the queue to `stream` (stderr). Safe to call more than once."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return _listener
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(TextFormatter() if (fmt or LOG_FORMAT) == "text" else JsonFormatter())
+        records = queue.Queue(maxsize=queue_size or LOG_QUEUE_SIZE)
+        handler = DroppingQueueHandler(records)
+        handler.addFilter(SamplingFilter(parse_rates(LOG_SAMPLE_RATES if rates is None else rates)))
+        handler.addFilter(ContextFilter())
+
+        root = logging.getLogger()
+        root.addHandler(handler)
+        root.setLevel(level or LOG_LEVEL)
+        logging.captureWarnings(True)
+
+        _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown)
+        return _listener
+
+
+def shutdown():
+    """Flushes what is queued and stops the listener thread."""
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        root = logging.getLogger()
+        for handler in [h for h in root.handlers if isinstance(h, DroppingQueueHandler)]:
+            root.removeHandler(handler)
+        with contextlib.suppress(queue.Full): # No room for the stop marker; the thread is a daemon
+            _listener.stop()
+        _listener = None
@@ -1,6 +1,181 @@
-def main():
-    print("Hello from app!")
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from PIL import Image
+import imaging
+import pipeline
+import ratelimit
+
+# Headless batch runner.
+#
+#   uv run python main.py jobs.jsonl --out out/ --concurrency 4 --rate 20
+#
+# Each line of the jobs file is a JSON object:
+#   {"id": "hero-1", "chapter": "ch1", "prompt": "Cyberpunk cat detective..."}
+#   {"chapter": "ch5", "prompt": "1980s Anime Style", "reference": "refs/unit9.png"}
+# `id` is optional (derived from the job contents) and names the output PNG, so it
+# must be unique and cannot contain a path separator; `reference` is resolved relative
+# to the jobs file. Finished job ids are appended to <out>/checkpoint.jsonl, so
+# re-running the same command skips them and only retries what did not finish.
+
+CHECKPOINT_FILE = "checkpoint.jsonl"
+RESULTS_FILE = "results.jsonl"
+
+
+def job_id(job: dict) -> str:
+    if job.get("id"):
+        return str(job["id"])
+    key = json.dumps({k: job.get(k) for k in ("chapter", "prompt", "reference")}, sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+def load_jobs(path: str) -> list[dict]:
+    jobs = []
+    seen = {}
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise SystemExit(f"{path}:{line_no}: invalid JSON ({e})")
+            if job.get("chapter") not in pipeline.CHAPTER_STEPS:
+                raise SystemExit(f"{path}:{line_no}: unknown chapter {job.get('chapter')!r}")
+            if job.get("reference"):
+                job["reference"] = os.path.join(base_dir, job["reference"])
+            job["id"] = job_id(job)
+            if "/" in job["id"] or "\\" in job["id"] or job["id"] in (".", ".."):
+                raise SystemExit(f"{path}:{line_no}: id {job['id']!r} cannot contain a path separator")
+            if job["id"] in seen:
+                raise SystemExit(f"{path}:{line_no}: duplicate id {job['id']!r} (first on line {seen[job['id']]})")
+            seen[job["id"]] = line_no
+            jobs.append(job)
+    return jobs
+
+
+def load_checkpoint(out_dir: str) -> set[str]:
+    done = set()
+    path = os.path.join(out_dir, CHECKPOINT_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["id"])
+                except (json.JSONDecodeError, KeyError):
+                    continue # A torn last line from an interrupted run
+    return done
+
+
+class BatchWriter:
+    """Appends results and checkpoint records as jobs finish (thread-safe)."""
+
+    def __init__(self, out_dir: str):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self._lock = threading.Lock()
+        self._results = open(os.path.join(out_dir, RESULTS_FILE), "a")
+        self._checkpoint = open(os.path.join(out_dir, CHECKPOINT_FILE), "a")
+
+    def write(self, job: dict, result: pipeline.ChapterResult):
+        record = {"id": job["id"], **result.to_dict(), "image": None}
+        if result.image is not None:
+            filename = f"{job['id']}.png"
+            result.image.save(os.path.join(self.out_dir, filename))
+            record["image"] = filename
+        with self._lock:
+            self._results.write(json.dumps(record) + "\n")
+            self._results.flush()
+            # Only checkpoint once the image and result line are on disk
+            self._checkpoint.write(json.dumps({"id": job["id"], "success": result.success}) + "\n")
+            self._checkpoint.flush()
+            os.fsync(self._checkpoint.fileno())
+
+    def close(self):
+        self._results.close()
+        self._checkpoint.close()
+
+
+def run_job(job: dict, bucket, retries: int) -> pipeline.ChapterResult:
+    # Encoded once per job; retries reuse the same bytes / uploaded file
+    reference = None
+    if job.get("reference"):
+        try:
+            with Image.open(job["reference"]) as src:
+                reference = imaging.prepare_reference(src)
+        except Exception as e:
+            # Not checkpointed (no image), so the next run retries it once the file is fixed
+            return pipeline.ChapterResult(job["chapter"], job["prompt"], message=f"Error: reference {job['reference']}: {e}")
+    attempt = 0
+    while True:
+        bucket.acquire()
+        try:
+            result = pipeline.run_chapter(job["chapter"], job["prompt"], reference)
+        except Exception as e:
+            result = pipeline.ChapterResult(job["chapter"], job["prompt"], message=f"Error: {e}")
+        if result.image is not None or attempt >= retries:
+            return result
+        attempt += 1
+
+
+def run_batch(jobs: list[dict], out_dir: str, concurrency: int = 2, rate: float = 0, retries: int = 1) -> dict:
+    """Runs jobs not yet in the checkpoint. Returns counts for the summary line."""
+    done = load_checkpoint(out_dir)
+    pending = [job for job in jobs if job["id"] not in done]
+    summary = {"total": len(jobs), "skipped": len(jobs) - len(pending), "passed": 0, "failed": 0, "errors": 0}
+    if not pending:
+        return summary
+
+    bucket = ratelimit.per_minute(rate)
+    writer = BatchWriter(out_dir)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            futures = {pool.submit(run_job, job, bucket, retries): job for job in pending}
+            for future in as_completed(futures):
+                job = futures[future]
+                result = future.result()
+                if result.image is None:
+                    # Not checkpointed: the next run retries it
+                    summary["errors"] += 1
+                    print(f"[{job['id']}] {job['chapter']} ERROR: {result.message}")
+                    continue
+                writer.write(job, result)
+                summary["passed" if result.success else "failed"] += 1
+                verdict = "PASS" if result.success else "FAIL"
+                print(f"[{job['id']}] {job['chapter']} {verdict} ({result.timings}) {result.message}")
+    finally:
+        writer.close()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-generate and verify chapter images without the UI.")
+    parser.add_argument("jobs", help="JSONL file of chapter jobs")
+    parser.add_argument("--out", default="batch_output", help="Output directory (images, results, checkpoint)")
+    parser.add_argument("--concurrency", type=int, default=2, help="Jobs in flight at once")
+    parser.add_argument("--rate", type=float, default=0, help="Max jobs started per minute (0 = unlimited)")
+    parser.add_argument("--retries", type=int, default=1, help="Extra attempts when no image is returned")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    jobs = load_jobs(args.jobs)
+    start = time.perf_counter()
+    summary = run_batch(jobs, args.out, args.concurrency, args.rate, args.retries)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Done in {elapsed:.1f}s: {summary['passed']} passed, {summary['failed']} failed verification, "
+        f"{summary['errors']} errors, {summary['skipped']} skipped (already in checkpoint) of {summary['total']}."
+    )
+    return 1 if summary["errors"] else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import os
+import math
+import json
+import threading
+from collections import deque
+
+# In-process metrics registry. Values are keyed by name plus a sorted tuple of labels,
+# so `metrics.inc("calls", model="x")` and `metrics.inc("calls", model="y")` are separate series.
+
+WINDOW = 1024 # Observations kept per series for percentiles
+# Required to read /metrics (header `x-metrics-token` or `?token=`); unset = not served
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers (q in 0..100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._observations = {}
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            series = self._observations.get(key)
+            if series is None:
+                series = self._observations[key] = {"count": 0, "sum": 0.0, "window": deque(maxlen=WINDOW)}
+            series["count"] += 1
+            series["sum"] += value
+            series["window"].append(value)
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def gauge(self, name, **labels):
+        with self._lock:
+            return self._gauges.get(_key(name, labels))
+
+    def snapshot(self):
+        """Returns every series as plain dicts, suitable for JSON."""
+        def label_dict(labels):
+            return dict(labels)
+
+        with self._lock:
+            counters = [{"name": n, "labels": label_dict(l), "value": v} for (n, l), v in self._counters.items()]
+            gauges = [{"name": n, "labels": label_dict(l), "value": v} for (n, l), v in self._gauges.items()]
+            observations = []
+            for (n, l), series in self._observations.items():
+                window = list(series["window"])
+                observations.append({
+                    "name": n,
+                    "labels": label_dict(l),
+                    "count": series["count"],
+                    "mean": series["sum"] / series["count"],
+                    "p50": percentile(window, 50),
+                    "p95": percentile(window, 95),
+                })
+        return {"counters": counters, "gauges": gauges, "observations": observations}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._observations.clear()
+
+
+registry = Registry()
+inc = registry.inc
+set_gauge = registry.set_gauge
+observe = registry.observe
+snapshot = registry.snapshot
+
+
+# --- Export ---
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, **extra):
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())) + "}"
+
+
+def prometheus(data: dict = None) -> str:
+    """The snapshot in the Prometheus text exposition format; observations become summaries."""
+    data = data or snapshot()
+    lines, typed = [], set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for kind, series in (("counter", data["counters"]), ("gauge", data["gauges"])):
+        for s in sorted(series, key=lambda s: s["name"]):
+            if s["value"] is None:
+                continue
+            declare(s["name"], kind)
+            lines.append(f"{s['name']}{_labels(s['labels'])} {s['value']}")
+    for s in sorted(data["observations"], key=lambda s: s["name"]):
+        declare(s["name"], "summary")
+        for field, quantile in (("p50", "0.5"), ("p95", "0.95")):
+            lines.append(f"{s['name']}{_labels(s['labels'], quantile=quantile)} {s[field]}")
+        lines.append(f"{s['name']}_sum{_labels(s['labels'])} {s['mean'] * s['count']}")
+        lines.append(f"{s['name']}_count{_labels(s['labels'])} {s['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def routes():
+    """GET /metrics (Prometheus text, or JSON with ?format=json) for METRICS_TOKEN holders (added to the app at launch)."""
+    from starlette.routing import Route
+    from starlette.responses import PlainTextResponse, Response
+
+    async def export(request):
+        token = request.headers.get("x-metrics-token") or request.query_params.get("token")
+        if not METRICS_TOKEN or token != METRICS_TOKEN:
+            return PlainTextResponse("Forbidden.", status_code=403)
+        headers = {"Cache-Control": "no-store"}
+        if request.query_params.get("format") == "json":
+            return Response(json.dumps(snapshot(), default=str), media_type="application/json", headers=headers)
+        return PlainTextResponse(prometheus(), media_type="text/plain; version=0.0.4", headers=headers)
+
+    return [Route("/metrics", export)]
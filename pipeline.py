@@ -0,0 +1,255 @@
+import io
+import os
+import json
+import time
+import hashlib
+import inspect
+import logging
+from PIL import Image
+import logic
+import verifier
+import imaging
+import metrics
+import ratelimit
+import state
+import lettering
+import concurrency
+import logs
+import similarity
+
+# Shared by every entry point (UI clicks, API calls, batch jobs) in this process,
+# and by every replica when STATE_BACKEND is shared.
+GENERATION_RATE_LIMIT = float(os.environ.get("GENERATION_RATE_LIMIT", "0")) # generations per minute, 0 = off
+generation_bucket = ratelimit.per_minute(GENERATION_RATE_LIMIT, shared_name="generation")
+# Cache TTLs in seconds (0 = off). Generation caching is off by default: learners
+# retrying the same prompt usually want a new render.
+GENERATION_CACHE_TTL = float(os.environ.get("GENERATION_CACHE_TTL", "0"))
+VERIFICATION_CACHE_TTL = float(os.environ.get("VERIFICATION_CACHE_TTL", str(24 * 3600)))
+NO_IMAGE = "No image generated."
+
+log = logging.getLogger(__name__)
+
+# Chapter registry shared by the UI, the batch runner and the API.
+# Functions are looked up on the modules at call time so a reloaded or patched
+# logic.py is always the one that runs.
+CHAPTER_STEPS = {
+    "ch1": (lambda prompt, ref: logic.generate_hero(prompt), lambda img, prompt: verifier.verify_hero(img)),
+    "ch2": (lambda prompt, ref: logic.generate_sign(prompt), lambda img, prompt: verifier.verify_sign_text(img, prompt)),
+    "ch3": (lambda prompt, ref: logic.generate_wide_shot(prompt), lambda img, prompt: verifier.verify_aspect_ratio(img)),
+    "ch4": (lambda prompt, ref: logic.generate_lit_scene(prompt), lambda img, prompt: verifier.verify_lighting(img)),
+    "ch5": (lambda prompt, ref: logic.generate_style_transfer(prompt, ref), lambda img, prompt: verifier.verify_style(img)),
+    "ch6": (lambda prompt, ref: _call(logic.generate_final, prompt, reference_image=ref), lambda img, prompt: verifier.verify_final(img)),
+}
+# Chapters whose generation takes a reference image (required for ch5; for ch6 it is
+# the accepted draft being finalized)
+REFERENCE_CHAPTERS = ("ch5", "ch6")
+
+# Chapters that can be produced without a model round trip (see lettering.py)
+LOCAL_STEPS = {
+    "ch2": lambda prompt, ref: lettering.letter_sign(prompt),
+}
+
+# Chapters with a quick, low-resolution draft pass for iterating on the prompt.
+# Drafts are never verified; finalizing re-renders the accepted draft at full
+# resolution (generate_chapter with the draft as reference) and only that is checked.
+DRAFT_STEPS = {
+    "ch6": lambda prompt: _call(logic.generate_final, prompt, draft=True),
+}
+
+def _call(func, prompt, **options):
+    """Passes only the options `func` declares, so logic.py written against the plain signature still runs."""
+    params = inspect.signature(func).parameters
+    takes_any = any(p.kind == p.VAR_KEYWORD for p in params.values())
+    return func(prompt, **{k: v for k, v in options.items() if v is not None and (takes_any or k in params)})
+
+class ChapterResult:
+    """Outcome of one generate + verify pass."""
+
+    def __init__(self, chapter, prompt, image=None, success=False, message="", timings=None, reference=None):
+        self.chapter = chapter
+        self.prompt = prompt
+        self.image = image
+        self.success = success
+        self.message = message
+        self.timings = timings or {}
+        self.reference = reference # The resolved content sent to the model, if any
+
+    def to_dict(self):
+        return {
+            "chapter": self.chapter,
+            "prompt": self.prompt,
+            "success": self.success,
+            "message": self.message,
+            "timings": self.timings,
+            "size": list(self.image.size) if self.image is not None else None,
+        }
+
+def resolve_reference(reference, client=None):
+    """Turns a PIL image, prepared reference or Part into what generate_style_transfer expects."""
+    if reference is None:
+        return None
+    if isinstance(reference, Image.Image):
+        reference = imaging.prepare_reference(reference)
+    if isinstance(reference, imaging.PreparedReference):
+        return reference.to_content(client)
+    return reference
+
+# --- Shared caches ---
+
+def _generation_key(chapter, prompt, reference):
+    digest = getattr(reference, "digest", None)
+    if chapter in REFERENCE_CHAPTERS and reference is not None and digest is None:
+        return None # Only prepared references have a stable identity
+    return "gen:" + hashlib.sha256(json.dumps([chapter, prompt, digest]).encode()).hexdigest()
+
+def _verification_key(chapter, image, prompt):
+    digest = hashlib.sha256(image.tobytes())
+    digest.update(json.dumps([chapter, prompt, image.mode, image.size]).encode())
+    return "verdict:" + digest.hexdigest()
+
+def _cached_image(key):
+    data = state.get_bytes(key) if key else None
+    metrics.inc("generation_cache_total", result="hit" if data else "miss")
+    if data is None:
+        return None
+    with Image.open(io.BytesIO(data)) as img:
+        return img.copy()
+
+def _cache_image(key, img):
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG", compress_level=1)
+    state.set_bytes(key, buffer.getvalue(), GENERATION_CACHE_TTL)
+
+def generate_chapter(chapter: str, prompt: str, reference=None, local: bool = False) -> ChapterResult:
+    """Runs only the generation half of a chapter step; the result is not yet verified.
+
+    With `local`, chapters in LOCAL_STEPS are rendered in-process (no model call once cached).
+    """
+    if chapter not in CHAPTER_STEPS:
+        raise ValueError(f"Unknown chapter '{chapter}'. Expected one of: {', '.join(CHAPTER_STEPS)}")
+    if local and chapter in LOCAL_STEPS:
+        return _generate_local(chapter, prompt)
+    generate = CHAPTER_STEPS[chapter][0]
+    timings = {}
+    if chapter in REFERENCE_CHAPTERS and isinstance(reference, Image.Image):
+        reference = imaging.prepare_reference(reference)
+    elif chapter not in REFERENCE_CHAPTERS:
+        reference = None
+
+    cache_key = _generation_key(chapter, prompt, reference) if GENERATION_CACHE_TTL > 0 else None
+    if cache_key:
+        start = time.perf_counter()
+        img = _cached_image(cache_key)
+        if img is not None:
+            timings["generate"] = round(time.perf_counter() - start, 3)
+            return ChapterResult(chapter, prompt, img, False, "", timings, None)
+
+    refusal = _wait_for_generation(timings)
+    if refusal:
+        return ChapterResult(chapter, prompt, None, False, refusal, timings, reference)
+
+    start = time.perf_counter()
+    concurrency.take_refusal()
+    with logs.bind(chapter=chapter):
+        if reference is not None:
+            reference = resolve_reference(reference, logic.get_client())
+        img = generate(prompt, reference)
+        timings["generate"] = round(time.perf_counter() - start, 3)
+        _log_generation(img, timings)
+    if img:
+        similarity.record_generation(chapter, prompt, img)
+    if img and cache_key:
+        _cache_image(cache_key, img)
+    message = "" if img else _no_image_message()
+    return ChapterResult(chapter, prompt, img or None, False, message, timings, reference)
+
+def _wait_for_generation(timings):
+    """Takes a token from the generation rate limit within the caller's deadline.
+
+    Returns why it could not (shown as MODEL UNAVAILABLE), or None once a token is taken.
+    """
+    deadline = concurrency.current()
+    start = time.perf_counter()
+    acquired = generation_bucket.acquire(timeout=None if deadline is None else max(0.0, deadline.remaining()))
+    timings["rate_limit_wait"] = round(time.perf_counter() - start, 3)
+    if acquired:
+        return None
+    metrics.inc("rate_limit_refused_total")
+    return f"The {deadline.seconds:.0f}s budget ran out waiting for the generation rate limit ({GENERATION_RATE_LIMIT:g}/min)."
+
+def _log_generation(img, timings):
+    logs.event(log, "generate", logging.INFO if img else logging.WARNING,
+               latency=timings["generate"], outcome="ok" if img else "no_image")
+
+def _no_image_message():
+    """Why generation came back empty: a model call that was refused or ran out of budget
+    (logic.py swallows the exception), or else the learner's code."""
+    return concurrency.take_refusal() or NO_IMAGE
+
+def complete_chapter(result: ChapterResult) -> ChapterResult:
+    """Verifies a generated result in place and records the verify timing."""
+    if result.image is None:
+        return result
+    start = time.perf_counter()
+    with logs.bind(chapter=result.chapter):
+        result.success, result.message = verify_chapter(result.chapter, result.image, result.prompt)
+        result.timings["verify"] = round(time.perf_counter() - start, 3)
+        logs.event(log, "verify", latency=result.timings["verify"], outcome="pass" if result.success else "fail")
+    return result
+
+def _generate_local(chapter, prompt):
+    timings = {}
+    if chapter == "ch2" and not lettering.has_plate():
+        # Only the first lettering generates (and pays for) the base plate
+        refusal = _wait_for_generation(timings)
+        if refusal:
+            return ChapterResult(chapter, prompt, None, False, refusal, timings)
+    start = time.perf_counter()
+    concurrency.take_refusal()
+    with logs.bind(chapter=chapter, mode="local"):
+        img = LOCAL_STEPS[chapter](prompt, None)
+        timings["generate"] = round(time.perf_counter() - start, 3)
+        _log_generation(img, timings)
+    return ChapterResult(chapter, prompt, img or None, False, "" if img else _no_image_message(), timings)
+
+def draft_chapter(chapter: str, prompt: str) -> ChapterResult:
+    """Renders an unverified draft; accept it by passing its image to generate_chapter as the reference."""
+    if chapter not in DRAFT_STEPS:
+        raise ValueError(f"Chapter '{chapter}' has no draft mode. Expected one of: {', '.join(DRAFT_STEPS)}")
+    timings = {}
+    refusal = _wait_for_generation(timings)
+    if refusal:
+        return ChapterResult(chapter, prompt, None, False, refusal, timings)
+    start = time.perf_counter()
+    concurrency.take_refusal()
+    with logs.bind(chapter=chapter, mode="draft"):
+        img = DRAFT_STEPS[chapter](prompt)
+        timings["generate"] = round(time.perf_counter() - start, 3)
+        _log_generation(img, timings)
+    message = "Draft ready. Finalize it to render and verify at full resolution." if img else _no_image_message()
+    return ChapterResult(chapter, prompt, img or None, False, message, timings)
+
+def run_chapter(chapter: str, prompt: str, reference=None, local: bool = False) -> ChapterResult:
+    """Generates and verifies one chapter image, timing each stage."""
+    return complete_chapter(generate_chapter(chapter, prompt, reference, local))
+
+def verify_chapter(chapter: str, image: Image.Image, prompt: str) -> tuple[bool, str]:
+    """Runs only the verification half of a chapter step, reusing a pass for identical
+    pixels (shared state) or a near-identical frame (this process, see similarity.py)."""
+    if VERIFICATION_CACHE_TTL <= 0:
+        return CHAPTER_STEPS[chapter][1](image, prompt)
+    key = _verification_key(chapter, image, prompt)
+    cached = state.get_json(key)
+    if cached is not None:
+        metrics.inc("verification_cache_total", result="hit")
+        return bool(cached[0]), cached[1]
+    near = similarity.reusable_verdict(chapter, image, prompt)
+    metrics.inc("verification_cache_total", result="near_duplicate" if near else "miss")
+    if near is not None:
+        return True, near
+    success, message = CHAPTER_STEPS[chapter][1](image, prompt)
+    if success:
+        # Failures are not cached: the verifier reports API errors as failures too
+        state.set_json(key, [True, message], VERIFICATION_CACHE_TTL)
+        similarity.record_verdict(chapter, image, prompt, message, VERIFICATION_CACHE_TTL)
+    return success, message
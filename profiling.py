@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import tempfile
+import threading
+import contextlib
+from collections import Counter
+from typing import Optional
+
+# Opt-in, per-request profiling for the UI handlers (see app.safe_handle/safe_stream).
+#
+# A profiled request gets a sampling profiler (a thread that records the handler
+# thread's stack every PROFILE_INTERVAL seconds) plus wall-clock stage timings. The
+# result is written as JSON to PROFILE_DIR, which keeps only the newest PROFILE_KEEP
+# profiles. Requests are profiled at PROFILE_SAMPLE_RATE, or always when the page
+# was opened with ?profile=<PROFILE_ADMIN_TOKEN>.
+#
+# Generator handlers may resume on a different worker thread after every yield, so
+# the profile follows the handler with attach()/detach() around each resumption.
+
+# --- Configuration ---
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0")) # Fraction of requests, 0 = off
+PROFILE_ADMIN_TOKEN = os.environ.get("PROFILE_ADMIN_TOKEN")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "comic_creator_profiles"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "200"))
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.005"))
+PROFILE_MAX_DEPTH = 64
+PROFILE_TOP_STACKS = 200 # Distinct stacks kept per profile file
+
+_active = threading.local()
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse(frame, max_depth: int = PROFILE_MAX_DEPTH) -> str:
+    """Root-first 'a;b;c' stack, the folded format flame-graph tools read."""
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class Profile:
+    """Samples and stage timings for one request."""
+
+    def __init__(self, name: str, interval: float = PROFILE_INTERVAL):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.name = name
+        self.interval = interval
+        self.stacks = Counter()
+        self.stages = []
+        self.started = time.time()
+        self.wall = None
+        self._start = time.perf_counter()
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name=f"profiler-{self.id}", daemon=True)
+
+    def start(self):
+        self._sampler.start()
+        return self
+
+    def attach(self):
+        """Profiles the calling thread until detach()."""
+        self._thread_id = threading.get_ident()
+        _active.profile = self
+
+    def detach(self):
+        self._thread_id = None
+        _active.profile = None
+
+    def stage(self, name: str, seconds: float):
+        self.stages.append([name, round(seconds, 4)])
+
+    def _sample(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            target = self._thread_id
+            if target is None or target == me:
+                continue
+            frame = sys._current_frames().get(target)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def finish(self):
+        self._stop.set()
+        self._sampler.join()
+        self.wall = time.perf_counter() - self._start
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "handler": self.name,
+            "started": self.started,
+            "wall": round(self.wall, 4) if self.wall is not None else None,
+            "interval": self.interval,
+            "samples": sum(self.stacks.values()),
+            "stages": self.stages,
+            "stacks": dict(self.stacks.most_common(PROFILE_TOP_STACKS)),
+        }
+
+
+# --- Deciding and recording ---
+
+def requested(request=None) -> bool:
+    """Whether this request should be profiled: the admin flag, else the sample rate."""
+    if PROFILE_ADMIN_TOKEN and request is not None:
+        params = getattr(request, "query_params", None) or {}
+        if params.get("profile") == PROFILE_ADMIN_TOKEN:
+            return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def begin(name: str, request=None) -> Optional[Profile]:
+    """A started Profile if this request is to be profiled, else None."""
+    return Profile(name).start() if requested(request) else None
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Times a block as a named stage of the current thread's profile (no-op when not profiling)."""
+    profile = getattr(_active, "profile", None)
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.stage(name, time.perf_counter() - start)
+
+
+def save(profile: Profile, directory: str = None, keep: int = None) -> str:
+    """Writes the profile and drops the oldest files beyond `keep`."""
+    directory = directory or PROFILE_DIR
+    keep = keep if keep is not None else PROFILE_KEEP
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{profile.id}.json")
+    with open(path, "w") as f:
+        json.dump(profile.to_dict(), f)
+    files = sorted(n for n in os.listdir(directory) if n.endswith(".json"))
+    for name in files[:max(0, len(files) - keep)]:
+        with contextlib.suppress(OSError):
+            os.remove(os.path.join(directory, name))
+    return path
+
+
+def slowest(limit: int = 20, directory: str = None) -> list[dict]:
+    """Summaries of the stored profiles with the longest wall time."""
+    directory = directory or PROFILE_DIR
+    if not os.path.isdir(directory):
+        return []
+    summaries = []
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue # Rotated away or half-written
+        data.pop("stacks", None)
+        summaries.append(data)
+    summaries.sort(key=lambda d: d.get("wall") or 0, reverse=True)
+    return summaries[:limit]
+
+
+def load(profile_id: str, directory: str = None) -> Optional[dict]:
+    directory = directory or PROFILE_DIR
+    if not profile_id.replace("-", "").isalnum():
+        return None
+    path = os.path.join(directory, f"{profile_id}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+# --- Admin view ---
+
+def routes():
+    """Admin-only pages listing the slowest recent profiles (added to the app at launch)."""
+    from html import escape
+    from starlette.routing import Route
+    from starlette.responses import HTMLResponse, PlainTextResponse
+
+    def allowed(request):
+        token = request.headers.get("x-profile-token") or request.query_params.get("token")
+        return bool(PROFILE_ADMIN_TOKEN) and token == PROFILE_ADMIN_TOKEN
+
+    async def index(request):
+        if not allowed(request):
+            return PlainTextResponse("Forbidden.", status_code=403)
+        try:
+            limit = int(request.query_params.get("limit", "20"))
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return PlainTextResponse("limit must be a positive integer.", status_code=400)
+        token = escape(request.query_params.get("token", ""))
+        rows = []
+        for p in slowest(limit):
+            stages = ", ".join(f"{escape(n)} {s:.3f}s" for n, s in p["stages"])
+            started = time.strftime("%H:%M:%S", time.localtime(p["started"]))
+            rows.append(
+                f"<tr><td>{started}</td><td>{escape(p['handler'])}</td><td>{p['wall']:.3f}s</td>"
+                f"<td>{p['samples']}</td><td>{stages}</td>"
+                f"<td><a href='/admin/profiles/{p['id']}.folded?token={token}'>stacks</a></td></tr>"
+            )
+        body = (
+            "<html><body style='font-family: monospace'><h3>Slowest recent requests</h3>"
+            "<table border=1 cellpadding=4><tr><th>started</th><th>handler</th><th>wall</th>"
+            "<th>samples</th><th>stages</th><th></th></tr>" + "".join(rows) + "</table></body></html>"
+        )
+        return HTMLResponse(body)
+
+    async def folded(request):
+        if not allowed(request):
+            return PlainTextResponse("Forbidden.", status_code=403)
+        data = load(request.path_params["profile_id"])
+        if data is None:
+            return PlainTextResponse("No such profile.", status_code=404)
+        lines = [f"{stack} {count}" for stack, count in data["stacks"].items()]
+        return PlainTextResponse("\n".join(lines) + "\n")
+
+    return [
+        Route("/admin/profiles", index),
+        Route("/admin/profiles/{profile_id}.folded", folded),
+    ]
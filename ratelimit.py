@@ -0,0 +1,105 @@
+import threading
+import time
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Takes tokens if available. Returns 0 on success, else seconds until they would be."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0, timeout: float = None) -> bool:
+        """Blocks until tokens are available. Returns False if `timeout` expires first."""
+        deadline = None if timeout is None else self._clock() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0.0:
+                return True
+            if deadline is not None:
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+class Unlimited:
+    """Drop-in bucket that never blocks."""
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        return 0.0
+
+    def acquire(self, tokens: float = 1.0, timeout: float = None) -> bool:
+        return True
+
+class SharedWindow:
+    """Fixed-window limiter kept in the shared state tier, so replicas draw from one budget.
+
+    Allows `capacity` acquisitions per window of `capacity / rate` seconds, which
+    approximates a TokenBucket with the same rate and burst. While the state tier
+    is unreachable, each process falls back to its own TokenBucket.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float = None, clock=time.time):
+        self.name = name
+        self.rate = rate
+        self.capacity = int(capacity if capacity is not None else max(1.0, rate))
+        self.window = self.capacity / rate
+        self._clock = clock
+        self._fallback = TokenBucket(rate, self.capacity)
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        import state
+        now = self._clock()
+        index = int(now // self.window)
+        try:
+            count = state.incr(f"ratelimit:{self.name}:{index}", ttl=self.window * 2)
+        except state.Unavailable:
+            return self._fallback.try_acquire(tokens)
+        if count <= self.capacity:
+            return 0.0
+        return (index + 1) * self.window - now
+
+    def acquire(self, tokens: float = 1.0, timeout: float = None) -> bool:
+        deadline = None if timeout is None else self._clock() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0.0:
+                return True
+            if deadline is not None:
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+def per_minute(limit: float, shared_name: str = None):
+    """Bucket allowing `limit` acquisitions per minute (0 or less = unlimited).
+
+    With `shared_name`, the budget lives in the shared state tier (see state.py)
+    whenever that is not process-local.
+    """
+    if not limit or limit <= 0:
+        return Unlimited()
+    if shared_name:
+        import state
+        if not isinstance(state.backend, state.MemoryBackend):
+            return SharedWindow(shared_name, limit / 60.0, capacity=max(1.0, limit / 60.0))
+    return TokenBucket(limit / 60.0, capacity=max(1.0, limit / 60.0))
@@ -0,0 +1,153 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+from PIL import Image
+from google.genai import types
+import artifacts
+import imaging
+
+# --- Configuration ---
+REFINE_MODEL = os.environ.get("REFINE_MODEL", "gemini-3-pro-image-preview")
+# Follow-up turns (instruction + answer) kept after the seed turn; older ones are evicted.
+REFINE_MAX_TURNS = int(os.environ.get("REFINE_MAX_TURNS", "4"))
+# Conversations kept in memory; the least recently used learner is dropped first.
+REFINE_MAX_SESSIONS = int(os.environ.get("REFINE_MAX_SESSIONS", "256"))
+# Inline parts above this size are moved to the Files API before a turn is sent,
+# so follow-ups carry file URIs instead of image bytes.
+INLINE_PART_LIMIT = 16 * 1024
+# The seed render is kept as an artifact id and only encoded (downscaled to this
+# longest side) when the learner first sends an edit.
+REFINE_SEED_MAX_SIDE = int(os.environ.get("REFINE_SEED_MAX_SIDE", "1536"))
+
+SEED_INSTRUCTION = (
+    "This is the current comic panel. It was rendered from the brief: '{brief}'. "
+    "Treat every following message as an edit to the most recent panel and reply with the edited image."
+)
+
+
+def _image_part(image: Image.Image) -> types.Part:
+    data = imaging.encode_preview(image, REFINE_SEED_MAX_SIDE, quality=90)
+    return types.Part.from_bytes(data=data, mime_type="image/jpeg")
+
+
+class SeedExpired(Exception):
+    """The render a conversation was seeded from is no longer stored."""
+
+
+def _image_from_response(response) -> Optional[Image.Image]:
+    """Helper to extract the first inline image from a chat response."""
+    if response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
+        for part in response.candidates[0].content.parts:
+            if part.inline_data and part.inline_data.data:
+                return Image.open(io.BytesIO(part.inline_data.data))
+    return None
+
+
+class RefinementSession:
+    """One learner's refinement conversation, seeded from their latest render (an artifact)."""
+
+    def __init__(self, chapter: str, brief: str, artifact_id: str, reference: Optional[types.Part] = None,
+                 store: "artifacts.ArtifactStore" = None):
+        self.chapter = chapter
+        self.brief = brief
+        self.artifact_id = artifact_id
+        self.reference = reference
+        self.store = store
+        self._seed = None
+        self.turns: list[types.Content] = []
+        self.lock = threading.Lock()
+
+    @property
+    def seed(self) -> list[types.Content]:
+        """The opening exchange, encoded from the stored render on first use."""
+        if self._seed is None:
+            image = (self.store or artifacts.store).image(self.artifact_id)
+            if image is None:
+                raise SeedExpired(f"Render {self.artifact_id} is no longer stored.")
+            parts = [types.Part.from_text(text=SEED_INSTRUCTION.format(brief=self.brief)), _image_part(image)]
+            if self.reference is not None:
+                parts.append(types.Part.from_text(text="Style/identity reference:"))
+                parts.append(self.reference)
+            self._seed = [
+                types.Content(role="user", parts=parts),
+                types.Content(role="model", parts=[types.Part.from_text(text="Understood. Send your edits.")]),
+            ]
+        return self._seed
+
+    @property
+    def history(self) -> list[types.Content]:
+        return self.seed + self.turns
+
+    def _compact(self, client, contents: list[types.Content]):
+        """Swaps large inline parts for uploaded file references, once per part."""
+        for content in contents:
+            for i, part in enumerate(content.parts or []):
+                blob = part.inline_data
+                if not blob or not blob.data or len(blob.data) <= INLINE_PART_LIMIT:
+                    continue
+                uploaded = client.files.upload(
+                    file=io.BytesIO(blob.data),
+                    config=types.UploadFileConfig(mime_type=blob.mime_type),
+                )
+                content.parts[i] = types.Part(
+                    file_data=types.FileData(file_uri=uploaded.uri, mime_type=blob.mime_type),
+                    thought_signature=part.thought_signature,
+                )
+
+    def _evict(self):
+        overflow = len(self.turns) - 2 * REFINE_MAX_TURNS
+        if overflow > 0:
+            del self.turns[:overflow]
+
+    def send(self, client, instruction: str) -> Optional[Image.Image]:
+        """Applies a follow-up instruction to the latest panel and returns the edited image."""
+        with self.lock:
+            self._compact(client, self.history)
+            chat = client.chats.create(model=REFINE_MODEL, history=self.history)
+            response = chat.send_message(instruction)
+            image = _image_from_response(response)
+
+            if response.candidates and response.candidates[0].content:
+                self.turns.append(types.Content(role="user", parts=[types.Part.from_text(text=instruction)]))
+                self.turns.append(response.candidates[0].content)
+                self._evict()
+            return image
+
+
+class RefinementStore:
+    """Per-session refinement conversations with LRU eviction."""
+
+    def __init__(self, max_sessions: int = REFINE_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, RefinementSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def start(self, session_id: str, chapter: str, brief: str, artifact_id: str,
+              reference: Optional[types.Part] = None) -> RefinementSession:
+        """Replaces the session's conversation with one seeded from a fresh render."""
+        session = RefinementSession(chapter, brief, artifact_id, reference)
+        with self._lock:
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id: str) -> Optional[RefinementSession]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+sessions = RefinementStore()
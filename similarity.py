@@ -0,0 +1,184 @@
+import os
+import time
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+from PIL import Image, ImageStat
+import metrics
+
+# Perceptual hashes of generated images, for spotting near-duplicates.
+#
+# Retries often come back as practically the same frame. Each image gets a 64-bit
+# difference hash (dHash): tiny edits, re-encoding and rescaling move it by a few
+# bits, a different composition by dozens. dHash ignores overall tone, so a
+# signature also carries the mean colour. Two frames are near-duplicates when their
+# hashes are within NEAR_DUPLICATE_DISTANCE bits (Hamming distance) and their tones
+# within NEAR_DUPLICATE_TONE (a darker relight is not the same picture). Frames with
+# no structure at all (blank, flat) get no signature.
+#
+# HashIndex answers "what is within d bits of this hash?" by multi-index hashing:
+# the hash is cut into d + 1 chunks, and any hash within d bits must match at least
+# one chunk exactly (pigeonhole). A query is d + 1 dict lookups plus a popcount per
+# candidate, well under a millisecond at a few hundred thousand entries.
+#
+# The pipeline keeps two indexes (in process, like the image cache):
+#   seen      every generated image, so repeats are counted (generations_indexed_total)
+#   verdicts  passing verifications, reused for near-identical frames (pipeline.verify_chapter)
+
+# --- Configuration ---
+HASH_SIZE = 8 # 8x8 gradients = 64 bits
+NEAR_DUPLICATE_DISTANCE = int(os.environ.get("NEAR_DUPLICATE_DISTANCE", "4")) # bits, 0 = identical hash only
+NEAR_DUPLICATE_TONE = int(os.environ.get("NEAR_DUPLICATE_TONE", "12")) # max per-channel difference of the mean colour
+FLAT_RANGE = 8 # Thumbnail brightness range below which a frame has no structure to hash
+SIMILARITY_INDEX_SIZE = int(os.environ.get("SIMILARITY_INDEX_SIZE", "200000")) # entries per index, oldest dropped
+# Chapters whose check hinges on detail 64 bits cannot see (one wrong letter on the
+# sign), so a near-duplicate never stands in for them
+FINE_DETAIL_CHAPTERS = tuple(c for c in os.environ.get("NEAR_DUPLICATE_EXCLUDE", "ch2").split(",") if c)
+
+
+def _thumbnail(image, size=HASH_SIZE):
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image.resize((size + 1, size), Image.Resampling.BOX, reducing_gap=2.0)
+
+
+def dhash(image: Image.Image, size: int = HASH_SIZE) -> int:
+    """Difference hash: one bit per horizontally adjacent pair of a (size+1) x size grayscale thumbnail."""
+    pixels = _thumbnail(image, size).convert("L").tobytes()
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            value = (value << 1) | (left > pixels[row * (size + 1) + col + 1])
+    return value
+
+
+def signature(image: Image.Image) -> Optional[tuple[int, tuple]]:
+    """(dhash, mean RGB) of the frame, or None for a frame with no structure.
+
+    Remembered in image.info (as lettering does), so each stage hashes a frame once.
+    """
+    if "similarity" not in image.info:
+        thumb = _thumbnail(image)
+        low, high = thumb.convert("L").getextrema()
+        tone = tuple(round(v) for v in ImageStat.Stat(thumb).mean)
+        image.info["similarity"] = None if high - low < FLAT_RANGE else (dhash(image), tone)
+    return image.info["similarity"]
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def same_tone(a: tuple, b: tuple, tolerance: int = None) -> bool:
+    tolerance = NEAR_DUPLICATE_TONE if tolerance is None else tolerance
+    return max(abs(x - y) for x, y in zip(a, b)) <= tolerance
+
+
+class HashIndex:
+    """Hamming-radius lookups over 64-bit hashes (multi-index hashing), bounded to `capacity` entries."""
+
+    def __init__(self, max_distance: int = NEAR_DUPLICATE_DISTANCE, capacity: int = SIMILARITY_INDEX_SIZE, bits: int = HASH_SIZE * HASH_SIZE):
+        self.max_distance = max_distance
+        self.capacity = capacity
+        # Chunk i covers bits [offsets[i], offsets[i + 1])
+        parts = max_distance + 1
+        self._offsets = [bits * i // parts for i in range(parts + 1)]
+        self._tables = [{} for _ in range(parts)] # chunk value -> {entry id, ...}
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict() # entry id -> (hash, payload), oldest first
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _chunks(self, value):
+        for i, (start, end) in enumerate(zip(self._offsets, self._offsets[1:])):
+            yield i, (value >> start) & ((1 << (end - start)) - 1)
+
+    def add(self, value: int, payload=None):
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = (value, payload)
+            for i, chunk in self._chunks(value):
+                self._tables[i].setdefault(chunk, set()).add(entry_id)
+            while len(self._entries) > self.capacity:
+                self._remove(*self._entries.popitem(last=False))
+
+    def _remove(self, entry_id, entry):
+        for i, chunk in self._chunks(entry[0]):
+            bucket = self._tables[i][chunk]
+            bucket.discard(entry_id)
+            if not bucket:
+                del self._tables[i][chunk]
+
+    def search(self, value: int, max_distance: int = None, where: Callable = None) -> list[tuple[int, object]]:
+        """(distance, payload) for every entry within max_distance bits, nearest first (newest first on ties)."""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        with self._lock:
+            candidates = set()
+            for i, chunk in self._chunks(value):
+                candidates.update(self._tables[i].get(chunk, ()))
+            found = []
+            for entry_id in candidates:
+                other, payload = self._entries[entry_id]
+                distance = hamming(value, other)
+                if distance <= max_distance and (where is None or where(payload)):
+                    found.append((distance, -entry_id, payload))
+        found.sort(key=lambda f: f[:2])
+        return [(distance, payload) for distance, _, payload in found]
+
+    def nearest(self, value: int, max_distance: int = None, where: Callable = None):
+        """The closest matching payload, or None."""
+        found = self.search(value, max_distance, where)
+        return found[0][1] if found else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for table in self._tables:
+                table.clear()
+
+
+seen = HashIndex()
+verdicts = HashIndex()
+
+
+def record_generation(chapter: str, prompt: str, image: Image.Image) -> Optional[dict]:
+    """Indexes a generated image; returns the earlier near-identical generation, if there was one."""
+    sig = signature(image)
+    if sig is None:
+        return None
+    value, tone = sig
+    earlier = seen.nearest(value, where=lambda p: p["chapter"] == chapter and same_tone(p["tone"], tone))
+    metrics.inc("generations_indexed_total", chapter=chapter, result="near_duplicate" if earlier else "new")
+    seen.add(value, {"chapter": chapter, "prompt": prompt, "size": image.size, "tone": tone, "at": time.time()})
+    return earlier
+
+
+def seen_before(image: Image.Image, max_distance: int = None) -> list[tuple[int, dict]]:
+    """Have we generated something like this? (distance, {chapter, prompt, size, tone, at}), nearest first."""
+    sig = signature(image)
+    if sig is None:
+        return []
+    return seen.search(sig[0], max_distance, where=lambda p: same_tone(p["tone"], sig[1]))
+
+
+def reusable_verdict(chapter: str, image: Image.Image, prompt: str) -> Optional[str]:
+    """The message of a passing verification of a near-identical frame (same chapter, prompt and size)."""
+    sig = None if chapter in FINE_DETAIL_CHAPTERS else signature(image)
+    if sig is None:
+        return None
+    value, tone = sig
+    now = time.time()
+    match = verdicts.nearest(value, where=lambda p: (p["chapter"], p["prompt"], p["size"]) == (chapter, prompt, image.size)
+                             and same_tone(p["tone"], tone) and p["expires"] > now)
+    return match["message"] if match else None
+
+
+def record_verdict(chapter: str, image: Image.Image, prompt: str, message: str, ttl: float):
+    sig = None if chapter in FINE_DETAIL_CHAPTERS else signature(image)
+    if sig is not None:
+        verdicts.add(sig[0], {"chapter": chapter, "prompt": prompt, "size": image.size, "tone": sig[1],
+                              "message": message, "expires": time.time() + ttl})
@@ -1,17 +1,22 @@
 import os
+import logging
 import io
 from google import genai
+from google.genai import errors
 from google.genai import types
 from PIL import Image
-from typing import Optional
+import concurrency
+from typing import Optional, Union
+
+log = logging.getLogger(__name__)
 
 # Initialize Client
 def get_client():
     api_key = os.environ.get("GOOGLE_API_KEY")
     if not api_key:
-        print("⚠️ GOOGLE_API_KEY not found in environment.")
+        log.warning("GOOGLE_API_KEY not found in environment.")
         return None
-    return genai.Client(api_key=api_key)
+    return concurrency.client(api_key) # One pooled, guarded client per process (see concurrency.py)
 
 def _get_image_from_response(response):
     """Helper to extract PIL Image from generate_content response."""
@@ -26,10 +31,48 @@ def _get_image_from_response(response):
         # For gemini-3-pro-image-preview, dynamic typing might return strict objects.
         # But generally, we look for bytes.
         
-    except Exception as e:
-        print(f"Error parsing response: {e}")
+    except Exception:
+        log.exception("Could not read an image from the response")
     return None
 
+IMAGE_MODEL = 'gemini-3-pro-image-preview'
+_prompt_only_models = set() # Models that rejected ImageConfig; they get prompt hints instead
+
+def _image_config(aspect_ratio=None, image_size=None):
+    """Structured image options: only an image back, at the requested shape and resolution."""
+    if not hasattr(types, "ImageConfig"): # Older SDKs
+        return types.GenerateContentConfig(response_modalities=["IMAGE"])
+    return types.GenerateContentConfig(
+        response_modalities=["IMAGE"],
+        image_config=types.ImageConfig(aspect_ratio=aspect_ratio, image_size=image_size),
+    )
+
+def _generate_image(client, contents, aspect_ratio=None, image_size=None, fallback_hint=""):
+    """
+    Asks for the image shape through the config. Models that reject ImageConfig are
+    retried (and from then on called) with `fallback_hint` appended to the prompt.
+    """
+    wants_config = aspect_ratio or image_size
+    if IMAGE_MODEL not in _prompt_only_models or not wants_config:
+        try:
+            return client.models.generate_content(
+                model=IMAGE_MODEL,
+                contents=contents,
+                config=_image_config(aspect_ratio, image_size)
+            )
+        except errors.ClientError as e:
+            if e.code != 400 or not wants_config:
+                raise
+            log.warning("%s rejected the image config, falling back to prompt hints: %s", IMAGE_MODEL, e)
+            response = _generate_image_with_hint(client, contents, fallback_hint)
+            _prompt_only_models.add(IMAGE_MODEL) # The config was the problem
+            return response
+    return _generate_image_with_hint(client, contents, fallback_hint)
+
+def _generate_image_with_hint(client, contents, hint):
+    contents = [contents[0] + hint] + list(contents[1:])
+    return client.models.generate_content(model=IMAGE_MODEL, contents=contents)
+
 # --- Chapter 1: Ink & Fur ---
 def generate_hero(prompt: str) -> Optional[Image.Image]:
     """
@@ -39,16 +82,13 @@ def generate_hero(prompt: str) -> Optional[Image.Image]:
     client = get_client()
     if not client: return None
     
-    print(f"Generating Hero with prompt: {prompt}")
+    log.info("Generating Hero with prompt: %s", prompt)
     
     try:
-        response = client.models.generate_content(
-            model='gemini-3-pro-image-preview',
-            contents=[prompt]
-        )
+        response = _generate_image(client, [prompt])
         return _get_image_from_response(response)
-    except Exception as e:
-        print(f"Error: {e}")
+    except Exception:
+        log.exception("Generation failed")
     
     return None
 
@@ -64,13 +104,10 @@ def generate_sign(sign_text: str) -> Optional[Image.Image]:
     full_prompt = f"{base_prompt} A neon sign above it reads: '{sign_text}'"
     
     try:
-        response = client.models.generate_content(
-            model='gemini-3-pro-image-preview',
-            contents=[full_prompt]
-        )
+        response = _generate_image(client, [full_prompt])
         return _get_image_from_response(response)
-    except Exception as e:
-        print(f"Error: {e}")
+    except Exception:
+        log.exception("Generation failed")
     return None
 
 # --- Chapter 3: The Wide Angle ---
@@ -81,17 +118,12 @@ def generate_wide_shot(prompt: str) -> Optional[Image.Image]:
     client = get_client()
     if not client: return None
     
-    # Codelab Instruction: "Append aspect ratio to the prompt"
-    full_prompt = prompt + " Aspect Ratio 16:9"
-    
+    # The aspect ratio goes in the config; the prompt hint is only the fallback
     try:
-        response = client.models.generate_content(
-            model='gemini-3-pro-image-preview',
-            contents=[full_prompt]
-        )
+        response = _generate_image(client, [prompt], aspect_ratio="16:9", fallback_hint=" Aspect Ratio 16:9")
         return _get_image_from_response(response)
-    except Exception as e:
-        print(f"Error: {e}")
+    except Exception:
+        log.exception("Generation failed")
     return None
 
 # --- Chapter 4: Setting the Mood ---
@@ -103,17 +135,20 @@ def generate_lit_scene(prompt: str) -> Optional[Image.Image]:
     return None
 
 # --- Chapter 5: The Style Trap ---
-def generate_style_transfer(prompt: str, reference_image: Image.Image) -> Optional[Image.Image]:
+def generate_style_transfer(prompt: str, reference_image: Union[Image.Image, types.Part]) -> Optional[Image.Image]:
     """
     Chapter 5: Generate Unit 9 in a specific style using a reference image.
+    The app passes the reference pre-encoded as a Part; it goes into `contents` as-is.
     """
     # TODO: Implement in Chapter 5
     return None
 
 # --- Chapter 6: The Masterpiece ---
-def generate_final(prompt: str) -> Optional[Image.Image]:
+def generate_final(prompt: str, reference_image: Union[Image.Image, types.Part] = None, draft: bool = False) -> Optional[Image.Image]:
     """
     Chapter 6: Generate a high-resolution masterpiece.
+    draft=True renders a quick 1K preview to iterate on; the accepted draft comes back
+    as `reference_image` and is re-rendered at full resolution.
     """
     # TODO: Implement in Chapter 6
     return None
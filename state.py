@@ -0,0 +1,462 @@
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import sqlite3
+import argparse
+import threading
+import socketserver
+from urllib.parse import urlparse
+from typing import Optional
+import metrics
+import logs
+
+# Shared state tier for running several app replicas behind a load balancer.
+# Holds learner progress, the generation/verification caches and rate-limit
+# windows, so a learner keeps their progress and cache hits whichever replica
+# serves them.
+#
+#   STATE_BACKEND=memory://                      single process (default)
+#   STATE_BACKEND=sqlite:///var/lib/comic.db     replicas on one host / shared volume
+#   STATE_BACKEND=redis://cache:6379/0           any Redis-protocol server
+#
+# `python state.py serve --port 6380` runs a small Redis-protocol server backed by
+# memory, which is enough to try the multi-replica setup without installing Redis.
+#
+# The tier is a cache, not a dependency: while the backend is unreachable, reads
+# miss and writes are skipped (state_errors_total), so clicks keep working.
+
+log = logging.getLogger(__name__)
+
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "memory://")
+KEY_PREFIX = os.environ.get("STATE_KEY_PREFIX", "comic:")
+# Memory and SQLite have no background expiry; they drop expired keys every N writes (0 = only on read)
+STATE_PURGE_EVERY = int(os.environ.get("STATE_PURGE_EVERY", "1000"))
+# After a backend error, calls skip the backend for this long instead of each waiting on it
+STATE_RETRY_AFTER = float(os.environ.get("STATE_RETRY_AFTER", "5"))
+
+
+class MemoryBackend:
+    """Process-local backend with per-key expiry."""
+
+    def __init__(self, purge_every: int = STATE_PURGE_EVERY):
+        self.purge_every = purge_every
+        self._writes = 0
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires is not None and expires <= now:
+            del self._data[key]
+            return None
+        return item
+
+    def _wrote(self, now):
+        # Caller holds the lock
+        self._writes += 1
+        if self.purge_every and self._writes % self.purge_every == 0:
+            self._purge(now)
+
+    def _purge(self, now):
+        expired = [key for key, (_, expires) in self._data.items() if expires is not None and expires <= now]
+        for key in expired:
+            del self._data[key]
+        return len(expired)
+
+    def purge(self) -> int:
+        """Deletes expired keys that were never read again."""
+        with self._lock:
+            return self._purge(time.time())
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._live(key, time.time())
+            return item[0] if item else None
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        with self._lock:
+            now = time.time()
+            self._data[key] = (value, now + ttl if ttl else None)
+            self._wrote(now)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key: str, ttl: Optional[float] = None) -> int:
+        """Atomically increments an integer counter; `ttl` applies when the key is created."""
+        with self._lock:
+            now = time.time()
+            item = self._live(key, now)
+            count = int(item[0]) + 1 if item else 1
+            expires = item[1] if item else (now + ttl if ttl else None)
+            self._data[key] = (str(count).encode(), expires)
+            self._wrote(now)
+            return count
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend:
+    """File-backed backend; every process pointed at the same file shares it."""
+
+    def __init__(self, path: str, purge_every: int = STATE_PURGE_EVERY):
+        self.path = path
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB, expires REAL)")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _wrote(self):
+        with self._lock:
+            self._writes += 1
+            due = self.purge_every and self._writes % self.purge_every == 0
+        if due:
+            self.purge()
+
+    def get(self, key: str) -> Optional[bytes]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)", (key, time.time())
+            ).fetchone()
+            if row is None:
+                return None
+            return str(row[0]).encode() if isinstance(row[0], int) else bytes(row[0])
+        finally:
+            conn.close()
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl if ttl else None),
+            )
+        finally:
+            conn.close()
+        self._wrote()
+
+    def delete(self, key: str):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+        finally:
+            conn.close()
+
+    def incr(self, key: str, ttl: Optional[float] = None) -> int:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM kv WHERE key = ? AND expires IS NOT NULL AND expires <= ?", (key, now))
+            conn.execute(
+                "INSERT INTO kv (key, value, expires) VALUES (?, 1, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+                (key, now + ttl if ttl else None),
+            )
+            count = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        self._wrote()
+        return int(count)
+
+    def purge(self) -> int:
+        """Deletes expired keys (SQLite has no background expiry)."""
+        conn = self._connect()
+        try:
+            return conn.execute("DELETE FROM kv WHERE expires IS NOT NULL AND expires <= ?", (time.time(),)).rowcount
+        finally:
+            conn.close()
+
+    def close(self):
+        pass
+
+
+# --- Redis protocol (RESP2) ---
+
+class RedisError(Exception):
+    pass
+
+
+def _encode_command(*args) -> bytes:
+    out = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        out.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+    return b"".join(out)
+
+
+def _read_reply(stream):
+    line = stream.readline()
+    if not line:
+        raise ConnectionError("Connection closed by server")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        raise RedisError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        data = stream.read(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        count = int(body)
+        return None if count < 0 else [_read_reply(stream) for _ in range(count)]
+    raise RedisError(f"Unexpected reply: {line!r}")
+
+
+class RedisBackend:
+    """Minimal Redis client (GET/SET/DEL/INCR/PEXPIRE), one connection per thread."""
+
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0, password: Optional[str] = None, timeout: float = 5.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = (sock, sock.makefile("rb"))
+            self._local.conn = conn
+            if self.password:
+                self._call_on(conn, "AUTH", self.password)
+            if self.db:
+                self._call_on(conn, "SELECT", self.db)
+        return conn
+
+    def _call_on(self, conn, *commands):
+        sock, stream = conn
+        if commands and not isinstance(commands[0], tuple):
+            commands = (commands,)
+        sock.sendall(b"".join(_encode_command(*c) for c in commands))
+        replies = [_read_reply(stream) for _ in commands]
+        return replies[0] if len(replies) == 1 else replies
+
+    def execute(self, *commands):
+        """Sends one command (args) or a pipeline (tuples of args); reconnects once on a dropped socket."""
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                return self._call_on(conn, *commands)
+            except RedisError:
+                self.close() # Unread pipeline replies would desync the connection
+                raise
+            except (ConnectionError, OSError):
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.execute("GET", key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        if ttl:
+            self.execute("SET", key, value, "PX", int(ttl * 1000))
+        else:
+            self.execute("SET", key, value)
+
+    def delete(self, key: str):
+        self.execute("DEL", key)
+
+    def incr(self, key: str, ttl: Optional[float] = None) -> int:
+        if not ttl:
+            return self.execute("INCR", key)
+        # Pipelined; the expiry is refreshed on every call, which is fine for window keys
+        count, _ = self.execute(("INCR", key), ("PEXPIRE", key, int(ttl * 1000)))
+        return count
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            try:
+                conn[0].close()
+            except OSError:
+                pass
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    """Tiny Redis-protocol server over a MemoryBackend, for local multi-replica runs and tests."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 6380)):
+        self.store = MemoryBackend()
+        super().__init__(address, _RespHandler)
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        store = self.server.store
+        while True:
+            try:
+                command = _read_reply(self.rfile)
+            except (ConnectionError, RedisError):
+                return
+            name, args = command[0].decode().upper(), command[1:]
+            try:
+                reply = self._dispatch(store, name, args)
+            except Exception as e:
+                reply = RedisError(str(e))
+            self.wfile.write(_encode_reply(reply))
+
+    def _dispatch(self, store, name, args):
+        if name == "PING":
+            return "PONG"
+        if name in ("SELECT", "AUTH"):
+            return "OK"
+        if name == "GET":
+            return store.get(args[0].decode())
+        if name == "SET":
+            ttl = int(args[3]) / 1000 if len(args) > 3 and args[2].upper() == b"PX" else None
+            store.set(args[0].decode(), args[1], ttl)
+            return "OK"
+        if name == "DEL":
+            store.delete(args[0].decode())
+            return 1
+        if name == "INCR":
+            return store.incr(args[0].decode())
+        if name == "PEXPIRE":
+            key = args[0].decode()
+            with store._lock:
+                item = store._data.get(key)
+                if item is None:
+                    return 0
+                store._data[key] = (item[0], time.time() + int(args[1]) / 1000)
+            return 1
+        raise RedisError(f"ERR unknown command '{name}'")
+
+
+def _encode_reply(reply) -> bytes:
+    if isinstance(reply, RedisError):
+        return f"-{reply}\r\n".encode()
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    if isinstance(reply, str):
+        return f"+{reply}\r\n".encode()
+    return f"${len(reply)}\r\n".encode() + reply + b"\r\n"
+
+
+# --- Factory & helpers ---
+
+def from_url(url: str):
+    parsed = urlparse(url)
+    if parsed.scheme in ("", "memory"):
+        return MemoryBackend()
+    if parsed.scheme == "sqlite":
+        return SQLiteBackend(parsed.path if parsed.netloc == "" else parsed.netloc + parsed.path)
+    if parsed.scheme == "redis":
+        db = int(parsed.path.lstrip("/") or 0)
+        return RedisBackend(parsed.hostname or "localhost", parsed.port or 6379, db, parsed.password)
+    raise ValueError(f"Unsupported STATE_BACKEND '{url}'. Use memory://, sqlite:///path or redis://host:port/db")
+
+
+backend = from_url(STATE_BACKEND)
+
+BACKEND_ERRORS = (OSError, RedisError, sqlite3.Error) # OSError covers refused and dropped connections
+
+
+class Unavailable(RuntimeError):
+    """The state backend could not be reached (raised by incr, which has no safe default)."""
+
+
+_down_until = 0.0
+
+
+def _call(operation: str, method: str, *args):
+    """Runs a backend call; raises Unavailable (counted) on a backend error or while backing off after one."""
+    global _down_until
+    if time.monotonic() < _down_until:
+        metrics.inc("state_errors_total", operation=operation, reason="backoff")
+        raise Unavailable("State backend unavailable; retrying shortly.")
+    try:
+        return getattr(backend, method)(*args)
+    except BACKEND_ERRORS as e:
+        _down_until = time.monotonic() + STATE_RETRY_AFTER
+        metrics.inc("state_errors_total", operation=operation, reason="error")
+        logs.event(log, "state_error", logging.WARNING, operation=operation, error=f"{type(e).__name__}: {e}")
+        raise Unavailable(str(e)) from e
+
+
+def get_bytes(key: str) -> Optional[bytes]:
+    """The stored value, or None when missing, expired or the backend is unreachable."""
+    try:
+        return _call("read", "get", KEY_PREFIX + key)
+    except Unavailable:
+        return None
+
+
+def set_bytes(key: str, value: bytes, ttl: Optional[float] = None):
+    """Stores the value; skipped when the backend is unreachable."""
+    try:
+        _call("write", "set", KEY_PREFIX + key, value, ttl)
+    except Unavailable:
+        pass
+
+
+def get_json(key: str):
+    raw = get_bytes(key)
+    return json.loads(raw) if raw is not None else None
+
+
+def set_json(key: str, value, ttl: Optional[float] = None):
+    set_bytes(key, json.dumps(value).encode(), ttl)
+
+
+def incr(key: str, ttl: Optional[float] = None) -> int:
+    """Raises Unavailable when the backend is unreachable."""
+    return _call("write", "incr", KEY_PREFIX + key, ttl)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared state tier utilities.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve", help="Run a local Redis-protocol server")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args(argv)
+
+    server = RespServer((args.host, args.port))
+    print(f"Redis-protocol state server on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import os
+import time
+import itertools
+from html import escape
+
+# The SYSTEM LOG terminal. Handlers send one entry per update (format_entry) and
+# the component appends it in the browser, keeping the last TERMINAL_LOG_LINES
+# entries. A long session therefore never re-sends its history: each update
+# costs one entry, and the page never holds more than the cap.
+#
+# The component's value is always the newest entry, so event listeners that take
+# the terminal as an input (the chapter unlocks) still see the latest status.
+
+# --- Configuration ---
+TERMINAL_LOG_LINES = int(os.environ.get("TERMINAL_LOG_LINES", "200"))
+
+COLORS = {
+    "info": "#0aff0a",     # Matrix Green
+    "success": "#0aff0a",  # Matrix Green
+    "warning": "#ffff00",  # Yellow
+    "error": "#ff2a2a"     # Alert Red
+}
+
+_sequence = itertools.count(1) # Makes repeated messages distinct updates
+
+
+def entry(message: str, level: str = "info") -> dict:
+    return {"seq": next(_sequence), "ts": time.time(), "level": level if level in COLORS else "info", "text": message}
+
+
+def render(item: dict) -> str:
+    """One entry as a terminal line; the level and sequence number ride along as data attributes."""
+    stamp = time.strftime("%H:%M:%S", time.localtime(item["ts"]))
+    text = escape(item["text"], quote=False).replace("\n", "<br>")
+    return (
+        f"<div class='log-entry' data-seq='{item['seq']}' data-level='{item['level']}' "
+        f"style='color: {COLORS[item['level']]}; font-family: Share Tech Mono, monospace;'>"
+        f"<span class='log-time'>[{stamp}]</span> {text}</div>"
+    )
+
+
+def format_entry(message: str, level: str = "info") -> str:
+    return render(entry(message, level))
+
+
+# --- Component ---
+
+TEMPLATE = "<div class='terminal-lines'></div>" # Static, so updates never re-render the lines
+
+# Appends each new value's entries and drops the oldest beyond max_lines
+APPEND_JS = """
+const lines = element.querySelector('.terminal-lines');
+const box = element.closest('.terminal-log-box') || element;
+const append = () => {
+    if (!props.value) return;
+    const incoming = document.createElement('div');
+    incoming.innerHTML = props.value;
+    for (const node of Array.from(incoming.children)) lines.appendChild(node);
+    while (lines.children.length > props.max_lines) lines.firstElementChild.remove();
+    box.scrollTop = box.scrollHeight;
+};
+append();
+watch('value', append);
+"""
+
+
+def component(**kwargs):
+    """The terminal as a Gradio HTML component (import deferred so this module stays light)."""
+    import gradio as gr
+    return gr.HTML(
+        html_template=TEMPLATE,
+        js_on_load=APPEND_JS,
+        max_lines=TERMINAL_LOG_LINES,
+        **kwargs,
+    )
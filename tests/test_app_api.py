@@ -0,0 +1,177 @@
+import sys
+import os
+import inspect
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+class TestChapterApi(unittest.TestCase):
+    def test_one_endpoint_per_chapter(self):
+        self.assertEqual(sorted(app.API_ENDPOINTS), ["ch1", "ch2", "ch3", "ch4", "ch5", "ch6"])
+        for endpoint in app.API_ENDPOINTS.values():
+            self.assertTrue(endpoint.__doc__)
+
+    @patch('pipeline.logic.generate_wide_shot', return_value=Image.new("RGB", (1600, 900)))
+    def test_returns_image_file_verdict_and_timings(self, mock_generate):
+        image, result = app.api_ch3("cyber-bike chase")
+
+        self.assertTrue(os.path.exists(image.path))
+        self.assertTrue(result["success"])
+        self.assertEqual(result["size"], [1600, 900])
+        for stage in ("generate", "verify", "total"):
+            self.assertIn(stage, result["timings"])
+
+    @patch('pipeline.logic.generate_hero', return_value=None)
+    def test_missing_image_returns_null(self, mock_generate):
+        image, result = app.api_ch1("cat")
+
+        self.assertIsNone(image)
+        self.assertFalse(result["success"])
+
+    @patch('pipeline.logic.generate_hero', side_effect=RuntimeError("boom"))
+    def test_errors_surface_as_gradio_errors(self, mock_generate):
+        with self.assertRaises(app.gr.Error):
+            app.api_ch1("cat")
+
+    def test_reference_file_is_closed_before_generation(self):
+        path = os.path.join(tempfile.mkdtemp(), "ref.png")
+        Image.new("RGB", (64, 64), (200, 0, 0)).save(path)
+        seen = []
+        def run_chapter(chapter, prompt, reference, local):
+            seen.append((getattr(reference, "fp", None), reference.size))
+            return app.pipeline.ChapterResult(chapter, prompt)
+
+        with patch('pipeline.run_chapter', side_effect=run_chapter):
+            app.api_ch5("anime", {"path": path})
+
+        self.assertEqual(seen, [(None, (64, 64))])
+
+    def test_unreadable_reference_is_a_gradio_error(self):
+        path = os.path.join(tempfile.mkdtemp(), "notes.txt")
+        with open(path, "w") as f:
+            f.write("not an image")
+        with self.assertRaises(app.gr.Error):
+            app.api_ch5("anime", {"path": path})
+
+    @patch('pipeline.logic.generate_wide_shot', return_value=Image.new("RGB", (1600, 900)))
+    def test_each_call_has_its_own_session(self, mock_generate):
+        with patch.object(app.artifacts, "store", app.artifacts.ArtifactStore(tempfile.mkdtemp(), session_cap=1)) as store:
+            first, _ = app.api_ch3("cyber-bike chase")
+            second, _ = app.api_ch3("cyber-bike chase")
+
+            self.assertTrue(os.path.exists(first.path)) # Not evicted by the second caller
+            sessions = store.session_ids()
+            self.assertEqual(len(sessions), 2)
+            self.assertTrue(all(s.startswith(app.API_SESSION_PREFIX) for s in sessions))
+            self.assertEqual(store.save_owners(), []) # Nothing an export could serve
+
+class TestUiHandlers(unittest.TestCase):
+    @patch('pipeline.logic.generate_wide_shot', return_value=Image.new("RGB", (100, 100)))
+    def test_handler_reports_verification_failure(self, mock_generate):
+        updates = list(app.handle_ch3("square"))
+
+        self.assertEqual(len(updates), 1) # Small renders skip the preview
+        img, log = updates[-1]
+        self.assertIsNotNone(img)
+        self.assertIn("FAILURE", log)
+
+    @patch('pipeline.logic.generate_final', return_value=Image.new("RGB", (3840, 2160), (90, 30, 200)))
+    @patch('verifier.verify_final', return_value=(True, "Crisp."))
+    def test_large_render_streams_preview_first(self, mock_verify, mock_generate):
+        (preview, preview_log), (full, log) = list(app.handle_ch6("masterpiece"))
+
+        self.assertTrue(preview.endswith(".jpg"))
+        self.assertLess(os.path.getsize(preview), 16 * 1024)
+        self.assertIn("Verifying", preview_log)
+        with Image.open(full) as img:
+            self.assertEqual(img.size, (3840, 2160))
+        self.assertIn("SUCCESS", log)
+
+    @patch('pipeline.logic.generate_hero', side_effect=RuntimeError("boom"))
+    def test_handler_errors_become_log(self, mock_generate):
+        img, log = list(app.handle_ch1("cat"))[-1]
+
+        self.assertIsNone(img)
+        self.assertIn("boom", log)
+
+class TestDraftThenFinalize(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        def generate_final(prompt, reference_image=None, draft=False):
+            self.calls.append({"draft": draft, "reference": reference_image})
+            return Image.new("RGB", (512, 512) if draft else (1024, 1024), (200, 40, 90))
+        patcher = patch('pipeline.logic.generate_final', generate_final)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('verifier.verify_final', return_value=(True, "Crisp."))
+    def test_only_the_final_render_is_verified(self, mock_verify):
+        path, log, draft = app.handle_ch6_draft("rooftop at dawn")
+        self.assertIn("DRAFT", log)
+        self.assertEqual(draft["prompt"], "rooftop at dawn")
+        mock_verify.assert_not_called()
+
+        full, log = list(app.handle_ch6("rooftop at dawn", draft))[-1]
+        self.assertTrue(self.calls[0]["draft"])
+        self.assertIsNotNone(self.calls[1]["reference"]) # The draft guides the final render
+        self.assertEqual(mock_verify.call_count, 1)
+        self.assertIn("SUCCESS", log)
+
+    @patch('verifier.verify_final', return_value=(True, "Crisp."))
+    def test_edited_prompt_ignores_stale_draft(self, mock_verify):
+        _, _, draft = app.handle_ch6_draft("rooftop at dawn")
+        list(app.handle_ch6("rooftop at dusk", draft))
+        self.assertIsNone(self.calls[1]["reference"])
+
+    @patch('pipeline.logic.generate_final', return_value=Image.new("RGB", (64, 64)))
+    def test_plain_signature_still_drafts(self, mock_generate):
+        mock_generate.__signature__ = inspect.signature(lambda prompt: None)
+        image, result = app.api_ch6("rooftop", draft=True)
+        mock_generate.assert_called_once_with("rooftop")
+        self.assertFalse(result["success"])
+        self.assertNotIn("verify", result["timings"])
+
+class TestProgress(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(app.state, "backend", app.state.MemoryBackend())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unlocks_are_restored_for_the_learner(self):
+        learner = app.restore_progress(None)[0]
+        app.advance("ch1", "SYSTEM_CHECK: OPTIMAL", learner)
+        app.advance("ch2", "VERIFICATION: SUCCESS", learner)
+        app.advance("ch3", "VERIFICATION: FAILURE", learner)
+
+        updates = app.restore_progress(learner)
+        self.assertEqual(updates[0], learner)
+        visible = [u["visible"] for u in updates[2:-1:2]] # content groups ch1..epilogue
+        self.assertEqual(visible, [True, True, False, False, False, False, False])
+        self.assertIn("CHAPTER 2", updates[-1])
+
+    @patch('verifier.verify_hero', return_value=(True, "Hero verified."))
+    @patch('pipeline.logic.generate_hero', return_value=Image.new("RGB", (64, 64), (200, 0, 0)))
+    def test_save_file_follows_the_learner_across_reloads(self, mock_generate, mock_verify):
+        store = app.artifacts.ArtifactStore(root=tempfile.mkdtemp(), sweep_interval=0)
+        with patch.object(app.artifacts, "store", store):
+            learner = app.restore_progress(None)[0]
+            tab = MagicMock(session_hash="tab1")
+            _, log = list(app.handle_ch1("cat", request=tab))[-1]
+            app.advance("ch2", log, learner, request=tab)
+            app.release_session(request=tab) # Reload: the old tab's session is dropped
+
+            self.assertIn(f"export/{learner}.cbz", app.export_links(learner))
+            self.assertEqual(list(store.pinned(learner)), ["ch1"])
+
+    def test_progress_never_moves_backwards(self):
+        app.record_progress("l1", "ch4")
+        app.record_progress("l1", "ch2")
+        self.assertEqual(app.load_progress("l1"), "ch4")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import sys
+import os
+import time
+import tempfile
+import unittest
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import artifacts
+import metrics
+
+def frame(side=10, color=(255, 0, 0)):
+    return Image.new("RGB", (side, side), color)
+
+class TestImageCache(unittest.TestCase):
+    def test_evicts_least_recently_used_over_budget(self):
+        cache = artifacts.ImageCache(budget=3 * 300) # three 10x10 RGB frames
+        for key in "abc":
+            cache.put(key, frame())
+        cache.get("a") # a is now most recent
+        cache.put("d", frame())
+
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertEqual(cache.bytes, 900)
+        self.assertEqual(metrics.registry.gauge("image_memory_bytes"), 900)
+
+    def test_oversized_image_is_not_cached(self):
+        cache = artifacts.ImageCache(budget=100)
+        cache.put("big", frame())
+        self.assertIsNone(cache.get("big"))
+        self.assertEqual(cache.bytes, 0)
+
+class TestArtifactStore(unittest.TestCase):
+    def setUp(self):
+        self.store = artifacts.ArtifactStore(
+            root=tempfile.mkdtemp(), budget=300, session_cap=3, ttl=60, sweep_interval=0
+        )
+
+    def test_put_writes_file_and_reloads_after_eviction(self):
+        first = self.store.put("s1", "ch1", frame(color=(1, 2, 3)))
+        self.store.put("s1", "ch2", frame()) # pushes the first frame out of memory
+
+        self.assertTrue(os.path.exists(first.path))
+        self.assertIsNone(self.store.cache.get(first.id))
+        self.assertEqual(self.store.image(first.id).getpixel((0, 0)), (1, 2, 3))
+
+    def test_session_cap_keeps_latest_verified_per_chapter(self):
+        kept = self.store.put("s1", "ch1", frame(), verified=True)
+        old = self.store.put("s1", "ch2", frame())
+        for _ in range(3):
+            self.store.put("s1", "ch2", frame())
+
+        remaining = self.store.session_artifacts("s1")
+        self.assertEqual(len(remaining), 3)
+        self.assertIn(kept.id, [a.id for a in remaining])
+        self.assertFalse(os.path.exists(old.path))
+        self.assertEqual(self.store.latest_verified("s1")["ch1"].id, kept.id)
+
+    def test_drop_session_deletes_files(self):
+        artifact = self.store.put("s1", "ch1", frame())
+        self.store.put("s2", "ch1", frame())
+        self.store.drop_session("s1")
+
+        self.assertFalse(os.path.exists(artifact.path))
+        self.assertEqual(self.store.usage()["artifacts"], 1)
+
+    def test_sweep_removes_expired(self):
+        artifact = self.store.put("s1", "ch1", frame())
+        artifact.created -= 120
+        os.utime(artifact.path, (time.time() - 120, time.time() - 120))
+
+        self.assertEqual(self.store.sweep(), 1)
+        self.assertFalse(os.path.exists(artifact.path))
+        self.assertEqual(self.store.session_artifacts("s1"), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,218 @@
+import sys
+import os
+import threading
+import unittest
+from unittest.mock import patch
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import concurrency
+import fakes
+import metrics
+import ratelimit
+import app
+from solutions.final import logic as reference_logic
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestAIMDLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = concurrency.AIMDLimiter("m", initial=4, minimum=1, maximum=8, latency_target=10, clock=self.clock)
+
+    def test_fast_successes_grow_additively(self):
+        for _ in range(4):
+            self.limiter.release(self.limiter.acquire())
+        self.assertAlmostEqual(self.limiter.limit, 5.0, delta=0.1) # About +1 per round of 4 calls
+
+    def test_throttling_halves_once_per_round(self):
+        tickets = [self.limiter.acquire() for _ in range(4)]
+        for ticket in tickets:
+            self.limiter.release(ticket, throttled=True, failed=True)
+        self.assertEqual(self.limiter.limit, 2.0)
+
+        # A call admitted after the cut may cut again
+        self.limiter.release(self.limiter.acquire(), throttled=True, failed=True)
+        self.assertEqual(self.limiter.limit, 1.0)
+        self.limiter.release(self.limiter.acquire(), throttled=True, failed=True)
+        self.assertEqual(self.limiter.limit, 1.0) # Never below the minimum
+
+    def test_latency_spike_counts_as_congestion(self):
+        ticket = self.limiter.acquire()
+        self.clock.now += 30
+        self.limiter.release(ticket)
+        self.assertEqual(self.limiter.limit, 2.0)
+
+    def test_other_failures_leave_the_limit(self):
+        self.limiter.release(self.limiter.acquire(), failed=True)
+        self.assertEqual(self.limiter.limit, 4.0)
+
+    def test_acquire_waits_for_a_slot(self):
+        limiter = concurrency.AIMDLimiter("one", initial=1, maximum=1)
+        ticket = limiter.acquire()
+        self.assertIsNone(limiter.acquire(timeout=0.01))
+        threading.Timer(0.05, limiter.release, args=(ticket,)).start()
+        self.assertIsNotNone(limiter.acquire(timeout=2))
+
+    def test_limit_is_a_metric(self):
+        self.assertEqual(metrics.registry.gauge("model_concurrency_limit", model="m"), 4.0)
+
+class TestManagedClient(unittest.TestCase):
+    def setUp(self):
+        concurrency.reset()
+        self.backend = fakes.install(fakes.FakeBackend(image_latency=0.05, text_latency=0, jitter=0, seed=1))
+        self.client = concurrency.ManagedClient(fakes.FakeClient())
+
+    def tearDown(self):
+        fakes.uninstall()
+        concurrency.reset()
+
+    def test_in_flight_calls_stay_under_the_limit(self):
+        limiter = concurrency.limiter_for("gemini-3-pro-image-preview")
+        limiter.limit = limiter.maximum = 2
+        peak = []
+        respond = self.backend.respond
+        def tracked(*args):
+            peak.append(limiter.in_flight)
+            return respond(*args)
+        self.backend.respond = tracked
+
+        threads = [threading.Thread(target=lambda: self.client.models.generate_content(
+            model="gemini-3-pro-image-preview", contents=["x"])) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(max(peak), 2)
+
+    def test_throttling_shrinks_the_model_limit(self):
+        self.backend.error_rate = 1.0
+        with self.assertRaises(fakes.FakeModelError):
+            self.client.models.generate_content(model="gemini-3-flash-preview", contents=["x"])
+        self.assertEqual(concurrency.limits()["gemini-3-flash-preview"], concurrency.CONCURRENCY_INITIAL / 2)
+        self.assertNotIn("gemini-3-pro-image-preview", concurrency.limits()) # Per model
+
+    def test_chats_and_passthrough(self):
+        chat = self.client.chats.create(model="gemini-3-pro-image-preview", history=[])
+        chat.send_message("add rain")
+        self.assertIn("gemini-3-pro-image-preview", concurrency.limits())
+        self.assertTrue(self.client.files.upload(file="x").uri.startswith("https://"))
+
+    def test_managed_is_idempotent(self):
+        self.assertIs(concurrency.managed(self.client), self.client)
+        self.assertIsNone(concurrency.managed(None))
+
+class HttpError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = concurrency.CircuitBreaker("m", threshold=3, window=60, cooldown=30, clock=self.clock)
+
+    def trip(self):
+        for _ in range(3):
+            self.breaker.allow()
+            self.breaker.record(False)
+
+    def test_opens_at_threshold_and_fails_fast(self):
+        self.trip()
+        self.assertEqual(self.breaker.state, concurrency.OPEN)
+        with self.assertRaisesRegex(concurrency.CircuitOpen, "Retry in 30s"):
+            self.breaker.allow()
+
+    def test_old_failures_fall_out_of_the_window(self):
+        for _ in range(2):
+            self.breaker.record(False)
+        self.clock.now += 61
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, concurrency.CLOSED)
+
+    def test_half_open_admits_one_probe(self):
+        self.trip()
+        self.clock.now += 30
+        self.breaker.allow() # The probe
+        with self.assertRaises(concurrency.CircuitOpen):
+            self.breaker.allow()
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, concurrency.CLOSED)
+
+    def test_failed_probe_reopens(self):
+        self.trip()
+        self.clock.now += 30
+        self.breaker.allow()
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, concurrency.OPEN)
+        self.assertEqual(metrics.registry.gauge("circuit_state", model="m"), 2)
+
+    def test_only_outages_count(self):
+        self.assertFalse(concurrency.is_outage(HttpError(400)))
+        self.assertTrue(concurrency.is_outage(HttpError(429)))
+        self.assertTrue(concurrency.is_outage(HttpError(500)))
+        self.assertTrue(concurrency.is_outage(TimeoutError("read timed out")))
+        self.assertTrue(concurrency.is_outage(ConnectionResetError()))
+        self.assertTrue(concurrency.is_outage(httpx.ReadTimeout("read timed out")))
+        self.assertTrue(concurrency.is_outage(httpx.ConnectError("refused")))
+        self.assertFalse(concurrency.is_outage(ValueError("bad config")))
+        self.assertFalse(concurrency.is_outage(KeyError("candidates")))
+
+class TestDeadlines(unittest.TestCase):
+    def setUp(self):
+        concurrency.reset()
+        self.backend = fakes.install(fakes.FakeBackend(image_latency=0, text_latency=0, seed=1))
+        self.client = concurrency.managed(fakes.FakeClient())
+
+    def tearDown(self):
+        fakes.uninstall()
+        concurrency.reset()
+
+    def test_remaining_budget_becomes_the_request_timeout(self):
+        with patch.object(self.backend, "respond", wraps=self.backend.respond) as respond:
+            with concurrency.within(concurrency.Deadline(20)):
+                self.client.models.generate_content(model="gemini-3-flash-preview", contents=["x"])
+        timeout = respond.call_args.args[2].http_options.timeout
+        self.assertTrue(19000 < timeout <= 20000)
+
+    def test_spent_budget_refuses_without_calling(self):
+        with patch.object(self.backend, "respond") as respond:
+            with concurrency.within(concurrency.Deadline(0)):
+                with self.assertRaises(concurrency.DeadlineExceeded):
+                    self.client.models.generate_content(model="gemini-3-flash-preview", contents=["x"])
+        respond.assert_not_called()
+        self.assertIn("budget", concurrency.take_refusal())
+        self.assertIsNone(concurrency.take_refusal())
+
+    def test_open_circuit_reaches_the_learner_as_a_clear_message(self):
+        breaker = concurrency.breaker_for(reference_logic.IMAGE_MODEL)
+        for _ in range(breaker.threshold):
+            breaker.record(False)
+        with patch('pipeline.logic.generate_hero', reference_logic.generate_hero), \
+             patch.object(self.backend, "respond") as respond:
+            img, log = list(app.handle_ch1("cat"))[-1]
+        respond.assert_not_called()
+        self.assertIsNone(img)
+        self.assertIn("MODEL UNAVAILABLE", log)
+        self.assertIn("Retry in", log)
+
+    def test_rate_limit_wait_is_bounded_by_the_click_deadline(self):
+        with patch('pipeline.generation_bucket', ratelimit.TokenBucket(rate=0.001, capacity=1)), \
+             patch('pipeline.logic.generate_hero', reference_logic.generate_hero), \
+             patch('app.CLICK_DEADLINE', 0.05), \
+             patch.object(self.backend, "respond", wraps=self.backend.respond) as respond:
+            list(app.handle_ch1("cat"))
+            img, log = list(app.handle_ch1("cat"))[-1]
+        self.assertEqual(respond.call_count, 2) # First click: generation and verification
+        self.assertIsNone(img)
+        self.assertIn("MODEL UNAVAILABLE", log)
+        self.assertIn("rate limit", log)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import sys
+import os
+import io
+import zipfile
+import tempfile
+import unittest
+from unittest.mock import patch
+from PIL import Image
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import artifacts
+import export
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.store = artifacts.ArtifactStore(root=tempfile.mkdtemp(), sweep_interval=0)
+        colors = {"ch1": (200, 0, 0), "ch3": (0, 200, 0), "ch6": (0, 0, 200)}
+        for chapter, color in colors.items():
+            self.store.put("s1", chapter, Image.new("RGB", (320, 180), color), verified=True)
+        self.store.put("s1", "ch2", Image.new("RGB", (64, 64)), verified=False) # Not exported
+        self.pages = export.session_pages("s1", self.store, dpi=40)
+
+    def test_pages_follow_templates(self):
+        self.assertEqual([p.name for p in self.pages], ["cover", "story"])
+        story = dict(zip([c for c, _ in export.TEMPLATES["story"]], self.pages[1].placements))
+        self.assertIsNotNone(story["ch1"][0])
+        self.assertIsNone(story["ch2"][0]) # Unverified panel leaves the slot empty
+
+    def test_png_stream_matches_composition(self):
+        page = self.pages[1]
+        data = b"".join(export.png_stream(page, tile_height=7))
+        img = Image.open(io.BytesIO(data))
+        self.assertEqual(img.size, page.size)
+        x0, y0, x1, y1 = page.placements[0][1]
+        self.assertEqual(img.getpixel(((x0 + x1) // 2, (y0 + y1) // 2)), (200, 0, 0))
+        self.assertEqual(img.getpixel((1, 1)), export.PAPER)
+
+    def test_strips_are_bounded(self):
+        strips = list(export.render_strips(self.pages[0], tile_height=16))
+        self.assertTrue(all(s.height <= 16 for s in strips))
+        self.assertEqual(sum(s.height for s in strips), self.pages[0].size[1])
+
+    def test_cbz_is_a_valid_archive(self):
+        data = b"".join(export.cbz_stream({"": self.pages}, tile_height=32))
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            names = archive.namelist()
+            self.assertEqual(names, ["page-01-cover.png", "page-02-story.png", "ComicInfo.xml"])
+            cover = Image.open(io.BytesIO(archive.read(names[0])))
+            self.assertEqual(cover.size, self.pages[0].size)
+
+    def test_pdf_structure(self):
+        data = b"".join(export.pdf_stream(self.pages, tile_height=32))
+        self.assertTrue(data.startswith(b"%PDF-1.4"))
+        self.assertTrue(data.rstrip().endswith(b"%%EOF"))
+        xref_at = int(data.rsplit(b"startxref\n", 1)[1].split(b"\n")[0])
+        self.assertTrue(data[xref_at:].startswith(b"xref"))
+        self.assertIn(b"/Count 2", data)
+
+    def test_batch_export_groups_sessions(self):
+        self.store.put("s2", "ch6", Image.new("RGB", (100, 100), (9, 9, 9)), verified=True)
+        with patch.object(export.artifacts, "store", self.store):
+            stream = export.export_sessions(["s1", "s2", "nobody"], "cbz")
+            data = b"".join(stream)
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            folders = {name.split("/")[0] for name in archive.namelist() if "/" in name}
+        self.assertEqual(folders, {"s1", "s2"})
+        self.assertIsNone(export.export_sessions(["nobody"], "pdf", self.store))
+
+class TestSaveFiles(unittest.TestCase):
+    def setUp(self):
+        self.store = artifacts.ArtifactStore(root=tempfile.mkdtemp(), sweep_interval=0)
+        patcher = patch.object(export.artifacts, "store", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(Starlette(routes=export.routes()))
+
+    def test_pins_outlive_the_session(self):
+        first = self.store.put("tab1", "ch1", Image.new("RGB", (64, 64), (200, 0, 0)), verified=True)
+        self.store.pin("learner", first)
+        latest = self.store.put("tab1", "ch1", Image.new("RGB", (64, 64), (0, 200, 0)), verified=True)
+        self.store.pin("learner", latest)
+        self.store.drop_session("tab1")
+
+        self.assertEqual(list(self.store.pinned("learner")), ["ch1"])
+        with Image.open(self.store.pinned("learner")["ch1"]) as saved:
+            self.assertEqual(saved.getpixel((0, 0)), (0, 200, 0))
+        self.assertEqual(self.client.get("/export/learner.cbz").status_code, 200)
+        self.assertEqual(self.client.get("/export/someone-else.pdf").status_code, 404)
+
+    def test_sweep_keeps_recent_save_files(self):
+        self.store.pin("learner", self.store.put("tab1", "ch1", Image.new("RGB", (8, 8)), verified=True))
+        self.store.sweep(max_age=0)
+        self.assertIn("ch1", self.store.pinned("learner"))
+        self.store.save_ttl = -1
+        self.store.sweep()
+        self.assertEqual(self.store.pinned("learner"), {})
+
+if __name__ == '__main__':
+    unittest.main()
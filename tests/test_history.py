@@ -0,0 +1,153 @@
+import sys
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from PIL import Image
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+import gradio as gr
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import artifacts
+import history
+import app
+
+def frame(color=(200, 40, 90), size=(1600, 900)):
+    return Image.new("RGB", size, color)
+
+class TestHistoryStore(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.artifacts = artifacts.ArtifactStore(root=self.root, sweep_interval=0, dedupe=False)
+        self.history = history.HistoryStore(self.artifacts, limit=3)
+
+    def record(self, prompt, session_id="s1", chapter="ch1", success=False, artifact=None):
+        artifact = artifact or self.artifacts.put(session_id, chapter, frame(), verified=success)
+        return self.history.record(session_id, chapter, prompt, frame(), artifact, success, "msg")
+
+    def test_attempts_are_numbered_newest_first(self):
+        for prompt in ("a", "b"):
+            self.record(prompt)
+        self.record("other chapter", chapter="ch3")
+
+        attempts = self.history.attempts("s1", "ch1")
+        self.assertEqual([(a.number, a.prompt) for a in attempts], [(2, "b"), (1, "a")])
+        self.assertEqual(self.history.attempts("s2", "ch1"), [])
+
+    def test_thumbnails_are_small(self):
+        attempt = self.record("a")
+        with Image.open(attempt.thumbnail) as thumb:
+            self.assertLessEqual(max(thumb.size), history.HISTORY_THUMB_SIDE)
+        self.assertLess(os.path.getsize(attempt.thumbnail), 16 * 1024)
+
+    def test_limit_drops_oldest_attempts_and_their_thumbnails(self):
+        first = self.record("a")
+        for prompt in "bcd":
+            self.record(prompt)
+        self.assertEqual([a.prompt for a in self.history.attempts("s1", "ch1")], ["d", "c", "b"])
+        self.assertFalse(os.path.exists(first.thumbnail))
+
+    def test_same_artifact_shares_a_thumbnail(self):
+        first = self.record("a")
+        again = self.record("a", artifact=self.artifacts.get(first.artifact_id))
+        self.assertEqual(again.thumbnail, first.thumbnail)
+        self.assertNotEqual(again.id, first.id)
+
+    def test_pages_are_clamped(self):
+        store = history.HistoryStore(self.artifacts, limit=50)
+        artifact = self.artifacts.put("s1", "ch1", frame())
+        for i in range(5):
+            store.record("s1", "ch1", str(i), frame(), artifact, False)
+        attempts, page, pages = store.page("s1", "ch1", page=9, size=2)
+        self.assertEqual((page, pages), (2, 3))
+        self.assertEqual([a.prompt for a in attempts], ["0"])
+
+    def test_sweep_keeps_thumbnails_of_live_attempts(self):
+        attempt = self.record("a")
+        os.utime(attempt.thumbnail, (0, 0))
+        self.artifacts.sweep(max_age=0) # Even once the render itself has expired
+        self.assertTrue(os.path.exists(attempt.thumbnail))
+        self.history.discard("s1")
+        self.assertFalse(os.path.exists(attempt.thumbnail))
+
+    def test_discard_deletes_thumbnails(self):
+        attempt = self.record("a")
+        self.history.discard("s1")
+        self.assertFalse(os.path.exists(attempt.thumbnail))
+        self.assertIsNone(self.history.get("s1", attempt.id))
+
+class TestStrip(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.artifacts = artifacts.ArtifactStore(root=self.root, sweep_interval=0)
+        self.history = history.HistoryStore(self.artifacts)
+
+    def test_page_references_lazy_thumbnails_only(self):
+        artifact = self.artifacts.put("s1", "ch1", frame())
+        for i in range(history.HISTORY_PAGE_SIZE + 1):
+            self.history.record("s1", "ch1", f"<b>cat {i}</b>", frame(), artifact, i % 2 == 0)
+
+        html = history.render("s1", "ch1", history=self.history)
+
+        self.assertEqual(html.count("class='history-item "), history.HISTORY_PAGE_SIZE)
+        self.assertEqual(html.count("loading='lazy'"), history.HISTORY_PAGE_SIZE)
+        self.assertNotIn("data:image", html)
+        self.assertNotIn("<b>cat", html) # Prompts are never markup
+        self.assertIn("PAGE 1/2", html)
+        self.assertIn("data-page='-1' disabled", html)
+        self.assertIn("cat 0", history.render("s1", "ch1", page=1, history=self.history))
+
+    def test_empty_strip(self):
+        self.assertIn("NO ATTEMPTS YET", history.render(None, "ch1", history=self.history))
+
+    def test_thumbnail_route(self):
+        attempt = self.history.record("s1", "ch1", "cat", frame(), self.artifacts.put("s1", "ch1", frame()), True)
+        client = TestClient(Starlette(routes=history.routes(self.history)))
+
+        response = client.get("/" + history.thumbnail_url("s1", attempt))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "image/jpeg")
+        self.assertIn("immutable", response.headers["cache-control"])
+        self.assertEqual(client.get(f"/history/s2/{attempt.id}.jpg").status_code, 404)
+
+class TestAppHistory(unittest.TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        for module, store in ((artifacts, artifacts.ArtifactStore(root=root, sweep_interval=0)), (history, history.HistoryStore())):
+            patcher = patch.object(module, "store", store)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.request = MagicMock(session_hash="learner1", query_params={})
+
+    @patch('pipeline.logic.generate_wide_shot', return_value=frame())
+    def test_each_click_is_recorded_and_can_be_restored_without_a_model_call(self, mock_generate):
+        for _ in range(2):
+            path, _ = list(app.handle_ch3("chase", request=self.request))[-1]
+
+        self.assertIn("#2", app.show_history("ch3", request=self.request))
+        first = history.store.attempts("learner1", "ch3")[-1]
+        restored, log = app.restore_attempt(gr.EventData(None, {"attempt": first.id}), request=self.request)
+
+        self.assertEqual(restored, artifacts.store.get(first.artifact_id).path)
+        self.assertIn("RESTORED: Attempt #1", log)
+        self.assertEqual(mock_generate.call_count, 2)
+
+    @patch('pipeline.logic.generate_wide_shot', return_value=frame())
+    def test_expired_attempt_keeps_the_current_render(self, mock_generate):
+        list(app.handle_ch3("chase", request=self.request))
+        attempt = history.store.attempts("learner1", "ch3")[0]
+        artifacts.store.drop_session("learner1")
+
+        restored, log = app.restore_attempt(gr.EventData(None, {"attempt": attempt.id}), request=self.request)
+
+        self.assertIsInstance(restored, dict) # gr.update()
+        self.assertIn("expired", log)
+
+    def test_paging_event(self):
+        html = app.history_page(gr.EventData(None, {"chapter": "ch1", "page": 3}), request=self.request)
+        self.assertIn("NO ATTEMPTS YET", html)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import sys
+import os
+import io
+import copy
+import unittest
+from unittest.mock import MagicMock
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import imaging
+
+class TestPrepareReference(unittest.TestCase):
+    def test_downscales_large_upload(self):
+        ref = imaging.prepare_reference(Image.new("RGB", (4000, 2000), (200, 10, 10)))
+        self.assertEqual(max(ref.size), imaging.REFERENCE_MAX_SIDE)
+        self.assertEqual(ref.source_size, (4000, 2000))
+        self.assertEqual(ref.mime_type, "image/jpeg")
+
+    def test_flattens_alpha(self):
+        ref = imaging.prepare_reference(Image.new("RGBA", (64, 64), (0, 255, 0, 128)))
+        self.assertEqual(ref.size, (64, 64))
+        self.assertTrue(ref.data.startswith(b"\xff\xd8"))
+
+    def test_digest_is_stable(self):
+        img = Image.new("RGB", (300, 200), (1, 2, 3))
+        self.assertEqual(imaging.prepare_reference(img).digest, imaging.prepare_reference(img).digest)
+
+    def test_preview_is_small_jpeg(self):
+        big = Image.new("RGB", (3840, 2160), (10, 200, 30))
+        data = imaging.encode_preview(big)
+
+        self.assertTrue(data.startswith(b"\xff\xd8"))
+        self.assertLess(len(data), 16 * 1024)
+        self.assertEqual(Image.open(io.BytesIO(data)).size, (imaging.PREVIEW_MAX_SIDE, 216))
+        self.assertTrue(imaging.needs_preview(big))
+        self.assertFalse(imaging.needs_preview(Image.new("RGB", (1024, 1024))))
+
+    def test_prepared_passthrough(self):
+        ref = imaging.prepare_reference(Image.new("RGB", (32, 32)))
+        self.assertIs(imaging.prepare_reference(ref), ref)
+        self.assertIs(copy.deepcopy(ref), ref)
+        self.assertIsNone(imaging.prepare_reference(None))
+
+    def test_part_is_built_once(self):
+        ref = imaging.prepare_reference(Image.new("RGB", (32, 32)))
+        self.assertIs(ref.as_part(), ref.as_part())
+        self.assertEqual(ref.as_part().inline_data.data, ref.data)
+
+    def test_large_reference_uploads_once(self):
+        ref = imaging.PreparedReference(b"x" * (imaging.REFERENCE_UPLOAD_BYTES + 1), (10, 10), (10, 10))
+        client = MagicMock()
+        client.files.upload.return_value = MagicMock(uri="https://files/ref-1")
+
+        first = ref.to_content(client)
+        second = ref.to_content(client)
+
+        client.files.upload.assert_called_once()
+        self.assertIs(first, second)
+        self.assertEqual(first.file_data.file_uri, "https://files/ref-1")
+
+    def test_small_reference_stays_inline(self):
+        ref = imaging.prepare_reference(Image.new("RGB", (32, 32)))
+        client = MagicMock()
+        self.assertIsNotNone(ref.to_content(client).inline_data)
+        client.files.upload.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
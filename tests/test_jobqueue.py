@@ -0,0 +1,143 @@
+import re
+import sys
+import os
+import time
+import tempfile
+import unittest
+from unittest.mock import patch
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jobqueue
+import metrics
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.queue = jobqueue.JobQueue(os.path.join(self.dir, "jobs.sqlite3"), lease_seconds=30, max_attempts=2)
+
+    def test_claims_oldest_first_and_reports_position(self):
+        first = self.queue.submit("ch1", "cat")
+        second = self.queue.submit("ch2", "THE TERMINAL")
+
+        self.assertEqual(self.queue.get(second).position, 1)
+        job = self.queue.claim("w1")
+        self.assertEqual(job.id, first)
+        self.assertEqual(job.status, jobqueue.RUNNING)
+        self.assertEqual(self.queue.get(second).position, 0)
+
+    def test_expired_lease_is_reclaimed(self):
+        job_id = self.queue.submit("ch1", "cat")
+        self.queue.claim("w1")
+        self.assertIsNone(self.queue.claim("w2"))
+
+        with patch("time.time", return_value=time.time() + 60):
+            job = self.queue.claim("w2")
+        self.assertEqual(job.id, job_id)
+        self.assertEqual(job.attempts, 2)
+        # The original worker lost its lease and can no longer write the result
+        self.assertFalse(self.queue.complete(job_id, "w1", True, "late", {}, None))
+
+    def test_fail_requeues_until_attempts_run_out(self):
+        job_id = self.queue.submit("ch1", "cat")
+        self.queue.claim("w1")
+        self.queue.fail(job_id, "w1", "429")
+        self.assertEqual(self.queue.get(job_id).status, jobqueue.QUEUED)
+
+        self.queue.claim("w1")
+        self.queue.fail(job_id, "w1", "429 again")
+        job = self.queue.get(job_id)
+        self.assertEqual(job.status, jobqueue.FAILED)
+        self.assertEqual(job.error, "429 again")
+
+    def test_stats_and_prune(self):
+        self.queue.submit("ch1", "cat")
+        done = self.queue.submit("ch1", "dog")
+        self.queue.claim("w1") # Claims the oldest ("cat")
+        stats = self.queue.stats()
+        self.assertEqual(stats["depth"], 1)
+        self.assertEqual(stats["running"], 1)
+        self.assertGreaterEqual(stats["oldest_queued_age"], 0)
+
+        self.queue.claim("w2")
+        self.queue.complete(done, "w2", True, "ok", {}, None)
+        with patch("time.time", return_value=time.time() + 10):
+            self.assertEqual(self.queue.prune(max_age=0), 1)
+        self.assertIsNone(self.queue.get(done))
+
+    def test_submit_refreshes_the_gauges(self):
+        metrics.registry.reset()
+        self.queue.submit("ch1", "cat")
+        self.assertEqual(metrics.registry.gauge("job_queue_depth"), 1)
+        self.queue.submit("ch1", "cat") # Within JOB_STATS_INTERVAL: no extra query
+        self.assertEqual(metrics.registry.gauge("job_queue_depth"), 1)
+        with patch('jobqueue.JOB_STATS_INTERVAL', 0):
+            self.queue.refresh_gauges()
+        self.assertEqual(metrics.registry.gauge("job_queue_depth"), 2)
+
+class TestWorker(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.queue = jobqueue.JobQueue(os.path.join(self.dir, "jobs.sqlite3"))
+
+    @patch('pipeline.logic.generate_final', return_value=Image.new("RGB", (2048, 2048), (120, 60, 200)))
+    @patch('verifier.verify_final', return_value=(True, "Crisp."))
+    def test_process_one_writes_preview_and_result(self, mock_verify, mock_generate):
+        job_id = self.queue.submit("ch6", "masterpiece", session_id="s1")
+        jobqueue.process_one(self.queue, "w1", self.dir)
+
+        job = self.queue.get(job_id)
+        self.assertEqual(job.status, jobqueue.DONE)
+        self.assertTrue(job.success)
+        self.assertTrue(os.path.exists(job.image_path))
+        self.assertTrue(os.path.exists(job.preview_path))
+        self.assertIn("verify", job.timings)
+
+    @patch('pipeline.logic.generate_hero', side_effect=RuntimeError("boom"))
+    def test_process_one_records_errors(self, mock_generate):
+        job_id = self.queue.submit("ch1", "cat")
+        jobqueue.process_one(self.queue, "w1", self.dir)
+
+        job = self.queue.get(job_id)
+        self.assertEqual(job.status, jobqueue.QUEUED) # Retried on the next claim
+        self.assertEqual(job.error, "boom")
+
+    def test_empty_queue(self):
+        self.assertIsNone(jobqueue.process_one(self.queue, "w1", self.dir))
+
+class TestQueuedClick(unittest.TestCase):
+    def setUp(self):
+        import app
+        self.app = app
+        self.queue = jobqueue.JobQueue(os.path.join(tempfile.mkdtemp(), "jobs.sqlite3"))
+
+    @patch('jobqueue.JOB_POLL_INTERVAL', 0.01)
+    def test_click_without_a_worker_gives_up_at_the_deadline(self):
+        with patch.object(self.app, "job_queue", self.queue), patch.object(self.app, "CLICK_DEADLINE", 0.1):
+            updates = list(self.app._handle_chapter_queued("ch1", "cat", session_id="s1"))
+
+        self.assertIn("JOB STILL QUEUED", updates[-1][1])
+        job_id = re.search(r"job id (\w+)", updates[-1][1]).group(1)
+        self.assertEqual(self.queue.get(job_id).status, jobqueue.QUEUED)
+
+    def test_preview_is_sent_once_while_verifying(self):
+        job_id = self.queue.submit("ch6", "masterpiece", session_id="s1")
+        self.queue.claim("w1")
+        preview_path = os.path.join(tempfile.mkdtemp(), "preview.jpg")
+        Image.new("RGB", (8, 8)).save(preview_path)
+        self.queue.progress(job_id, "w1", "verifying", preview_path)
+        job = self.queue.get(job_id)
+
+        with patch.object(self.app, "job_queue", self.queue), \
+             patch.object(self.queue, "watch", return_value=iter([job, job, job])), \
+             patch.object(self.app.artifacts.store, "put_preview", return_value="preview.jpg") as put_preview:
+            updates = list(self.app._handle_chapter_queued("ch6", "masterpiece", session_id="s1"))
+
+        put_preview.assert_called_once()
+        self.assertEqual(updates[0][0], "preview.jpg")
+        self.assertEqual([u[0] for u in updates[1:3]], [self.app.gr.update()] * 2)
+        self.assertIn("JOB STILL RUNNING", updates[-1][1])
+
+if __name__ == '__main__':
+    unittest.main()
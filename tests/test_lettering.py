@@ -0,0 +1,95 @@
+import sys
+import os
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lettering
+import pipeline
+import state
+import verifier
+
+class TestNumpyOps(unittest.TestCase):
+    def test_box_blur_matches_mean_filter(self):
+        a = np.random.default_rng(0).random((20, 30)).astype(np.float32)
+        blurred = lettering.box_blur(a, 2)
+        self.assertEqual(blurred.shape, a.shape)
+        self.assertAlmostEqual(float(blurred[10, 10]), float(a[8:13, 8:13].mean()), places=4)
+
+    def test_homography_maps_corners(self):
+        src = [(0, 0), (10, 0), (10, 5), (0, 5)]
+        dst = [(100, 40), (300, 60), (290, 120), (110, 110)]
+        matrix = lettering.homography(src, dst)
+        for (x, y), (u, v) in zip(src, dst):
+            p = matrix @ [x, y, 1]
+            self.assertAlmostEqual(p[0] / p[2], u, places=6)
+            self.assertAlmostEqual(p[1] / p[2], v, places=6)
+
+    def test_warp_identity(self):
+        layer = np.random.default_rng(1).random((8, 12, 3)).astype(np.float32)
+        out = lettering.warp(layer, np.eye(3), (0, 0, 12, 8))
+        np.testing.assert_allclose(out, layer, atol=1e-5)
+
+class TestLettering(unittest.TestCase):
+    def setUp(self):
+        base = Image.new("RGB", (640, 480), (15, 15, 25))
+        quad = [(200, 60), (440, 70), (440, 140), (200, 135)]
+        self.plate = lettering.Plate(base, quad)
+
+    def test_text_lands_on_the_board_only(self):
+        start = time.perf_counter()
+        img = lettering.letter(self.plate, "THE TERMINAL")
+        elapsed = time.perf_counter() - start
+
+        pixels = np.asarray(img)
+        self.assertGreater(pixels[70:130, 210:430].max(), 200) # Lit tubes
+        self.assertTrue((pixels[400:, :100] == [15, 15, 25]).all()) # Alley untouched
+        self.assertEqual(img.info["lettering"], "THE TERMINAL")
+        self.assertLess(elapsed, 1.0)
+
+    def test_verifier_trusts_matching_local_lettering(self):
+        img = lettering.letter(self.plate, "THE TERMINAL")
+        with patch('verifier.verify_image_content') as mock_model:
+            self.assertTrue(verifier.verify_sign_text(img, "THE TERMINAL")[0])
+            mock_model.assert_not_called()
+            mock_model.return_value = (False, "NO")
+            self.assertFalse(verifier.verify_sign_text(img, "THE EXIT")[0])
+
+class TestPlateCache(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(state, "backend", state.MemoryBackend())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        lettering._plate = None
+        self.addCleanup(setattr, lettering, "_plate", None)
+
+    @patch('lettering.logic.get_client', return_value=None) # Locator falls back to the default quad
+    @patch('lettering.logic.generate_sign', return_value=Image.new("RGB", (512, 512), (20, 20, 30)))
+    def test_plate_generated_once(self, mock_sign, mock_client):
+        first = pipeline.generate_chapter("ch2", "THE TERMINAL", local=True)
+        second = pipeline.generate_chapter("ch2", "OPEN 24H", local=True)
+
+        self.assertEqual(mock_sign.call_count, 1)
+        self.assertEqual(second.image.info["lettering"], "OPEN 24H")
+        self.assertIn("rate_limit_wait", first.timings)
+        self.assertNotIn("rate_limit_wait", second.timings)
+
+        lettering._plate = None # A fresh replica reloads the shared plate
+        pipeline.generate_chapter("ch2", "CLOSED", local=True)
+        self.assertEqual(mock_sign.call_count, 1)
+
+    def test_locator_reads_model_corners(self):
+        client = MagicMock()
+        client.models.generate_content.return_value.text = '{"corners": [[100, 100], [900, 100], [900, 300], [100, 300]]}'
+        quad = lettering.locate_board(Image.new("RGB", (1000, 500)), client)
+        self.assertEqual(quad[2], (900.0, 150.0))
+
+        client.models.generate_content.return_value.text = '{"verdict": "YES"}'
+        self.assertEqual(len(lettering.locate_board(Image.new("RGB", (1000, 500)), client)), 4)
+
+if __name__ == '__main__':
+    unittest.main()
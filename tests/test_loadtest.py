@@ -0,0 +1,57 @@
+import sys
+import os
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakes
+import loadtest
+from solutions.final import logic as reference_logic
+
+class TestFakeBackend(unittest.TestCase):
+    def setUp(self):
+        self.backend = fakes.install(fakes.FakeBackend(image_latency=0, text_latency=0, pass_rate=1.0, seed=1))
+
+    def tearDown(self):
+        fakes.uninstall()
+
+    def test_reference_logic_runs_offline(self):
+        img = reference_logic.generate_hero("cyberpunk cat")
+        self.assertIsNotNone(img)
+        self.assertEqual(img.size, (768, 768))
+
+    def test_wide_prompts_get_wide_frames(self):
+        img = reference_logic.generate_wide_shot("chase")
+        self.assertEqual(img.size, (1024, 576))
+
+    def test_injected_errors_raise(self):
+        self.backend.error_rate = 1.0
+        with self.assertRaises(fakes.FakeModelError):
+            fakes.FakeClient().models.generate_content(model="gemini-3-flash-preview", contents=["x"])
+
+class TestReport(unittest.TestCase):
+    def _samples(self, latencies, chapter="ch1"):
+        return [loadtest.Sample(1, i, chapter, 1, latency, queue_wait=0.1, ok=True, passed=True)
+                for i, latency in enumerate(latencies)]
+
+    def test_summary_percentiles_and_rates(self):
+        samples = self._samples([1.0, 2.0, 3.0, 4.0])
+        samples.append(loadtest.Sample(1, 9, "ch1", 2, 0.5, error="boom"))
+        summary = loadtest.summarize(samples)["ch1"]
+
+        self.assertEqual(summary["requests"], 5)
+        self.assertEqual(summary["p50"], 2.0)
+        self.assertEqual(summary["p95"], 4.0)
+        self.assertAlmostEqual(summary["error_rate"], 0.2)
+
+    def test_breakpoint_is_first_level_over_slo(self):
+        levels = [
+            {"level": 1, "chapters": loadtest.summarize(self._samples([1.0, 1.2]))},
+            {"level": 4, "chapters": loadtest.summarize(self._samples([2.0, 6.0]))},
+            {"level": 8, "chapters": loadtest.summarize(self._samples([9.0, 12.0]))},
+        ]
+        self.assertEqual(loadtest.find_breakpoint(levels, 5.0), 4)
+        self.assertIsNone(loadtest.find_breakpoint(levels, 20.0))
+
+if __name__ == '__main__':
+    unittest.main()
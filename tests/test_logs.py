@@ -0,0 +1,95 @@
+import io
+import sys
+import os
+import json
+import queue
+import logging
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logs
+import fakes
+import metrics
+import concurrency
+
+class TestStructuredLogs(unittest.TestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.log = logging.getLogger("test_logs")
+
+    def tearDown(self):
+        logs.shutdown()
+
+    def records(self):
+        logs.shutdown() # Drains the queue
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_bound_fields_and_events_are_json(self):
+        logs.setup(self.stream, level="INFO")
+        with logs.bind(session_id="s1", chapter="ch3"):
+            logs.event(self.log, "generate", latency=1.5, outcome="ok")
+        self.log.info("outside")
+
+        first, second = self.records()
+        self.assertEqual(first["event"], "generate")
+        self.assertEqual((first["session_id"], first["chapter"], first["latency"]), ("s1", "ch3", 1.5))
+        self.assertEqual(first["func"], "test_bound_fields_and_events_are_json")
+        self.assertNotIn("session_id", second)
+
+    def test_exceptions_keep_their_traceback(self):
+        logs.setup(self.stream)
+        try:
+            raise ValueError("bad pixels")
+        except ValueError:
+            self.log.exception("Generation failed")
+        [record] = self.records()
+        self.assertEqual(record["level"], "ERROR")
+        self.assertIn("ValueError: bad pixels", record["exc"])
+
+    def test_levels_are_sampled(self):
+        logs.setup(self.stream, rates="INFO=0")
+        before = metrics.registry.counter("log_sampled_out_total", level="INFO")
+        self.log.info("dropped")
+        self.log.warning("kept")
+        self.assertEqual([r["msg"] for r in self.records()], ["kept"])
+        self.assertEqual(metrics.registry.counter("log_sampled_out_total", level="INFO"), before + 1)
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = logs.DroppingQueueHandler(queue.Queue(maxsize=1))
+        before = metrics.registry.counter("log_dropped_total")
+        for _ in range(3):
+            handler.handle(logging.makeLogRecord({"msg": "x"}))
+        self.assertEqual(handler.queue.qsize(), 1)
+        self.assertEqual(metrics.registry.counter("log_dropped_total"), before + 2)
+
+    def test_parse_rates(self):
+        self.assertEqual(logs.parse_rates("debug=0.01, INFO=0.5"), {logging.DEBUG: 0.01, logging.INFO: 0.5})
+        self.assertEqual(logs.parse_rates(""), {})
+
+class TestModelCallEvents(unittest.TestCase):
+    def setUp(self):
+        concurrency.reset()
+        self.backend = fakes.install(fakes.FakeBackend(image_latency=0, text_latency=0, seed=1))
+        self.client = concurrency.managed(fakes.FakeClient())
+        self.stream = io.StringIO()
+        logs.setup(self.stream, level="INFO")
+
+    def tearDown(self):
+        logs.shutdown()
+        fakes.uninstall()
+        concurrency.reset()
+
+    def test_each_model_call_is_logged_with_its_click(self):
+        self.backend.error_rate = 1.0
+        with logs.bind(session_id="s2", chapter="ch1"):
+            with self.assertRaises(fakes.FakeModelError):
+                self.client.models.generate_content(model="gemini-3-flash-preview", contents=["x"])
+        logs.shutdown()
+        [call] = [json.loads(l) for l in self.stream.getvalue().splitlines() if '"model_call"' in l]
+        self.assertEqual((call["session_id"], call["chapter"], call["model"]), ("s2", "ch1", "gemini-3-flash-preview"))
+        self.assertEqual(call["outcome"], "throttled")
+        self.assertEqual(call["level"], "WARNING")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import sys
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+import pipeline
+
+class TestBatchRunner(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.out = os.path.join(self.tmp, "out")
+        self.jobs_path = os.path.join(self.tmp, "jobs.jsonl")
+        with open(self.jobs_path, "w") as f:
+            f.write(json.dumps({"id": "a", "chapter": "ch3", "prompt": "chase"}) + "\n")
+            f.write(json.dumps({"chapter": "ch3", "prompt": "bridge"}) + "\n")
+            f.write("\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_load_jobs_assigns_stable_ids(self):
+        jobs = main.load_jobs(self.jobs_path)
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(jobs[0]["id"], "a")
+        self.assertEqual(jobs[1]["id"], main.load_jobs(self.jobs_path)[1]["id"])
+
+    @patch('pipeline.logic.generate_wide_shot', return_value=Image.new("RGB", (160, 90)))
+    def test_run_writes_results_and_resumes_from_checkpoint(self, mock_generate):
+        jobs = main.load_jobs(self.jobs_path)
+
+        summary = main.run_batch(jobs, self.out, concurrency=2)
+        self.assertEqual(summary["passed"], 2)
+        self.assertEqual(mock_generate.call_count, 2)
+        self.assertTrue(os.path.exists(os.path.join(self.out, "a.png")))
+        with open(os.path.join(self.out, main.RESULTS_FILE)) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual({r["id"] for r in records}, {job["id"] for job in jobs})
+        self.assertIn("generate", records[0]["timings"])
+
+        summary = main.run_batch(jobs, self.out, concurrency=2)
+        self.assertEqual(summary["skipped"], 2)
+        self.assertEqual(mock_generate.call_count, 2)
+
+    @patch('pipeline.logic.generate_wide_shot', return_value=None)
+    def test_failed_generations_are_not_checkpointed(self, mock_generate):
+        jobs = main.load_jobs(self.jobs_path)
+        summary = main.run_batch(jobs, self.out, retries=1)
+
+        self.assertEqual(summary["errors"], 2)
+        self.assertEqual(mock_generate.call_count, 4)
+        self.assertEqual(main.load_checkpoint(self.out), set())
+
+    def write_jobs(self, *jobs):
+        with open(self.jobs_path, "w") as f:
+            f.writelines(json.dumps(job) + "\n" for job in jobs)
+
+    def test_ids_cannot_leave_the_output_directory(self):
+        for bad in ("../../x", "a\\b", ".."):
+            self.write_jobs({"id": bad, "chapter": "ch3", "prompt": "chase"})
+            with self.assertRaisesRegex(SystemExit, "path separator"):
+                main.load_jobs(self.jobs_path)
+
+    def test_duplicate_ids_are_rejected(self):
+        self.write_jobs({"id": "a", "chapter": "ch3", "prompt": "chase"}, {"id": "a", "chapter": "ch3", "prompt": "bridge"})
+        with self.assertRaisesRegex(SystemExit, "duplicate id 'a'"):
+            main.load_jobs(self.jobs_path)
+
+    @patch('pipeline.logic.generate_wide_shot', return_value=Image.new("RGB", (160, 90)))
+    def test_bad_reference_fails_only_its_job(self, mock_generate):
+        self.write_jobs({"id": "a", "chapter": "ch3", "prompt": "chase"},
+                        {"id": "b", "chapter": "ch5", "prompt": "anime", "reference": "/nonexistent.png"})
+        summary = main.run_batch(main.load_jobs(self.jobs_path), self.out)
+
+        self.assertEqual((summary["passed"], summary["errors"]), (1, 1))
+        self.assertEqual(main.load_checkpoint(self.out), {"a"})
+
+class TestPipeline(unittest.TestCase):
+    def test_unknown_chapter(self):
+        with self.assertRaises(ValueError):
+            pipeline.run_chapter("ch9", "x")
+
+    @patch('pipeline.logic.generate_style_transfer', return_value=Image.new("RGB", (64, 64)))
+    @patch('pipeline.logic.get_client', return_value=None)
+    def test_reference_is_encoded_before_generation(self, mock_client, mock_generate):
+        with patch('pipeline.verifier.verify_style', return_value=(True, "ok")):
+            result = pipeline.run_chapter("ch5", "anime", Image.new("RGB", (2048, 2048)))
+
+        self.assertTrue(result.success)
+        reference = mock_generate.call_args.args[1]
+        self.assertIsNotNone(reference.inline_data)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import sys
+import os
+import unittest
+from unittest.mock import patch
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+
+class TestMetricsExport(unittest.TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.client = TestClient(Starlette(routes=metrics.routes()))
+
+    def test_prometheus_text(self):
+        metrics.inc("calls_total", model='a"b')
+        metrics.set_gauge("in_flight", 2, model="m")
+        metrics.observe("latency_seconds", 1.0, tier="fast")
+        metrics.observe("latency_seconds", 3.0, tier="fast")
+
+        text = metrics.prometheus()
+
+        self.assertIn("# TYPE calls_total counter\ncalls_total{model=\"a\\\"b\"} 1\n", text)
+        self.assertIn('in_flight{model="m"} 2', text)
+        self.assertIn('latency_seconds{quantile="0.95",tier="fast"} 3.0', text)
+        self.assertIn('latency_seconds_sum{tier="fast"} 4.0', text)
+        self.assertIn('latency_seconds_count{tier="fast"} 2', text)
+
+    def test_route_requires_the_token(self):
+        metrics.inc("calls_total")
+        with patch('metrics.METRICS_TOKEN', None):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+        with patch('metrics.METRICS_TOKEN', "sesame"):
+            self.assertEqual(self.client.get("/metrics?token=guess").status_code, 403)
+            response = self.client.get("/metrics", headers={"x-metrics-token": "sesame"})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("calls_total 1", response.text)
+            data = self.client.get("/metrics?token=sesame&format=json").json()
+            self.assertEqual(data["counters"], [{"name": "calls_total", "labels": {}, "value": 1}])
+
+    def test_served_by_the_app(self):
+        import app
+        paths = [route.path for route in app.server_options()["app_kwargs"]["routes"]]
+        self.assertIn("/metrics", paths)
+
+if __name__ == '__main__':
+    unittest.main()
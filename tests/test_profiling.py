@@ -0,0 +1,88 @@
+import sys
+import os
+import time
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from PIL import Image
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import profiling
+import app
+
+def busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(1000))
+
+class TestProfile(unittest.TestCase):
+    def test_samples_the_attached_thread(self):
+        profile = profiling.Profile("test", interval=0.001).start()
+        profile.attach()
+        with profiling.stage("work"):
+            busy_loop(0.1)
+        profile.detach()
+        data = profile.finish().to_dict()
+
+        self.assertGreater(data["samples"], 10)
+        self.assertTrue(any("busy_loop" in stack for stack in data["stacks"]))
+        self.assertEqual(data["stages"][0][0], "work")
+        self.assertGreaterEqual(data["stages"][0][1], 0.1)
+
+    def test_stage_is_a_no_op_without_a_profile(self):
+        with profiling.stage("nothing"):
+            pass
+
+    def test_directory_rotates(self):
+        directory = tempfile.mkdtemp()
+        for i in range(5):
+            profile = profiling.Profile(f"h{i}").start().finish()
+            profile.id = f"2026-{i}"
+            profiling.save(profile, directory, keep=3)
+        self.assertEqual(sorted(os.listdir(directory)), ["2026-2.json", "2026-3.json", "2026-4.json"])
+
+    @patch('profiling.PROFILE_ADMIN_TOKEN', "sesame")
+    @patch('profiling.PROFILE_SAMPLE_RATE', 0)
+    def test_admin_flag_forces_profiling(self):
+        self.assertTrue(profiling.requested(MagicMock(query_params={"profile": "sesame"})))
+        self.assertFalse(profiling.requested(MagicMock(query_params={"profile": "guess"})))
+        self.assertFalse(profiling.requested(None))
+
+class TestHandlerProfiling(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name, value in (("PROFILE_DIR", self.directory), ("PROFILE_SAMPLE_RATE", 1.0), ("PROFILE_ADMIN_TOKEN", "sesame")):
+            patcher = patch.object(profiling, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @patch('pipeline.logic.generate_wide_shot', return_value=Image.new("RGB", (1600, 900)))
+    def test_handler_writes_a_profile_with_stages(self, mock_generate):
+        list(app.handle_ch3("chase"))
+        [summary] = profiling.slowest(directory=self.directory)
+        self.assertEqual(summary["handler"], "handle_ch3")
+        stages = [name for name, _ in summary["stages"] if name in ("generate", "verify", "store")]
+        self.assertEqual(stages, ["generate", "verify", "store"])
+        self.assertIn("gradio_update", [name for name, _ in summary["stages"]])
+
+    @patch('pipeline.logic.generate_wide_shot', return_value=Image.new("RGB", (1600, 900)))
+    def test_admin_view(self, mock_generate):
+        list(app.handle_ch3("chase"))
+        client = TestClient(Starlette(routes=profiling.routes()))
+        self.assertEqual(client.get("/admin/profiles").status_code, 403)
+        page = client.get("/admin/profiles?token=sesame")
+        self.assertIn("handle_ch3", page.text)
+        self.assertIn("handle_ch3", client.get("/admin/profiles?token=sesame&limit=1").text)
+        for bad in ("abc", "0", "-3"):
+            self.assertEqual(client.get(f"/admin/profiles?token=sesame&limit={bad}").status_code, 400)
+
+        profile_id = profiling.slowest(directory=self.directory)[0]["id"]
+        folded = client.get(f"/admin/profiles/{profile_id}.folded?token=sesame")
+        self.assertEqual(folded.status_code, 200)
+        self.assertEqual(client.get("/admin/profiles/../../etc.folded?token=sesame").status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
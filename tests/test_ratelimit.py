@@ -0,0 +1,39 @@
+import sys
+import os
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ratelimit
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_wait(self):
+        clock = FakeClock()
+        bucket = ratelimit.TokenBucket(rate=2, capacity=2, clock=clock)
+        self.assertEqual(bucket.try_acquire(), 0.0)
+        self.assertEqual(bucket.try_acquire(), 0.0)
+        self.assertAlmostEqual(bucket.try_acquire(), 0.5)
+
+        clock.now += 0.5
+        self.assertEqual(bucket.try_acquire(), 0.0)
+
+    def test_acquire_timeout(self):
+        clock = FakeClock()
+        bucket = ratelimit.TokenBucket(rate=0.001, capacity=1, clock=clock)
+        bucket.acquire()
+        self.assertFalse(bucket.acquire(timeout=0))
+
+    def test_per_minute_zero_is_unlimited(self):
+        bucket = ratelimit.per_minute(0)
+        for _ in range(100):
+            self.assertTrue(bucket.acquire(timeout=0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import io
+import sys
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from PIL import Image
+from google.genai import types
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import artifacts
+import refine
+
+def _image_response(color=(255, 0, 0)):
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), color).save(buffer, format="PNG")
+    part = types.Part.from_bytes(data=buffer.getvalue(), mime_type="image/png")
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[part]))]
+    )
+
+def _mock_client():
+    client = MagicMock()
+    client.files.upload.side_effect = lambda **kwargs: MagicMock(uri=f"files/{client.files.upload.call_count}")
+    client.chats.create.return_value.send_message.side_effect = lambda message: _image_response()
+    return client
+
+class TestRefinementSession(unittest.TestCase):
+    def setUp(self):
+        self.store = artifacts.ArtifactStore(root=tempfile.mkdtemp(), sweep_interval=0)
+
+    def session(self, image):
+        artifact = self.store.put("s1", "ch1", image)
+        return refine.RefinementSession("ch1", "cat", artifact.id, store=self.store)
+
+    def test_send_returns_edited_image_and_records_turn(self):
+        session = self.session(Image.new("RGB", (8, 8)))
+        client = _mock_client()
+
+        img = session.send(client, "same, but add rain")
+
+        self.assertIsInstance(img, Image.Image)
+        self.assertEqual(len(session.turns), 2)
+        self.assertEqual(session.turns[0].parts[0].text, "same, but add rain")
+        client.chats.create.assert_called_once()
+        self.assertEqual(client.chats.create.call_args.kwargs["model"], refine.REFINE_MODEL)
+
+    @patch.object(refine, "INLINE_PART_LIMIT", 10)
+    def test_images_are_uploaded_once_and_sent_by_uri(self):
+        session = self.session(Image.new("RGB", (64, 64), (9, 9, 9)))
+        client = _mock_client()
+
+        session.send(client, "add rain")
+        session.send(client, "add fog")
+
+        # Seed image, then the first edit before the second turn; nothing is uploaded twice.
+        self.assertEqual(client.files.upload.call_count, 2)
+        history = client.chats.create.call_args.kwargs["history"]
+        for content in history:
+            for part in content.parts:
+                self.assertTrue(part.inline_data is None or len(part.inline_data.data) <= 10)
+
+    @patch.object(refine, "REFINE_MAX_TURNS", 2)
+    def test_old_turns_are_evicted(self):
+        session = self.session(Image.new("RGB", (8, 8)))
+        client = _mock_client()
+        for i in range(5):
+            session.send(client, f"edit {i}")
+
+        self.assertEqual(len(session.turns), 4)
+        self.assertEqual(session.turns[0].parts[0].text, "edit 3")
+        self.assertEqual(len(session.history), 6)
+
+    def test_seed_is_encoded_on_first_send_and_downscaled(self):
+        session = self.session(Image.new("RGB", (4000, 2000), (9, 9, 9)))
+        self.assertIsNone(session._seed)
+
+        client = _mock_client()
+        session.send(client, "add rain")
+
+        with Image.open(client.files.upload.call_args_list[0].kwargs["file"]) as seed: # Large enough to be uploaded
+            self.assertEqual(max(seed.size), refine.REFINE_SEED_MAX_SIDE)
+
+    def test_expired_render_cannot_seed(self):
+        session = self.session(Image.new("RGB", (8, 8)))
+        self.store.drop_session("s1")
+        with self.assertRaises(refine.SeedExpired):
+            session.send(_mock_client(), "add rain")
+
+class TestRefinementStore(unittest.TestCase):
+    def test_lru_eviction(self):
+        store = refine.RefinementStore(max_sessions=2)
+        store.start("a", "ch1", "x", "artifact-a")
+        store.start("b", "ch1", "x", "artifact-b")
+        store.get("a")
+        store.start("c", "ch1", "x", "artifact-c")
+
+        self.assertIsNotNone(store.get("a"))
+        self.assertIsNone(store.get("b"))
+        self.assertEqual(len(store), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import sys
+import os
+import unittest
+from unittest.mock import patch, MagicMock
+from PIL import Image, ImageDraw
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+import state
+import verifier
+
+def _sign_image(shade=0):
+    img = Image.new("RGB", (128, 128), (shade, 0, 0))
+    draw = ImageDraw.Draw(img)
+    for x in range(0, 128, 16):
+        draw.rectangle([x, 0, x + 7, 127], fill=(255, 255, 255))
+    return img
+
+def _reply(text):
+    response = MagicMock()
+    response.text = text
+    return response
+
+class TestTextMatching(unittest.TestCase):
+    def test_normalization_ignores_case_punctuation_and_spacing(self):
+        self.assertEqual(verifier.normalize_text("  the\nTerminal! "), "THE TERMINAL")
+        self.assertEqual(verifier.text_similarity("The  Terminal.", "THE TERMINAL"), 1.0)
+
+    def test_similarity_is_one_minus_normalized_edit_distance(self):
+        self.assertEqual(verifier.edit_distance("TERMINAL", "TERMLNAL"), 1)
+        self.assertAlmostEqual(verifier.text_similarity("THE TERMLNAL", "THE TERMINAL"), 11 / 12)
+
+    def test_sign_split_across_entries_matches(self):
+        matched, score, closest = verifier.match_text(["OPEN 24H", "THE", "TERMINAL"], "THE TERMINAL")
+        self.assertTrue(matched)
+        self.assertEqual(closest, "THE TERMINAL")
+
+class TestSignTranscription(unittest.TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        patcher = patch.object(state, "backend", state.MemoryBackend())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('verifier.genai.Client')
+    def test_transcription_is_cached_per_image(self, mock_client_cls):
+        generate = mock_client_cls.return_value.models.generate_content
+        generate.return_value = _reply('{"texts": ["THE TERMINAL"]}')
+        image = _sign_image()
+
+        self.assertTrue(verifier.verify_sign_text(image, "THE TERMINAL")[0])
+        self.assertFalse(verifier.verify_sign_text(image, "THE EXIT")[0])
+        self.assertTrue(verifier.verify_sign_text(image.copy(), "the terminal")[0])
+
+        generate.assert_called_once()
+        self.assertEqual(generate.call_args.kwargs['model'], verifier.FAST_MODEL)
+        self.assertEqual(metrics.registry.counter("transcription_cache_total", result="hit"), 2)
+
+        verifier.verify_sign_text(_sign_image(shade=1), "THE TERMINAL")
+        self.assertEqual(generate.call_count, 2)
+
+    @patch('verifier.genai.Client')
+    def test_near_miss_names_the_wrong_character(self, mock_client_cls):
+        mock_client_cls.return_value.models.generate_content.return_value = _reply('{"texts": ["THE TERMlNAL"]}')
+
+        success, message = verifier.verify_sign_text(_sign_image(), "THE TERMINAL")
+
+        self.assertFalse(success)
+        self.assertIn("THE TERMlNAL", message)
+        self.assertIn("92% match", message)
+        self.assertIn("'L' should be 'I'", message)
+
+    @patch('verifier.genai.Client')
+    def test_threshold_is_configurable(self, mock_client_cls):
+        mock_client_cls.return_value.models.generate_content.return_value = _reply('{"texts": ["THE TERMlNAL"]}')
+
+        with patch.object(verifier, "SIGN_MATCH_THRESHOLD", 0.9):
+            success, _ = verifier.verify_sign_text(_sign_image(), "THE TERMINAL")
+
+        self.assertTrue(success)
+
+    @patch('verifier.genai.Client')
+    def test_no_text_is_illegible(self, mock_client_cls):
+        mock_client_cls.return_value.models.generate_content.return_value = _reply('{"texts": []}')
+
+        success, message = verifier.verify_sign_text(_sign_image(), "THE TERMINAL")
+
+        self.assertFalse(success)
+        self.assertIn("Illegible", message)
+
+    @patch('verifier.genai.Client')
+    def test_blank_image_never_reaches_the_model(self, mock_client_cls):
+        success, _ = verifier.verify_sign_text(Image.new("RGB", (64, 64)), "THE TERMINAL")
+
+        self.assertFalse(success)
+        mock_client_cls.return_value.models.generate_content.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
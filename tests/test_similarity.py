@@ -0,0 +1,146 @@
+import io
+import sys
+import os
+import random
+import tempfile
+import unittest
+from unittest.mock import patch
+from PIL import Image, ImageDraw, ImageEnhance
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import artifacts
+import metrics
+import pipeline
+import similarity
+import state
+
+def scene(seed=0, size=(160, 90)):
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, (20, 10, 40))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.rectangle([x, y, x + size[0] // 4, y + size[1] // 4], fill=tuple(rng.randrange(256) for _ in range(3)))
+    return img
+
+def reencoded(img, quality=70):
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=quality)
+    return Image.open(io.BytesIO(buffer.getvalue())).convert("RGB")
+
+class TestSignature(unittest.TestCase):
+    def test_reencoding_and_resizing_barely_move_the_hash(self):
+        original = similarity.dhash(scene())
+        self.assertLessEqual(similarity.hamming(original, similarity.dhash(reencoded(scene()))), 4)
+        self.assertLessEqual(similarity.hamming(original, similarity.dhash(scene().resize((320, 180)))), 4)
+        self.assertGreater(similarity.hamming(original, similarity.dhash(scene(seed=1))), 12)
+
+    def test_flat_frames_have_no_signature(self):
+        self.assertIsNone(similarity.signature(Image.new("RGB", (64, 64), (9, 9, 9))))
+
+    def test_signature_is_remembered_on_the_image(self):
+        img = scene()
+        with patch('similarity.dhash', wraps=similarity.dhash) as spy:
+            similarity.signature(img)
+            similarity.signature(img)
+        self.assertEqual(spy.call_count, 1)
+
+class TestHashIndex(unittest.TestCase):
+    def test_search_matches_brute_force(self):
+        rng = random.Random(7)
+        index = similarity.HashIndex(max_distance=4)
+        hashes = [rng.getrandbits(64) for _ in range(500)]
+        # Plant neighbours at known distances
+        hashes += [hashes[0] ^ (1 << 3), hashes[0] ^ 0b1111, hashes[0] ^ 0b11111]
+        for i, value in enumerate(hashes):
+            index.add(value, i)
+
+        found = index.search(hashes[0])
+        expected = sorted((similarity.hamming(hashes[0], h), i) for i, h in enumerate(hashes) if similarity.hamming(hashes[0], h) <= 4)
+        self.assertEqual(sorted(found), expected)
+        self.assertEqual(found[0], (0, 0))
+        self.assertEqual(index.search(hashes[0], max_distance=1), [(0, 0), (1, 500)])
+
+    def test_oldest_entries_are_dropped_at_capacity(self):
+        index = similarity.HashIndex(max_distance=2, capacity=2)
+        for value in (1, 2, 4):
+            index.add(value, value)
+        self.assertEqual(len(index), 2)
+        self.assertIsNone(index.nearest(1, max_distance=0))
+        self.assertEqual(index.nearest(4, max_distance=0), 4)
+
+class TestNearDuplicateReuse(unittest.TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        similarity.seen.clear()
+        similarity.verdicts.clear()
+        patcher = patch.object(state, "backend", state.MemoryBackend())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('verifier.verify_aspect_ratio', return_value=(True, "Cinematic."))
+    def test_near_identical_frame_reuses_the_pass(self, mock_verify):
+        self.assertEqual(pipeline.verify_chapter("ch3", scene(), "chase"), (True, "Cinematic."))
+        self.assertEqual(pipeline.verify_chapter("ch3", reencoded(scene()), "chase"), (True, "Cinematic."))
+        self.assertEqual(mock_verify.call_count, 1)
+        self.assertEqual(metrics.registry.counter("verification_cache_total", result="near_duplicate"), 1)
+
+        pipeline.verify_chapter("ch3", reencoded(scene()), "a different prompt")
+        pipeline.verify_chapter("ch3", ImageEnhance.Brightness(scene()).enhance(0.5), "chase")
+        self.assertEqual(mock_verify.call_count, 3)
+
+    @patch('verifier.verify_sign_text', return_value=(True, "Text Verified."))
+    def test_fine_detail_chapters_always_verify(self, mock_verify):
+        pipeline.verify_chapter("ch2", scene(), "THE TERMINAL")
+        pipeline.verify_chapter("ch2", reencoded(scene()), "THE TERMINAL")
+        self.assertEqual(mock_verify.call_count, 2)
+
+    def test_generations_are_indexed(self):
+        with patch('pipeline.logic.generate_hero', side_effect=[scene(), reencoded(scene()), scene(seed=3)]):
+            for _ in range(3):
+                pipeline.generate_chapter("ch1", "cat")
+
+        self.assertEqual(metrics.registry.counter("generations_indexed_total", chapter="ch1", result="near_duplicate"), 1)
+        self.assertEqual(metrics.registry.counter("generations_indexed_total", chapter="ch1", result="new"), 2)
+        self.assertEqual(len(similarity.seen_before(scene(seed=3))), 1)
+
+class TestArtifactDedupe(unittest.TestCase):
+    def setUp(self):
+        self.store = artifacts.ArtifactStore(root=tempfile.mkdtemp(), session_cap=3, ttl=60, sweep_interval=0)
+
+    def test_identical_render_shares_the_stored_file(self):
+        first = self.store.put("s1", "ch1", scene())
+        again = self.store.put("s1", "ch1", scene(), verified=True)
+
+        self.assertNotEqual(again.id, first.id)
+        self.assertTrue(again.verified)
+        self.assertTrue(os.path.samefile(again.path, first.path))
+        self.assertEqual(metrics.registry.gauge("artifact_disk_bytes"), first.file_bytes)
+        # Removing one keeps the other's pixels
+        self.store._delete(first)
+        self.assertEqual(self.store.image(again.id).tobytes(), scene().tobytes())
+
+    def test_near_duplicate_render_keeps_its_own_pixels(self):
+        first = self.store.put("s1", "ch1", scene())
+        near = reencoded(scene(), quality=95)
+        again = self.store.put("s1", "ch1", near)
+
+        self.assertFalse(os.path.samefile(again.path, first.path))
+        with Image.open(again.path) as stored:
+            self.assertEqual(stored.tobytes(), near.tobytes())
+
+    def test_dedupe_can_be_turned_off(self):
+        self.store.dedupe = False
+        first = self.store.put("s1", "ch1", scene())
+        again = self.store.put("s1", "ch1", scene())
+        self.assertFalse(os.path.samefile(again.path, first.path))
+
+    def test_sweep_leaves_tracked_files_alone(self):
+        artifact = self.store.put("s1", "ch1", scene())
+        os.utime(artifact.path, (0, 0)) # e.g. shared with an older artifact
+        self.assertEqual(self.store.sweep(), 0)
+        self.assertTrue(os.path.exists(artifact.path))
+
+if __name__ == '__main__':
+    unittest.main()
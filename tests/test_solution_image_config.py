@@ -0,0 +1,68 @@
+import sys
+import os
+import unittest
+from unittest.mock import patch, MagicMock
+from google.genai import errors
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakes
+from solutions.final import logic
+
+class TestImageConfig(unittest.TestCase):
+    def setUp(self):
+        self.backend = fakes.install(fakes.FakeBackend(image_latency=0, text_latency=0, seed=1))
+        logic._prompt_only_models.clear()
+
+    def tearDown(self):
+        fakes.uninstall()
+        logic._prompt_only_models.clear()
+
+    def test_wide_shot_uses_native_aspect_ratio(self):
+        with patch.object(self.backend, "respond", wraps=self.backend.respond) as respond:
+            img = logic.generate_wide_shot("chase")
+        model, contents, config = respond.call_args.args
+        self.assertEqual(contents, ["chase"]) # No prompt suffix
+        self.assertEqual(config.image_config.aspect_ratio, "16:9")
+        self.assertEqual(config.response_modalities, ["IMAGE"])
+        self.assertEqual(img.size, (1024, 576))
+
+    def test_final_requests_resolution(self):
+        with patch.object(self.backend, "respond", wraps=self.backend.respond) as respond:
+            logic.generate_final("unit 9")
+        config = respond.call_args.args[2]
+        self.assertEqual(config.image_config.image_size, "4K")
+        self.assertNotIn("8k", respond.call_args.args[1][0])
+
+    def test_final_drafts_small_and_finalizes_from_the_draft(self):
+        with patch.object(self.backend, "respond", wraps=self.backend.respond) as respond:
+            draft = logic.generate_final("unit 9", draft=True)
+            self.assertEqual(respond.call_args.args[2].image_config.image_size, "1K")
+            logic.generate_final("unit 9", reference_image=draft)
+        model, contents, config = respond.call_args.args
+        self.assertIs(contents[1], draft)
+        self.assertEqual(config.image_config.image_size, "4K")
+
+    def test_falls_back_to_prompt_hint(self):
+        rejected = errors.ClientError(400, {"error": {"message": "image_config is not supported", "status": "INVALID_ARGUMENT"}})
+        client = MagicMock()
+        client.models.generate_content.side_effect = [rejected, MagicMock(), MagicMock()]
+
+        logic._generate_image(client, ["chase"], aspect_ratio="16:9", fallback_hint=" Aspect Ratio 16:9")
+        retry = client.models.generate_content.call_args.kwargs
+        self.assertEqual(retry["contents"], ["chase Aspect Ratio 16:9"])
+        self.assertNotIn("config", retry)
+
+        # The model is remembered: no second rejected attempt
+        logic._generate_image(client, ["rain"], aspect_ratio="16:9", fallback_hint=" Aspect Ratio 16:9")
+        self.assertEqual(client.models.generate_content.call_count, 3)
+
+    def test_other_errors_are_not_retried(self):
+        client = MagicMock()
+        client.models.generate_content.side_effect = errors.ClientError(429, {"error": {"message": "quota"}})
+        with self.assertRaises(errors.ClientError):
+            logic._generate_image(client, ["chase"], aspect_ratio="16:9")
+        self.assertEqual(client.models.generate_content.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+import sys
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import state
+import metrics
+import ratelimit
+import pipeline
+import app
+
+class BackendContract:
+    """Behaviour every backend must share."""
+
+    def make_backend(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.backend = self.make_backend()
+
+    def test_set_get_delete(self):
+        self.backend.set("k", b"\x00value")
+        self.assertEqual(self.backend.get("k"), b"\x00value")
+        self.backend.delete("k")
+        self.assertIsNone(self.backend.get("k"))
+
+    def test_expiry(self):
+        self.backend.set("k", b"v", ttl=60)
+        self.assertEqual(self.backend.get("k"), b"v")
+        with patch("time.time", return_value=__import__("time").time() + 120):
+            self.assertIsNone(self.backend.get("k"))
+
+    def test_incr_is_atomic(self):
+        threads = [threading.Thread(target=lambda: [self.backend.incr("n", ttl=60) for _ in range(25)]) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.backend.incr("n", ttl=60), 101)
+
+class TestMemoryBackend(BackendContract, unittest.TestCase):
+    def make_backend(self):
+        return state.MemoryBackend()
+
+    def test_expired_keys_are_purged_without_a_read(self):
+        self.backend = state.MemoryBackend(purge_every=3)
+        self.backend.set("old", b"v", ttl=60)
+        self.backend.incr("window", ttl=60)
+        with patch("time.time", return_value=__import__("time").time() + 120):
+            self.backend.set("new", b"v")
+        self.assertEqual(list(self.backend._data), ["new"])
+
+class TestSQLiteBackend(BackendContract, unittest.TestCase):
+    def make_backend(self):
+        return state.from_url(f"sqlite://{tempfile.mkdtemp()}/state.db")
+
+    def test_expired_keys_are_purged_without_a_read(self):
+        self.backend = state.SQLiteBackend(f"{tempfile.mkdtemp()}/state.db", purge_every=3)
+        self.backend.set("old", b"v", ttl=60)
+        self.backend.incr("window", ttl=60)
+        with patch("time.time", return_value=__import__("time").time() + 120):
+            self.backend.set("new", b"v")
+        conn = self.backend._connect()
+        try:
+            self.assertEqual(conn.execute("SELECT key FROM kv").fetchall(), [("new",)])
+        finally:
+            conn.close()
+
+class TestRedisBackend(BackendContract, unittest.TestCase):
+    def make_backend(self):
+        self.server = state.RespServer(("127.0.0.1", 0))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return state.from_url(f"redis://127.0.0.1:{self.server.server_address[1]}/0")
+
+    def tearDown(self):
+        self.backend.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_expiry(self):
+        # Expiry is enforced by the server's own clock
+        self.backend.set("k", b"v", ttl=60)
+        self.assertEqual(self.backend.get("k"), b"v")
+
+    def test_server_errors_surface(self):
+        with self.assertRaises(state.RedisError):
+            self.backend.execute("FLUSHALL")
+        self.assertEqual(self.backend.execute("PING"), "PONG") # Reconnects cleanly
+
+class TestSharedState(unittest.TestCase):
+    def setUp(self):
+        self.backend = state.MemoryBackend()
+        patcher = patch.object(state, "backend", self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_shared_window_limits_across_instances(self):
+        now = [1000.0]
+        a = ratelimit.SharedWindow("gen", rate=1.0, capacity=2, clock=lambda: now[0])
+        b = ratelimit.SharedWindow("gen", rate=1.0, capacity=2, clock=lambda: now[0])
+        self.assertEqual(a.try_acquire(), 0.0)
+        self.assertEqual(b.try_acquire(), 0.0)
+        self.assertAlmostEqual(a.try_acquire(), 2.0) # Window [1000, 1002) is spent
+        now[0] = 1002.0
+        self.assertEqual(b.try_acquire(), 0.0)
+
+    def test_per_minute_is_shared_only_off_process(self):
+        self.assertIsInstance(ratelimit.per_minute(60, shared_name="gen"), ratelimit.TokenBucket)
+        with patch.object(state, "backend", state.SQLiteBackend(os.path.join(tempfile.mkdtemp(), "s.db"))):
+            self.assertIsInstance(ratelimit.per_minute(60, shared_name="gen"), ratelimit.SharedWindow)
+
+    @patch('verifier.verify_aspect_ratio', return_value=(True, "Cinematic."))
+    def test_verification_pass_is_cached(self, mock_verify):
+        img = Image.new("RGB", (160, 90), (1, 2, 3))
+        self.assertEqual(pipeline.verify_chapter("ch3", img, "chase"), (True, "Cinematic."))
+        self.assertEqual(pipeline.verify_chapter("ch3", img.copy(), "chase"), (True, "Cinematic."))
+        self.assertEqual(mock_verify.call_count, 1)
+
+    @patch('verifier.verify_aspect_ratio', return_value=(False, "System Error: 429"))
+    def test_verification_failure_is_not_cached(self, mock_verify):
+        img = Image.new("RGB", (160, 90), (4, 5, 6))
+        pipeline.verify_chapter("ch3", img, "chase")
+        pipeline.verify_chapter("ch3", img, "chase")
+        self.assertEqual(mock_verify.call_count, 2)
+
+    @patch('pipeline.GENERATION_CACHE_TTL', 60)
+    @patch('pipeline.logic.generate_hero', return_value=Image.new("RGB", (64, 64), (9, 9, 9)))
+    def test_generation_cache(self, mock_generate):
+        first = pipeline.generate_chapter("ch1", "cat")
+        second = pipeline.generate_chapter("ch1", "cat")
+        self.assertEqual(mock_generate.call_count, 1)
+        self.assertEqual(second.image.getpixel((0, 0)), first.image.getpixel((0, 0)))
+
+class UnreachableBackend:
+    """A backend whose server is down."""
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            raise ConnectionRefusedError(111, "Connection refused")
+        return call
+
+class TestUnreachableBackend(unittest.TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        for name, value in (("backend", UnreachableBackend()), ("_down_until", 0.0)):
+            patcher = patch.object(state, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_reads_miss_and_writes_are_skipped(self):
+        self.assertIsNone(state.get_json("progress:x"))
+        state.set_json("progress:x", "ch3")
+        self.assertEqual(metrics.registry.counter("state_errors_total", operation="read", reason="error"), 1)
+        # Later calls back off instead of waiting on the dead server
+        self.assertIsNone(state.get_bytes("k"))
+        self.assertEqual(metrics.registry.counter("state_errors_total", operation="write", reason="backoff"), 1)
+        with self.assertRaises(state.Unavailable):
+            state.incr("n")
+
+    def test_shared_window_falls_back_to_a_local_bucket(self):
+        window = ratelimit.SharedWindow("gen", rate=1.0, capacity=2)
+        self.assertEqual(window.try_acquire(), 0.0)
+        self.assertEqual(window.try_acquire(), 0.0)
+        self.assertGreater(window.try_acquire(), 0.0)
+
+    @patch('verifier.verify_aspect_ratio', return_value=(True, "Cinematic."))
+    def test_clicks_still_work(self, mock_verify):
+        self.assertEqual(app.load_progress("learner"), "init")
+        app.record_progress("learner", "ch2")
+        self.assertEqual(pipeline.verify_chapter("ch3", Image.new("RGB", (160, 90), (1, 2, 3)), "chase"), (True, "Cinematic."))
+
+if __name__ == '__main__':
+    unittest.main()
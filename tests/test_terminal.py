@@ -0,0 +1,44 @@
+import sys
+import os
+import unittest
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import terminal
+import app
+
+class TestTerminal(unittest.TestCase):
+    def test_entry_is_one_styled_line(self):
+        html = terminal.format_entry("VERIFICATION: FAILURE\n> <b>too dark</b>", "error")
+        self.assertEqual(html.count("class='log-entry'"), 1)
+        self.assertIn("data-level='error'", html)
+        self.assertIn("#ff2a2a", html)
+        self.assertIn("FAILURE<br>&gt; &lt;b&gt;too dark&lt;/b&gt;", html) # Learner text is never markup
+
+    def test_repeated_messages_are_distinct_updates(self):
+        self.assertNotEqual(terminal.format_entry("retrying"), terminal.format_entry("retrying"))
+
+    def test_unknown_levels_fall_back_to_info(self):
+        self.assertIn("data-level='info'", terminal.format_entry("x", "debug"))
+
+    def test_update_size_does_not_grow_with_the_session(self):
+        first = app.format_log("JOB RUNNING: Generating (attempt 1/3)...")
+        for _ in range(500):
+            latest = app.format_log("JOB RUNNING: Generating (attempt 1/3)...")
+        self.assertLessEqual(abs(len(latest) - len(first)), 3) # Only the sequence number grows
+
+    @patch('terminal.TERMINAL_LOG_LINES', 50)
+    def test_component_appends_with_a_cap(self):
+        box = terminal.component()
+        self.assertEqual(box.html_template, terminal.TEMPLATE)
+        self.assertNotIn("${value}", box.html_template) # Updates must not re-render the lines
+        self.assertEqual(box.props["max_lines"], 50)
+        self.assertIn("watch('value'", box.js_on_load)
+
+    def test_unlock_reads_the_latest_entry(self):
+        lock, content, footer = app.unlock_chapter("ch2", app.format_log("VERIFICATION: SUCCESS", "success"))
+        self.assertTrue(content["visible"])
+
+if __name__ == '__main__':
+    unittest.main()
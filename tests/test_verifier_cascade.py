@@ -0,0 +1,81 @@
+import sys
+import os
+import unittest
+from unittest.mock import patch, MagicMock
+from PIL import Image, ImageDraw
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+import verifier
+
+def _busy_image():
+    img = Image.new("RGB", (128, 128), (0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    for x in range(0, 128, 16):
+        draw.rectangle([x, 0, x + 7, 127], fill=(255, 255, 255))
+    return img
+
+def _reply(text):
+    response = MagicMock()
+    response.text = text
+    return response
+
+class TestVerifierCascade(unittest.TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+
+    @patch('verifier.genai.Client')
+    def test_confident_verdict_stops_at_fast_tier(self, mock_client_cls):
+        mock_client = mock_client_cls.return_value
+        mock_client.models.generate_content.return_value = _reply('{"verdict": "YES", "confidence": 0.95}')
+
+        success, _ = verifier.verify_hero(_busy_image())
+
+        self.assertTrue(success)
+        mock_client.models.generate_content.assert_called_once()
+        self.assertEqual(mock_client.models.generate_content.call_args.kwargs['model'], verifier.FAST_MODEL)
+        self.assertEqual(verifier.cascade_stats()["hero"]["decided"]["fast"], 1)
+
+    @patch('verifier.genai.Client')
+    def test_ambiguous_verdict_escalates(self, mock_client_cls):
+        mock_client = mock_client_cls.return_value
+        mock_client.models.generate_content.side_effect = [
+            _reply('{"verdict": "YES", "confidence": 0.55}'),
+            _reply('{"verdict": "NO", "confidence": 0.9}'),
+        ]
+
+        success, _ = verifier.verify_style(_busy_image())
+
+        self.assertFalse(success)
+        models = [c.kwargs['model'] for c in mock_client.models.generate_content.call_args_list]
+        self.assertEqual(models, [verifier.FAST_MODEL, verifier.STRONG_MODEL])
+        stats = verifier.cascade_stats()["style"]
+        self.assertEqual(stats["escalations"], 1)
+        self.assertEqual(stats["agreement_rate"], 0.0)
+
+    @patch('verifier.genai.Client')
+    def test_local_tier_rejects_flat_lighting_without_model_call(self, mock_client_cls):
+        success, _ = verifier.verify_lighting(Image.new("RGB", (64, 64), (90, 90, 90)))
+
+        self.assertFalse(success)
+        mock_client_cls.return_value.models.generate_content.assert_not_called()
+        self.assertEqual(verifier.cascade_stats()["lighting"]["decided"]["local"], 1)
+
+    @patch('verifier.genai.Client')
+    def test_plain_yes_answer_is_decisive(self, mock_client_cls):
+        mock_client = mock_client_cls.return_value
+        mock_client.models.generate_content.return_value = _reply("YES")
+
+        success, _ = verifier.verify_final(_busy_image())
+
+        self.assertTrue(success)
+        mock_client.models.generate_content.assert_called_once()
+
+    def test_tier_latency_is_recorded(self):
+        verifier.verify_lighting(Image.new("RGB", (64, 64)))
+        names = {(o["name"], o["labels"]["tier"]) for o in metrics.snapshot()["observations"]}
+        self.assertIn(("verifier_tier_latency_seconds", "local"), names)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import sys
+import os
+import unittest
+from unittest.mock import patch, MagicMock
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakes
+import warmup
+import app
+
+class TestWarmup(unittest.TestCase):
+    def setUp(self):
+        fakes.install(fakes.FakeBackend(image_latency=0, text_latency=0, seed=1))
+
+    def tearDown(self):
+        fakes.uninstall()
+
+    def test_warm_instance_is_ready(self):
+        boot = warmup.Warmup(check_models=True, client_factory=fakes.FakeClient)
+        with self.assertLogs("warmup") as logged:
+            self.assertTrue(boot.run())
+        self.assertEqual(logged.records[0].event, "warmup")
+        self.assertEqual(logged.records[0].checks, {"sdk": "ok", "assets": "ok", "models": "ok"})
+        self.assertEqual(set(boot.checks), {"sdk", "assets", "models"})
+        self.assertIn("ui_banner_hero.png", boot.assets)
+
+    def test_unavailable_model_blocks_readiness(self):
+        def get(model, config=None):
+            if model == warmup.IMAGE_MODEL:
+                raise RuntimeError("404 NOT_FOUND")
+        client = MagicMock()
+        client.models.get.side_effect = get
+        boot = warmup.Warmup(check_models=True, client_factory=lambda: client)
+        self.assertFalse(boot.run())
+        self.assertEqual(boot.status, warmup.FAILED)
+        self.assertIn(warmup.IMAGE_MODEL, boot.checks["models"]["detail"])
+        self.assertTrue(boot.checks["assets"]["ok"])
+
+    def test_missing_optional_model_only_degrades(self):
+        def get(model, config=None):
+            if model in warmup.optional_models():
+                raise RuntimeError("404 NOT_FOUND")
+        client = MagicMock()
+        client.models.get.side_effect = get
+        boot = warmup.Warmup(check_models=True, client_factory=lambda: client)
+        with patch.object(warmup.refine, "REFINE_MODEL", "refine-model"):
+            self.assertTrue(boot.run())
+            self.assertEqual(boot.status, warmup.DEGRADED)
+            self.assertIn("refine-model", boot.checks["models"]["detail"])
+
+    def test_failed_check_is_retried_until_ready(self):
+        calls = []
+        def get(model, config=None):
+            calls.append(model)
+            if len(calls) == 1:
+                raise ConnectionError("network unreachable")
+        client = MagicMock()
+        client.models.get.side_effect = get
+        boot = warmup.Warmup(check_models=True, client_factory=lambda: client)
+        with patch.object(warmup, "WARMUP_RETRY_INITIAL", 0.01):
+            boot.start().wait(10)
+            boot._thread.join(10)
+        self.assertEqual(boot.status, warmup.READY)
+        self.assertEqual(boot.attempts, 2)
+        self.assertTrue(boot.checks["models"]["ok"])
+
+    def test_missing_key_is_not_ready(self):
+        boot = warmup.Warmup(check_models=True, client_factory=lambda: None)
+        self.assertFalse(boot.run())
+        self.assertIn("GOOGLE_API_KEY", boot.checks["models"]["detail"])
+
+    def test_required_models_are_unique(self):
+        models = warmup.required_models()
+        self.assertEqual(len(models), len(set(models)))
+        self.assertIn(warmup.IMAGE_MODEL, models)
+
+class TestProbes(unittest.TestCase):
+    def setUp(self):
+        self.boot = warmup.Warmup(check_models=False)
+        patcher = patch.object(warmup, "boot", self.boot)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(Starlette(routes=warmup.routes()))
+
+    def test_ready_only_after_warmup(self):
+        self.assertEqual(self.client.get("/healthz").status_code, 200)
+        self.assertEqual(self.client.get("/readyz").status_code, 503)
+
+        self.boot.start().wait(10)
+        response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["checks"]["models"]["detail"], "skipped (WARMUP_CHECK_MODELS=0)")
+
+    def test_diagnostics_include_warmup(self):
+        self.boot.run()
+        with patch.dict(os.environ, {"GOOGLE_API_KEY": fakes.FAKE_API_KEY}):
+            self.assertIn("Warmup assets: OK", app.run_diagnostics())
+
+if __name__ == '__main__':
+    unittest.main()
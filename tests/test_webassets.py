@@ -0,0 +1,93 @@
+import sys
+import os
+import hashlib
+import tempfile
+import unittest
+import gradio as gr
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import webassets
+import theme
+import app
+
+CSS = """
+/* Panel */
+.panel   >  .title :hover {
+    color: #0aff0a;
+    background: url('file=assets/ui_background.png');
+}
+"""
+
+class TestStylesheet(unittest.TestCase):
+    def setUp(self):
+        self.font_dir = tempfile.mkdtemp()
+
+    def test_minify_keeps_meaning(self):
+        self.assertEqual(webassets.minify_css(".a > .b :hover { color : red ; }"), ".a>.b :hover{color :red}")
+        self.assertEqual(webassets.minify_css("/* x */ .a { }"), ".a{}")
+
+    def test_references_become_hashed_local_urls(self):
+        sheet = webassets.Stylesheet(CSS, font_dir=self.font_dir)
+        self.assertRegex(sheet.url, r"^/ui-assets/app\.[0-9a-f]{12}\.css$")
+        self.assertRegex(sheet.css, r"url\('/ui-assets/ui_background\.[0-9a-f]{12}\.png'\)")
+        self.assertIn("local('Share Tech Mono')", sheet.css)
+        self.assertNotIn("woff2", sheet.css) # Not built: system font or the monospace fallback
+        self.assertNotIn("preload", sheet.head())
+        self.assertNotEqual(sheet.url, webassets.Stylesheet(CSS + ".x{}", font_dir=self.font_dir).url)
+
+    def test_built_font_is_preloaded(self):
+        data = b"wOF2 fake font"
+        name = f"share-tech-mono.{hashlib.sha256(data).hexdigest()[:12]}.woff2"
+        with open(os.path.join(self.font_dir, name), "wb") as f:
+            f.write(data)
+        sheet = webassets.Stylesheet(CSS, font_dir=self.font_dir)
+        self.assertIn(f"url('/ui-assets/{name}') format('woff2')", sheet.css)
+        self.assertIn(f"<link rel='preload' href='/ui-assets/{name}'", sheet.head())
+
+    def test_shipped_font_is_served_with_its_license(self):
+        font = webassets.font_file()
+        self.assertIsNotNone(font)
+        self.assertTrue(os.path.exists(os.path.join(webassets.FONT_DIR, "OFL.txt")))
+        sheet = webassets.Stylesheet(CSS)
+        self.assertIn(f"/ui-assets/{os.path.basename(font)}", sheet.head()) # Name already carries its own hash
+
+    def test_served_with_immutable_caching(self):
+        sheet = webassets.Stylesheet(CSS, font_dir=self.font_dir)
+        client = TestClient(Starlette(routes=sheet.routes()))
+        response = client.get(sheet.url)
+        self.assertEqual(response.text, sheet.css)
+        self.assertIn("immutable", response.headers["cache-control"])
+        self.assertEqual(client.get(sheet.css.split("url('")[-1].split("'")[0]).status_code, 200)
+        self.assertEqual(client.get("/ui-assets/app.py").status_code, 404)
+
+    def test_no_render_blocking_third_party_requests(self):
+        self.assertNotIn("googleapis", app.APP_CSS)
+        fonts = theme.get_theme()._font + theme.get_theme()._font_mono
+        self.assertFalse(any(isinstance(f, gr.themes.GoogleFont) for f in fonts))
+        self.assertIn("stylesheet", app.server_options()["head"])
+
+    def test_subset_keeps_the_ui_symbols(self):
+        glyphs = webassets.used_glyphs()
+        self.assertIn("█", glyphs) # Progress bar
+        self.assertIn("~", glyphs)
+
+class TestLowPowerMode(unittest.TestCase):
+    def test_scope_prefixes_every_selector(self):
+        self.assertEqual(webassets.scope_css(".a, .b > .c { color: red; }", "html.x"), "html.x .a,html.x .b>.c{color:red}")
+
+    def test_applies_for_reduced_motion_or_the_toggle(self):
+        css = app.low_power_css()
+        self.assertIn("html.low-power .glass-panel{backdrop-filter:none}", css)
+        self.assertIn("@media (prefers-reduced-motion: reduce) {html:not(.full-effects)", css)
+        self.assertIn("html:not(.full-effects) .access-denied{animation:none", css)
+        self.assertIn("--button-transition: none;", css)
+
+    def test_cheap_variant_keeps_the_background(self):
+        self.assertNotIn("file=assets", app.stylesheet.css) # Rewritten to the hashed URL like the main rule
+        self.assertEqual(app.stylesheet.css.count("/ui-assets/ui_background."), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,14 @@
 import gradio as gr
 
+# Theme variables swapped in by the low-power mode (see app.LOW_POWER_CSS): the same
+# look at rest, without animating every button state change.
+LOW_POWER_VARIABLES = {
+    "button_transition": "none",
+}
+
+def low_power_variables() -> str:
+    return " ".join(f"--{name.replace('_', '-')}: {value};" for name, value in LOW_POWER_VARIABLES.items())
+
 def get_theme():
     # Digital Noir / Cyberpunk Palette
     c_black = "#020202"  # Deepest black
@@ -18,7 +27,7 @@ def get_theme():
         primary_hue=gr.themes.colors.cyan,
         secondary_hue=gr.themes.colors.pink,
         neutral_hue=gr.themes.colors.gray,
-        font=[gr.themes.GoogleFont("Share Tech Mono"), "ui-monospace", "monospace"],
+        font=[gr.themes.Font("Share Tech Mono"), "ui-monospace", "monospace"], # Self-hosted, see webassets.py
     ).set(
         # Body & Backgrounds
         body_background_fill=c_black,
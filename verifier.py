@@ -1,24 +1,154 @@
 import os
+import json
+import time
+import hashlib
+import difflib
+import unicodedata
 from google import genai
 from google.genai import types
-from PIL import Image
+from PIL import Image, ImageStat
+import metrics
+import concurrency
+import state
 
 def get_client():
-    return genai.Client(api_key=os.environ.get("GOOGLE_API_KEY"))
+    return concurrency.client(os.environ.get("GOOGLE_API_KEY"))
+
+# --- Verification Cascade ---
+# Each check runs: optional local heuristic -> fast model -> strong model.
+# The fast model reports a confidence; only verdicts whose P(YES) falls inside the
+# ambiguous band are escalated, so clear-cut cases finish at the cheapest tier.
+FAST_MODEL = os.environ.get("VERIFIER_FAST_MODEL", "gemini-3-flash-preview")
+STRONG_MODEL = os.environ.get("VERIFIER_STRONG_MODEL", "gemini-3-pro-preview")
+AMBIGUOUS_BAND = (
+    float(os.environ.get("VERIFIER_BAND_LOW", "0.3")),
+    float(os.environ.get("VERIFIER_BAND_HIGH", "0.7")),
+)
+
+VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "verdict": {"type": "string", "enum": ["YES", "NO"]},
+        "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+    },
+    "required": ["verdict", "confidence"],
+}
+
+class Cascade:
+    """Tier configuration for one verifier function."""
+
+    def __init__(self, name, local=None, fast_model=None, strong_model=None, band=None):
+        self.name = name
+        self.local = local
+        self.fast_model = fast_model or FAST_MODEL
+        self.strong_model = strong_model # None disables escalation
+        self.band = band or AMBIGUOUS_BAND
+
+    def is_ambiguous(self, p_yes):
+        low, high = self.band
+        return low <= p_yes <= high
+
+def _blank_image(image: Image.Image):
+    """Local tier: a near-uniform frame cannot pass any content check."""
+    stat = ImageStat.Stat(image.convert("L").resize((64, 64)))
+    if stat.stddev[0] < 2:
+        return False, "LOCAL: Image is blank."
+    return None
+
+def _flat_lighting(image: Image.Image):
+    """Local tier: very low luminance contrast is never 'dramatic' lighting."""
+    stat = ImageStat.Stat(image.convert("L").resize((128, 128)))
+    if stat.stddev[0] < 20:
+        return False, f"LOCAL: Luminance contrast too low ({stat.stddev[0]:.1f})."
+    return None
+
+CASCADES = {
+    "hero": Cascade("hero", local=_blank_image, strong_model=STRONG_MODEL),
+    "sign_text": Cascade("sign_text", local=_blank_image, strong_model=STRONG_MODEL),
+    "lighting": Cascade("lighting", local=_flat_lighting, strong_model=STRONG_MODEL),
+    "style": Cascade("style", local=_blank_image, strong_model=STRONG_MODEL),
+    "final": Cascade("final", local=_blank_image, strong_model=STRONG_MODEL),
+}
+
+def _parse_verdict(text):
+    """Returns (verdict, p_yes). Plain YES/NO answers count as fully confident."""
+    try:
+        data = json.loads(text)
+        verdict = str(data["verdict"]).strip().upper() == "YES"
+        confidence = min(1.0, max(0.0, float(data["confidence"])))
+        return verdict, confidence if verdict else 1.0 - confidence
+    except (ValueError, KeyError, TypeError):
+        verdict = "YES" in text.upper()
+        return verdict, 1.0 if verdict else 0.0
+
+def _ask_model(client, model, image, prompt):
+    response = client.models.generate_content(
+        model=model,
+        contents=["Answer strictly YES or NO, with your confidence in that answer. " + prompt, image],
+        config=types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_json_schema=VERDICT_SCHEMA,
+        ),
+    )
+    text = (response.text or "").strip()
+    verdict, p_yes = _parse_verdict(text)
+    return verdict, p_yes, text.upper()
+
+def _timed(cascade, tier, fn):
+    start = time.perf_counter()
+    try:
+        return fn()
+    finally:
+        metrics.observe("verifier_tier_latency_seconds", time.perf_counter() - start, check=cascade.name, tier=tier)
+
+def verify_image_content(image: Image.Image, prompt: str, cascade: Cascade = None) -> tuple[bool, str]:
+    """Helper to verify image content through the tiered cascade (local -> fast -> strong)."""
+    cascade = cascade or Cascade("adhoc")
+
+    if cascade.local is not None:
+        local = _timed(cascade, "local", lambda: cascade.local(image))
+        if local is not None:
+            metrics.inc("verifier_decided_total", check=cascade.name, tier="local")
+            return local
 
-def verify_image_content(image: Image.Image, prompt: str) -> tuple[bool, str]:
-    """Helper to verify image content using Gemini 3 Flash."""
     client = get_client()
     try:
-        response = client.models.generate_content(
-            model='gemini-3-flash-preview',
-            contents=["Answer strictly YES or NO. " + prompt, image]
-        )
-        text = response.text.strip().upper()
-        return "YES" in text, text
+        verdict, p_yes, text = _timed(cascade, "fast", lambda: _ask_model(client, cascade.fast_model, image, prompt))
     except Exception as e:
         return False, f"System Error: {e}"
 
+    if cascade.strong_model and cascade.is_ambiguous(p_yes):
+        try:
+            strong, _, strong_text = _timed(
+                cascade, "strong", lambda: _ask_model(client, cascade.strong_model, image, prompt)
+            )
+        except Exception:
+            pass # Keep the fast verdict if escalation fails
+        else:
+            metrics.inc("verifier_escalations_total", check=cascade.name)
+            metrics.inc("verifier_escalation_agreements_total", 1 if strong == verdict else 0, check=cascade.name)
+            metrics.inc("verifier_decided_total", check=cascade.name, tier="strong")
+            return strong, strong_text
+
+    metrics.inc("verifier_decided_total", check=cascade.name, tier="fast")
+    return verdict, text
+
+def cascade_stats() -> dict:
+    """Per-check tier latency, decision counts and fast/strong agreement rate."""
+    stats = {}
+    for name in CASCADES:
+        escalations = metrics.registry.counter("verifier_escalations_total", check=name)
+        agreements = metrics.registry.counter("verifier_escalation_agreements_total", check=name)
+        stats[name] = {
+            "decided": {
+                tier: metrics.registry.counter("verifier_decided_total", check=name, tier=tier)
+                for tier in ("local", "fast", "strong")
+            },
+            "escalations": escalations,
+            "agreement_rate": agreements / escalations if escalations else None,
+        }
+    return stats
+
 # --- Chapter 1: Hero Verification ---
 def verify_hero(image: Image.Image) -> tuple[bool, str]:
     """Verifies if the image matches 'Unit 9' (Cyberpunk Cat)."""
@@ -35,25 +165,138 @@ def verify_hero(image: Image.Image) -> tuple[bool, str]:
         "4. It MUST NOT look like the 'Pink Panther' cartoon character (pink skin/fur without grit). "
         "Is this a valid Unit 9?"
     )
-    success, text = verify_image_content(image, prompt)
+    success, text = verify_image_content(image, prompt, CASCADES["hero"])
     if success:
         return True, "Identity Confirmed: Unit 9 is online."
     return False, "Subject Mismatch. We need a GRITTY CYBERPUNK CAT. Ensure keywords like 'Cyberpunk', 'Trenchcoat', 'Neon', 'Rain' are present. Avoid generic cartoons."
 
 # --- Chapter 2: Sign Verification ---
+# The model is asked once per image to transcribe all visible text. The transcription is
+# cached by image digest and compared with the expected text locally, so re-checking
+# the same render against other text costs no model call, and a near miss
+# ("THE TERMlNAL") can tell the learner which characters differ.
+SIGN_MATCH_THRESHOLD = float(os.environ.get("SIGN_MATCH_THRESHOLD", "0.95")) # 1 - normalized edit distance
+TRANSCRIPTION_TTL = float(os.environ.get("TRANSCRIPTION_TTL", str(24 * 3600)))
+TRANSCRIPTION_SCHEMA = {
+    "type": "object",
+    "properties": {"texts": {"type": "array", "items": {"type": "string"}}},
+    "required": ["texts"],
+}
+
+def normalize_text(text: str) -> str:
+    """Case, accents, punctuation and spacing do not count: 'The  Terminal!' -> 'THE TERMINAL'."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).upper()
+    return " ".join("".join(ch if ch.isalnum() else " " for ch in text).split())
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance (insertions, deletions and substitutions each cost 1)."""
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+def text_similarity(read: str, expected: str) -> float:
+    read, expected = normalize_text(read), normalize_text(expected)
+    if not read and not expected:
+        return 1.0
+    return 1.0 - edit_distance(read, expected) / max(len(read), len(expected))
+
+def _differences(read: str, expected: str, limit: int = 3) -> list[str]:
+    read, expected = normalize_text(read), normalize_text(expected)
+    notes = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, read, expected, autojunk=False).get_opcodes():
+        if tag == "replace":
+            notes.append(f"'{read[i1:i2]}' should be '{expected[j1:j2]}'")
+        elif tag == "delete":
+            notes.append(f"extra '{read[i1:i2]}'")
+        elif tag == "insert":
+            notes.append(f"missing '{expected[j1:j2]}'")
+    return notes[:limit]
+
+def _transcription_key(image: Image.Image) -> str:
+    digest = hashlib.sha256(image.tobytes())
+    digest.update(json.dumps([image.mode, image.size]).encode())
+    return "transcript:" + digest.hexdigest()
+
+def transcribe(image: Image.Image, cascade: Cascade = None) -> list[str]:
+    """Every piece of visible text in the image, read once per distinct image."""
+    cascade = cascade or CASCADES["sign_text"]
+    key = _transcription_key(image)
+    cached = state.get_json(key) if TRANSCRIPTION_TTL > 0 else None
+    metrics.inc("transcription_cache_total", result="hit" if cached is not None else "miss")
+    if cached is not None:
+        return cached
+
+    def ask():
+        response = get_client().models.generate_content(
+            model=cascade.fast_model,
+            contents=[
+                "Transcribe every piece of visible text in this image (signs, labels, graffiti), "
+                "exactly as written, one entry per separate line or sign. Do not correct spelling. "
+                "Return an empty list if there is no legible text.",
+                image,
+            ],
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_json_schema=TRANSCRIPTION_SCHEMA,
+            ),
+        )
+        texts = json.loads(response.text or "{}").get("texts") or []
+        return [str(t) for t in texts if str(t).strip()]
+
+    texts = _timed(cascade, "fast", ask)
+    if TRANSCRIPTION_TTL > 0:
+        state.set_json(key, texts, TRANSCRIPTION_TTL)
+    return texts
+
+def match_text(texts: list[str], expected_text: str, threshold: float = None) -> tuple[bool, float, str]:
+    """(matched, similarity, closest reading) over single entries and runs of consecutive entries.
+
+    Runs cover a sign read back as separate lines: ["OPEN 24H", "THE", "TERMINAL"].
+    """
+    threshold = SIGN_MATCH_THRESHOLD if threshold is None else threshold
+    texts = texts[:20] # Runs grow quadratically; a sign is never this long
+    candidates = [" ".join(texts[i:j]) for i in range(len(texts)) for j in range(i + 1, len(texts) + 1)]
+    if not candidates:
+        return False, 0.0, ""
+    best = max(candidates, key=lambda t: text_similarity(t, expected_text))
+    score = text_similarity(best, expected_text)
+    return score >= threshold, score, best
+
 def verify_sign_text(image: Image.Image, expected_text: str = "THE TERMINAL") -> tuple[bool, str]:
     """Verifies if the neon sign is legible."""
     if image is None: return False, "No image generated."
-    
-    prompt = (
-        f"Look at the text in the image. Does it CLEARLY read '{expected_text}'? "
-        "The text must be purely '{expected_text}' (case insensitive) and highly legible on a NEON SIGN or similar display. "
-        "If the text is gibberish, misspelled, or missing, answer NO."
+    cascade = CASCADES["sign_text"]
+    lettered = getattr(image, "info", {}).get("lettering")
+    if lettered is not None:
+        # Lettered locally: the text was drawn, not guessed, so there is nothing to read back
+        texts, source = [lettered], " (local lettering)"
+    else:
+        local = _timed(cascade, "local", lambda: cascade.local(image))
+        if local is not None:
+            metrics.inc("verifier_decided_total", check=cascade.name, tier="local")
+            return local
+        try:
+            texts, source = transcribe(image, cascade), ""
+        except Exception as e:
+            return False, f"System Error: {e}"
+        metrics.inc("verifier_decided_total", check=cascade.name, tier="fast")
+
+    matched, score, closest = match_text(texts, expected_text)
+    if matched:
+        return True, f"Text Verified: '{expected_text}' is lit{source}."
+    if not closest:
+        return False, f"Text Illegible. Ensure the prompt asks for a 'Neon Sign' that 'Reads {expected_text}'."
+    hint = "; ".join(_differences(closest, expected_text)) if score >= 0.75 else "" # Only a near miss has useful hints
+    return False, (
+        f"Text Mismatch. The sign reads '{closest}' ({score:.0%} match to '{expected_text}')."
+        + (f" Fix: {hint}." if hint else "")
+        + f" Spell it out in the prompt: a 'Neon Sign' that 'Reads {expected_text}'."
     )
-    success, text = verify_image_content(image, prompt)
-    if success:
-        return True, f"Text Verified: '{expected_text}' is lit."
-    return False, f"Text Illegible. Ensure the prompt asks for a 'Neon Sign' that 'Reads {expected_text}'."
 
 # --- Chapter 3: Aspect Ratio Verification ---
 def verify_aspect_ratio(image: Image.Image, target_ratio: str = "16:9") -> tuple[bool, str]:
@@ -68,7 +311,7 @@ def verify_aspect_ratio(image: Image.Image, target_ratio: str = "16:9") -> tuple
     if abs(ratio - target) < 0.2:
         return True, "Wide Angle Lens Confirmed (16:9)."
     
-    return False, f"Aspect Ratio Mismatch. Current: {ratio:.2f}. Target: 1.77 (16:9). Did you append 'Aspect Ratio 16:9'?"
+    return False, f"Aspect Ratio Mismatch. Current: {ratio:.2f}. Target: 1.77 (16:9). Did you set aspect_ratio='16:9' in the ImageConfig?"
 
 # --- Chapter 4: Lighting Verification ---
 def verify_lighting(image: Image.Image) -> tuple[bool, str]:
@@ -80,7 +323,7 @@ def verify_lighting(image: Image.Image) -> tuple[bool, str]:
         "It MUST have clear evidence of 'Chiaroscuro', 'Volumetric Lighting', 'God Rays', or strong contrast between light and shadow. "
         "It should NOT be flatly lit. Is the lighting dramatic and atmospheric?"
     )
-    success, text = verify_image_content(image, prompt)
+    success, text = verify_image_content(image, prompt, CASCADES["lighting"])
     if success:
         return True, "Atmosphere Stabilized. Lighting is cinematic."
     return False, "Scene is flat. Add terms like 'Volumetric Lighting', 'Chiaroscuro', or 'Neon Glow'."
@@ -95,7 +338,7 @@ def verify_style(image: Image.Image) -> tuple[bool, str]:
         "It should NOT look photorealistic. It should look hand-drawn or cel-shaded. "
         "Is the style clearly 'Anime' or 'Vintage Animation'?"
     )
-    success, text = verify_image_content(image, prompt)
+    success, text = verify_image_content(image, prompt, CASCADES["style"])
     if success:
         return True, "Style Transfer Complete. Metric: 1980s Anime."
     return False, "Style Mismatch. Ensure you are requesting '1980s Anime Style' or 'Cel Shaded'."
@@ -110,7 +353,7 @@ def verify_final(image: Image.Image) -> tuple[bool, str]:
         "It should be sharp, detailed, and free of obvious 'rough draft' artifacts. "
         "Does it look like a final, polished 8K render?"
     )
-    success, text = verify_image_content(image, prompt)
+    success, text = verify_image_content(image, prompt, CASCADES["final"])
     if success:
         return True, "Resolution: 8K. Detail: Maximum. Masterpiece Created."
     return False, "Quality Low. Enhance! Use keywords: 'Masterpiece', 'High Resolution', '8k', 'Highly Detailed'."
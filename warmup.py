@@ -0,0 +1,206 @@
+import os
+import time
+import logging
+import threading
+from typing import Optional
+from PIL import Image
+from google.genai import types
+import concurrency
+import verifier
+import refine
+import lettering
+import logs
+
+# Boot-time warmup. The first click otherwise pays for client construction, the TLS
+# handshake, SDK model-class validation and cold asset reads. start() runs these in the
+# background:
+#
+#   sdk     build the request types once (pydantic compiles its validators lazily)
+#   assets  read the UI assets into memory and register Pillow's codecs
+#   models  open the shared client's connection and confirm each model exists
+#
+# /healthz answers as soon as the process serves HTTP; /readyz only once every check
+# has passed, so a load balancer routes learners to warm instances only. A failed check
+# is retried with capped backoff, so an instance that booted during an outage (or with
+# a cold DNS cache) becomes ready on its own instead of answering 503 until restarted.
+# Models only the optional features use (refine, locator) don't block readiness: if
+# one is missing the instance is "degraded" and those features fail on their own.
+
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.join(BASE_DIR, "assets")
+IMAGE_MODEL = os.environ.get("IMAGE_MODEL", "gemini-3-pro-image-preview")
+WARMUP_TIMEOUT = float(os.environ.get("WARMUP_TIMEOUT", "30")) # Budget for all model lookups together
+# "0" skips the model lookups (offline development); the instance is then ready without them
+WARMUP_CHECK_MODELS = os.environ.get("WARMUP_CHECK_MODELS", "1") == "1"
+WARMUP_RETRY_INITIAL = float(os.environ.get("WARMUP_RETRY_INITIAL", "5")) # Seconds before the first retry; "0" disables retries
+WARMUP_RETRY_MAX = float(os.environ.get("WARMUP_RETRY_MAX", "300")) # The retry delay doubles up to this
+
+PENDING, RUNNING, READY, DEGRADED, FAILED = "pending", "running", "ready", "degraded", "failed"
+
+
+def required_models() -> list[str]:
+    """The models every chapter needs (generation and verification), deduplicated in call order."""
+    models = [IMAGE_MODEL, verifier.FAST_MODEL, verifier.STRONG_MODEL]
+    return list(dict.fromkeys(m for m in models if m))
+
+
+def optional_models() -> list[str]:
+    """Models only the optional features reach (refine, lettering locator)."""
+    required = set(required_models())
+    models = [refine.REFINE_MODEL, lettering.LOCATOR_MODEL]
+    return list(dict.fromkeys(m for m in models if m and m not in required))
+
+
+class Warmup:
+    """Runs the boot checks, retries the failed ones and reports readiness."""
+
+    def __init__(self, assets_dir: str = ASSETS_DIR, check_models: bool = None, client_factory=None):
+        self.assets_dir = assets_dir
+        self.check_models = WARMUP_CHECK_MODELS if check_models is None else check_models
+        self.client_factory = client_factory or (lambda: verifier.get_client() if os.environ.get("GOOGLE_API_KEY") else None)
+        self.status = PENDING
+        self.checks = {}
+        self.degraded = [] # Optional models the last lookup couldn't reach
+        self.attempts = 0
+        self.assets = {} # File name -> bytes, kept for the life of the process
+        self.started = time.time()
+        self.finished = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._passed = threading.Event() # Set once the first pass has finished
+
+    @property
+    def ready(self) -> bool:
+        return self.status in (READY, DEGRADED)
+
+    def start(self):
+        """Runs warmup on a daemon thread (once); returns immediately."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run_until_healthy, name="warmup", daemon=True)
+                self._thread.start()
+        return self
+
+    def wait(self, timeout: float = None) -> bool:
+        """Waits for the first pass (not the retries) and returns readiness."""
+        if self._thread is not None:
+            self._passed.wait(timeout)
+        return self.ready
+
+    def _run_until_healthy(self):
+        self.run()
+        delay = WARMUP_RETRY_INITIAL
+        while self.status != READY and delay > 0:
+            time.sleep(delay)
+            self.run(retry=True)
+            delay = min(delay * 2, WARMUP_RETRY_MAX)
+
+    def run(self, retry: bool = False):
+        """One pass over the checks; a retry re-runs only the failed or degraded ones."""
+        steps = (("sdk", self._warm_sdk), ("assets", self._load_assets), ("models", self._resolve_models))
+        if retry:
+            steps = [(name, step) for name, step in steps
+                     if not self.checks.get(name, {}).get("ok") or (name == "models" and self.degraded)]
+        else:
+            self.status = RUNNING # A retry keeps the current status so readyz doesn't flap
+        self.attempts += 1
+        for name, step in steps:
+            start = time.perf_counter()
+            try:
+                ok, detail = step()
+            except Exception as e:
+                ok, detail = False, f"{type(e).__name__}: {e}"
+            self.checks[name] = {"ok": ok, "detail": detail, "seconds": round(time.perf_counter() - start, 3)}
+        self.finished = time.time()
+        if not all(c["ok"] for c in self.checks.values()):
+            self.status = FAILED
+        else:
+            self.status = DEGRADED if self.degraded else READY
+        self._passed.set()
+        logs.event(log, "warmup", logging.INFO if self.status == READY else logging.WARNING, outcome=self.status,
+                   latency=round(self.finished - self.started, 3), attempt=self.attempts,
+                   checks={name: "ok" if c["ok"] else c["detail"] for name, c in self.checks.items()})
+        return self.ready
+
+    def _warm_sdk(self):
+        types.GenerateContentConfig(
+            response_modalities=["IMAGE"],
+            image_config=types.ImageConfig(aspect_ratio="16:9"),
+            http_options=types.HttpOptions(timeout=1000),
+        )
+        types.GenerateContentConfig(response_mime_type="application/json", response_json_schema=verifier.VERDICT_SCHEMA)
+        types.Part.from_bytes(data=b"\x89PNG", mime_type="image/png")
+        return True, "request types built"
+
+    def _load_assets(self):
+        Image.init() # Registers every codec up front instead of on the first unknown format
+        total = 0
+        for name in sorted(os.listdir(self.assets_dir)):
+            path = os.path.join(self.assets_dir, name)
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    self.assets[name] = f.read()
+                total += len(self.assets[name])
+        return True, f"{len(self.assets)} files, {total // 1024} KB"
+
+    def _resolve_models(self):
+        self.degraded = []
+        if not self.check_models:
+            return True, "skipped (WARMUP_CHECK_MODELS=0)"
+        client = self.client_factory()
+        if client is None:
+            return False, "GOOGLE_API_KEY missing"
+        missing, optional = [], set(optional_models())
+        deadline = concurrency.Deadline(WARMUP_TIMEOUT)
+        for model in required_models() + optional_models():
+            timeout = types.HttpOptions(timeout=max(1, int(deadline.remaining() * 1000)))
+            try:
+                # The first lookup also opens the pooled connection every later call reuses
+                client.models.get(model=model, config=types.GetModelConfig(http_options=timeout))
+            except Exception as e:
+                (self.degraded if model in optional else missing).append(f"{model} ({e})")
+        if missing:
+            return False, "unavailable: " + "; ".join(missing + self.degraded)
+        if self.degraded:
+            return True, "degraded, optional features unavailable: " + "; ".join(self.degraded)
+        return True, f"{len(required_models()) + len(optional_models())} models available"
+
+    def report(self) -> dict:
+        return {
+            "status": self.status,
+            "uptime": round(time.time() - self.started, 1),
+            "warmup_seconds": round(self.finished - self.started, 3) if self.finished else None,
+            "attempts": self.attempts,
+            "checks": self.checks,
+        }
+
+
+boot = Warmup()
+
+
+def start() -> Warmup:
+    return boot.start()
+
+
+def routes():
+    """Liveness and readiness probes (added to the app at launch)."""
+    from starlette.routing import Route
+    from starlette.responses import JSONResponse
+
+    async def healthz(request):
+        return JSONResponse({"status": "alive", "uptime": round(time.time() - boot.started, 1)})
+
+    async def readyz(request):
+        return JSONResponse(boot.report(), status_code=200 if boot.ready else 503)
+
+    return [Route("/healthz", healthz), Route("/readyz", readyz)]
+
+
+def summary() -> Optional[str]:
+    """One line per check for the in-app diagnostics, or None before warmup has finished."""
+    if boot.finished is None:
+        return None
+    return "\n".join(f"> Warmup {name}: {'OK' if c['ok'] else 'FAILED'} ({c['detail']})" for name, c in boot.checks.items())
@@ -0,0 +1,169 @@
+import os
+import re
+import sys
+import glob
+import hashlib
+import argparse
+from typing import Optional
+
+# Self-hosted UI styling. The page used to block its first render on fonts.googleapis.com
+# (and render unstyled text where venues have no internet). Instead:
+#
+#   - the font is a local WOFF2, subset to the glyphs the UI uses (build it once
+#     with `python webassets.py subset ShareTechMono-Regular.ttf`, see below)
+#   - APP_CSS is minified and served as /ui-assets/app.<hash>.css together with
+#     the @font-face rule and the background image
+#
+# Every URL carries a content hash, so responses are cached as immutable and a
+# change to the CSS, font or image is a new URL.
+
+# --- Configuration ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.join(BASE_DIR, "assets")
+FONT_DIR = os.path.join(ASSETS_DIR, "fonts")
+FONT_FAMILY = "Share Tech Mono"
+FONT_STEM = "share-tech-mono"
+ROUTE_PREFIX = "/ui-assets"
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Always kept when subsetting: everything a learner can type in English, plus the UI's own symbols
+BASE_GLYPHS = "".join(chr(c) for c in range(0x20, 0x7F)) + "█…→←✓✗•–—’“”"
+# Files scanned for further UI glyphs (e.g. the progress bar's █)
+GLYPH_SOURCES = ("app.py", "terminal.py", "theme.py", "history.py")
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def minify_css(css: str) -> str:
+    """Drops comments and insignificant whitespace (enough for hand-written CSS, not a full parser)."""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css) # Only after ':', so '.a :hover' keeps its meaning
+    css = css.replace(";}", "}")
+    return css.strip()
+
+
+def scope_css(css: str, scope: str) -> str:
+    """Prefixes every selector of flat (un-nested) rules: scope_css('.a, .b{x}', 'html.m') -> 'html.m .a,html.m .b{x}'."""
+    def prefix(match):
+        selectors = ",".join(f"{scope} {sel.strip()}" for sel in match.group(1).split(","))
+        return selectors + "{" + match.group(2) + "}"
+    return re.sub(r"([^{}]+)\{([^{}]*)\}", prefix, minify_css(css))
+
+
+def font_file(font_dir: str = FONT_DIR) -> Optional[str]:
+    """The newest built subset, if any."""
+    built = sorted(glob.glob(os.path.join(font_dir, f"{FONT_STEM}.*.woff2")), key=os.path.getmtime)
+    return built[-1] if built else None
+
+
+class Stylesheet:
+    """The app's CSS and the files it references, served from content-hashed URLs."""
+
+    def __init__(self, css: str, assets_dir: str = ASSETS_DIR, font_dir: str = FONT_DIR):
+        self.files = {} # URL name -> path on disk
+        css = re.sub(r"url\('file=assets/([^']+)'\)", lambda m: f"url('{self._asset(os.path.join(assets_dir, m.group(1)))}')", css)
+        font = font_file(font_dir)
+        # local() first: a machine that has the font installed downloads nothing
+        sources = [f"local('{FONT_FAMILY}')", f"local('{FONT_FAMILY.replace(' ', '')}-Regular')"]
+        if font:
+            sources.append(f"url('{self._asset(font)}') format('woff2')")
+        face = f"@font-face {{ font-family: '{FONT_FAMILY}'; src: {', '.join(sources)}; font-display: swap; }}"
+        self.css = minify_css(face + css)
+        self.font_url = f"{ROUTE_PREFIX}/{self._name(font)}" if font else None
+        self.url = f"{ROUTE_PREFIX}/app.{_digest(self.css.encode())}.css"
+
+    def _name(self, path):
+        with open(path, "rb") as f:
+            digest = _digest(f.read())
+        stem, ext = os.path.splitext(os.path.basename(path))
+        if stem.endswith(f".{digest}"): # Already hashed at build time (the font)
+            return os.path.basename(path)
+        return f"{stem}.{digest}{ext}"
+
+    def _asset(self, path):
+        name = self._name(path)
+        self.files[name] = path
+        return f"{ROUTE_PREFIX}/{name}"
+
+    def head(self) -> str:
+        """<head> tags: the stylesheet, and a preload so the font is fetched alongside it."""
+        tags = [f"<link rel='stylesheet' href='{self.url}'>"]
+        if self.font_url:
+            tags.insert(0, f"<link rel='preload' href='{self.font_url}' as='font' type='font/woff2' crossorigin>")
+        return "\n".join(tags)
+
+    def routes(self):
+        """Serves the stylesheet and its files with immutable caching (added to the app at launch)."""
+        from starlette.routing import Route
+        from starlette.responses import Response, FileResponse, PlainTextResponse
+
+        async def stylesheet(request):
+            return Response(self.css, media_type="text/css", headers={"Cache-Control": IMMUTABLE})
+
+        async def asset(request):
+            path = self.files.get(request.path_params["name"])
+            if path is None:
+                return PlainTextResponse("Not found.", status_code=404)
+            return FileResponse(path, headers={"Cache-Control": IMMUTABLE})
+
+        return [Route(self.url, stylesheet), Route(ROUTE_PREFIX + "/{name}", asset)]
+
+
+# --- Font build ---
+
+def used_glyphs(sources=GLYPH_SOURCES, base_dir: str = BASE_DIR) -> str:
+    glyphs = set(BASE_GLYPHS)
+    for name in sources:
+        with open(os.path.join(base_dir, name), encoding="utf-8") as f:
+            glyphs.update(ch for ch in f.read() if ord(ch) > 0x7F and ch.isprintable())
+    return "".join(sorted(glyphs))
+
+
+def subset_font(source: str, font_dir: str = FONT_DIR, text: str = None) -> str:
+    """Writes <font_dir>/share-tech-mono.<hash>.woff2 with only the UI's glyphs; returns its path.
+
+    Needs fontTools with WOFF2 support, which the app itself does not:
+        uv run --with "fonttools[woff]" python webassets.py subset ShareTechMono-Regular.ttf
+    """
+    from fontTools import subset
+
+    options = subset.Options()
+    options.flavor = "woff2"
+    options.layout_features = ["kern", "liga"]
+    font = subset.load_font(source, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(text=text or used_glyphs())
+    subsetter.subset(font)
+
+    os.makedirs(font_dir, exist_ok=True)
+    temporary = os.path.join(font_dir, f"{FONT_STEM}.woff2")
+    subset.save_font(font, temporary, options)
+    with open(temporary, "rb") as f:
+        path = os.path.join(font_dir, f"{FONT_STEM}.{_digest(f.read())}.woff2")
+    for old in glob.glob(os.path.join(font_dir, f"{FONT_STEM}.*.woff2")):
+        os.remove(old)
+    os.replace(temporary, path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Builds the self-hosted UI font.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    subset_parser = sub.add_parser("subset", help="Subset a TTF/OTF to the UI's glyphs as WOFF2")
+    subset_parser.add_argument("source", help=f"{FONT_FAMILY} TTF or OTF (SIL Open Font License)")
+    sub.add_parser("glyphs", help="Print the glyphs the subset keeps")
+    args = parser.parse_args(argv)
+
+    if args.command == "glyphs":
+        print(used_glyphs())
+    else:
+        path = subset_font(args.source)
+        print(f"Wrote {os.path.relpath(path, BASE_DIR)} ({os.path.getsize(path) // 1024} KB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())